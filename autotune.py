@@ -1,34 +1,135 @@
 # Warning: The execution of this file will automatically remove *.log, ctest-*.json,
 #          and all auto-generated [input_yaml]_[#iter_id].yaml files from this directory.
 #          Would potentially overwrite the original yaml file if the execution fails.
+#          The files of every finished trial are kept in autotune_runs/[run_id] (see --resume).
 
 # From Albany/tools - yaml read/write
 
 # Need: pip install --user pandas
 # Need: pip install --user ruamel.yaml
 # Need: pip install --user scikit-learn
+# Need: autotune_common.py in the same directory
 
 # Import libraries
 import argparse
+import atexit
+import copy
+import fcntl
 import getopt
 import glob
+import hashlib
 import json
 import numpy as np
 import os
 import pandas as pd
+import queue
 import random
+import re
+import shutil
+import signal
 import statistics
 import subprocess
 import sys
+import threading
+import time
+import types
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from math import exp, log
-from scipy.stats import expon, truncnorm, truncexpon
+from scipy.stats import expon, norm, spearmanr, truncnorm, truncexpon
+from scipy.stats import t as student_t
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import ConstantKernel, Matern, WhiteKernel
 from sklearn.model_selection import ParameterGrid, ParameterSampler
-from ruamel.yaml import YAML
+from autotune_common import BUILD_FIELDS, BUILD_REQUIRED, TEMPLATES, choose_trade_off, compile_objective, compile_template
+from autotune_common import get_build_key, get_factories, get_trial_key, hypervolume, objective_values, pareto_front
+from autotune_common import read_dataset_campaigns, render_template, template_shape, yaml
+from autotune_common import fail_probability, fit_feasibility, get_architecture, report_infeasible
+from autotune_common import LEDGER, TRACE, add_span, timed, trial_breakdown
 
-yaml = YAML(typ='rt')  # Round trip loading and dumping
-yaml.preserve_quotes = True
-yaml.width = 1000
+###############################################################################
+# Chrome trace of the session (--trace), see add_span in autotune_common.py
+@contextmanager
+def traced(name, category, args=None):
+    '''
+    A span of the Chrome trace that is not a ledger category, i.e. a round or a shell-out.
+    '''
+    start = time.time()
+    try:
+        yield
+    finally:
+        add_span(name, category, start, time.time() - start, args=args)
+
+@contextmanager
+def traced_trial(trial):
+    '''
+    A span of the Chrome trace for the part of a trial run by the calling thread; the
+    spans inside it are tagged with the trial's #iter id, round and parameters.
+    '''
+    if TRACE['file'] is None:
+        yield
+        return
+    previous = getattr(TRACE['local'], 'trial', None)
+    TRACE['local'].trial = {'iter': trial['iter'], 'round': trial['round'], 'params': flatten_params(trial['params'])}
+    try:
+        with traced('CASE ' + trial['iter'], 'trial'):
+            yield
+    finally:
+        TRACE['local'].trial = previous
+
+def write_trace():
+    '''
+    Write the Chrome trace (Trace Event Format, opened by chrome://tracing and
+    ui.perfetto.dev); registered at exit so an interrupted session keeps its trace.
+    '''
+    with LEDGER['lock']:
+        events = list(TRACE['events'])
+        threads = dict(TRACE['threads'])
+    names = [{'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'args': {'name': 'autotune.py'}}]
+    names = names + [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': name}}
+                     for tid, name in threads.items()]
+    with open(TRACE['file'], 'w') as f:
+        json.dump({'traceEvents': names + sorted(events, key=lambda event: event['ts']), 'displayTimeUnit': 'ms'},
+                  f, default=to_builtin)
+    print("TRACE: {0} spans in {1}".format(len(events), TRACE['file']))
+
+def report_ledger(filename, executor):
+    '''
+    Print where the wall time of the session went and write it to a json file.
+    Parameters:
+        filename(string): output ledger (.json)
+        executor(dictionary): trial executor with a results log
+    '''
+    wall = time.time() - LEDGER['start']
+    records = executor['results']['records']
+    run = [record['ledger'] for record in records if 'ctest' in record['ledger']]
+    skipped = sum(1 for record in records if record.get('skipped') is not None)
+    served = len(records) - len(run) - skipped
+    trial_totals = dict()
+    for breakdown in run:
+        for key, value in breakdown.items():
+            trial_totals[key] = trial_totals.get(key, 0) + value
+    print('###################### TUNING TIME LEDGER ######################')
+    print('SESSION WALL TIME: {0:.1f} s (jobs: {1})'.format(wall, executor['jobs']))
+    print('TUNER OVERHEAD: ' + ', '.join('{0} {1:.2f} s'.format(category, LEDGER['totals'].get(category, 0))
+                                         for category in ['yaml', 'json', 'cache', 'sandbox', 'search', 'mesh', 'pandas']))
+    if 'queue' in LEDGER['totals']:
+        print('SLURM QUEUE WAIT: {0:.1f} s (jobs: {1}, trials per job: {2})'.format(
+              LEDGER['totals']['queue'], executor['jobs'] // SLURM['pack'], SLURM['pack']))
+    print('TRIALS: {0} run, {1} served from the cache, {2} skipped as infeasible'.format(len(run), served, skipped))
+    parts = ['launch', 'setup', 'fill', 'solve', 'albany other']
+    total = max(trial_totals.get('ctest', 0), sum(trial_totals.get(key, 0) for key in parts))
+    for key, name in [('launch', 'ctest/MPI launch'), ('setup', 'Albany setup'), ('fill', 'Albany fill'),
+                      ('solve', 'solve (NOX)'), ('albany other', 'Albany other')]:
+        print('  {0:<20} {1:10.2f} s {2:6.1f} %'.format(name, trial_totals.get(key, 0),
+              100 * trial_totals.get(key, 0) / total if total else 0))
+    print('  {0:<20} {1:10.2f} s'.format('ctest wall total', trial_totals.get('ctest', 0)))
+    with open(filename, 'w') as f:
+        json.dump({'session': executor['results']['session'], 'wall': wall, 'jobs': executor['jobs'],
+                   'tuner': LEDGER['totals'], 'trials': trial_totals,
+                   'per_trial': {record['iter'] + ':' + str(record['round']): record['ledger'] for record in records}},
+                  f, indent=1)
 
 def read_yaml(filename):
     '''
@@ -38,7 +139,7 @@ def read_yaml(filename):
     Returns:
         dictionary(dictionary): dictionary from yaml
     '''
-    with open(filename) as file:
+    with timed('yaml', name='read_yaml'), open(filename) as file:
         dictionary = yaml.load(file)
     return dictionary
 
@@ -54,42 +155,1196 @@ def write_yaml(dictionary, filename):
         file.write('...\n')
 
 ###############################################################################
-def run_bash(command):
+
+def write_trial_yaml(inputDict, filenames):
+    '''
+    Write the patched input to each of the given files, from the compiled template
+    of its shape (compiled on first use), or with write_yaml if it has none.
+    Parameters:
+        inputDict(dictionary): the patched input yaml dictionary
+        filenames(list): output yaml filenames
+    '''
+    with timed('yaml', name='write_trial_yaml'):
+        shape = template_shape(get_factories(inputDict))
+        if shape not in TEMPLATES or TEMPLATES[shape]['root'] is not inputDict:
+            TEMPLATES[shape] = compile_template(inputDict)
+        text = render_template(TEMPLATES[shape], inputDict)
+        for filename in filenames:
+            if text is None:
+                write_yaml(inputDict, filename)
+            else:
+                with open(filename, 'w') as file:
+                    file.write(text)
+
+###############################################################################
+def run_bash(command, cwd=None, env=None):
     '''
     Run a bash command.
+    Parameters:
+        command(string): the command line to run
+        cwd(string): directory to run the command in (default: current directory)
+        env(dictionary): environment for the command (default: inherited)
+    '''
+    with traced('run_bash', 'bash', {'command': command}):
+        return subprocess.run(command, shell=True, executable='/bin/bash', cwd=cwd, env=env)
+
+###############################################################################
+# Populated mesh, set up once per session by populate_mesh
+MESH_DIR = 'mesh-pop-wdg'
+MESH = {'cache': None, 'ready': False} # cache: shared mesh cache directory (--mesh-cache)
+
+def get_pop_commands(cmake='CTestTestfile.cmake'):
+    '''
+    Return the command lines of the tests labelled "pop" (mesh population stage).
+    Parameters:
+        cmake(string): ctest file of the build directory
+    Returns:
+        commands(list): list(argument) of each population test
+    '''
+    tests = dict()
+    labels = dict()
+    with open(cmake) as f:
+        for line in f:
+            match = re.match(r'\s*add_test\((\S+) (.*)\)\s*$', line)
+            if match:
+                tests[match.group(1)] = re.findall(r'"([^"]*)"', match.group(2))
+            match = re.match(r'\s*set_tests_properties\((\S+) PROPERTIES.*LABELS "([^"]*)"', line)
+            if match:
+                labels[match.group(1)] = match.group(2).split(';')
+    return [tests[name] for name in tests if 'pop' in labels.get(name, list())]
+
+def hash_file(sha, filename):
+    '''
+    Add a file to a hash: its content, or its size and mtime if it is large (executables).
+    '''
+    sha.update(filename.encode())
+    if os.path.getsize(filename) > (16 << 20):
+        sha.update('{0}:{1}'.format(os.path.getsize(filename), os.path.getmtime(filename)).encode())
+        return
+    with open(filename, 'rb') as f:
+        sha.update(f.read())
+
+def get_mesh_key():
+    '''
+    Hash the sources of the populated mesh: the population command lines, the files
+    they name (input yaml, Albany executable as build id) and the existing files
+    named in that yaml (source meshes), except the populated mesh itself.
+    Returns:
+        key(string): hex digest identifying the populated mesh
+    '''
+    sha = hashlib.sha256()
+    for command in get_pop_commands():
+        sha.update(json.dumps(command).encode())
+        for arg in command:
+            if not os.path.isfile(arg):
+                continue
+            hash_file(sha, arg)
+            if arg.endswith('.yaml'):
+                with open(arg) as f:
+                    for name in sorted(set(re.findall(r'[\w./-]+', f.read()))):
+                        if os.path.isfile(name) and not name.startswith(MESH_DIR):
+                            hash_file(sha, name)
+    return sha.hexdigest()
+
+def get_manifest(path):
+    '''
+    Return {relative path: size} of every file under a directory.
+    '''
+    manifest = dict()
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            filename = os.path.join(root, name)
+            manifest[os.path.relpath(filename, path)] = os.path.getsize(filename)
+    return manifest
+
+def check_mesh(path, manifest_file, key):
+    '''
+    Check that a populated mesh is complete and was built from the current sources.
+    Parameters:
+        path(string): populated mesh directory
+        manifest_file(string): manifest written when the mesh was populated
+        key(string): current mesh key from get_mesh_key
+    Returns:
+        valid(boolean)
+    '''
+    if not os.path.isdir(path) or not os.path.isfile(manifest_file):
+        return False
+    with open(manifest_file) as f:
+        manifest = json.load(f)
+    return manifest.get('key') == key and manifest.get('files') == get_manifest(path)
+
+def remove_path(path):
+    '''
+    Remove a file, a link or a (possibly read-only) directory.
+    '''
+    if os.path.islink(path) or os.path.isfile(path):
+        os.remove(path)
+    elif os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            os.chmod(root, 0o755)
+        shutil.rmtree(path)
+
+def run_pop(key, manifest_file):
+    '''
+    Run the mesh population stage in the build directory and write its manifest.
+    Returns:
+        populated(boolean)
+    '''
+    remove_path(MESH_DIR)
+    run_bash('ctest -L "pop"')
+    if not os.path.isdir(MESH_DIR):
+        print('Mesh population failed: {} not found'.format(MESH_DIR))
+        return False
+    with open(manifest_file, 'w') as f:
+        json.dump({'key': key, 'files': get_manifest(MESH_DIR)}, f, indent=1)
+    return True
+
+def populate_mesh():
+    '''
+    Set up the populated mesh once per session. It is rebuilt if it is incomplete or
+    its sources changed (see get_mesh_key). With a shared mesh cache, each mesh is
+    populated once per key into a read-only cache entry, under a lock so concurrent
+    sessions wait for it, and linked into the build directory (and so into sandboxes).
+    '''
+    if MESH['ready']:
+        return
+    key = get_mesh_key()
+    if MESH['cache'] is None:
+        if check_mesh(MESH_DIR, MESH_DIR + '.manifest', key):
+            print('Populated mesh already exists!')
+        elif not run_pop(key, MESH_DIR + '.manifest'):
+            return
+        MESH['ready'] = True
+        return
+    entry = os.path.join(MESH['cache'], key)
+    os.makedirs(MESH['cache'], exist_ok=True)
+    with open(entry + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if check_mesh(os.path.join(entry, MESH_DIR), os.path.join(entry, 'manifest.json'), key):
+            print('Populated mesh found in the mesh cache: {}'.format(entry))
+        else:
+            if not run_pop(key, MESH_DIR + '.manifest'):
+                return
+            remove_path(entry)
+            remove_path(entry + '.tmp')
+            shutil.copytree(MESH_DIR, os.path.join(entry + '.tmp', MESH_DIR), symlinks=True)
+            shutil.move(MESH_DIR + '.manifest', os.path.join(entry + '.tmp', 'manifest.json'))
+            for root, dirs, files in os.walk(entry + '.tmp', topdown=False):
+                for name in files:
+                    os.chmod(os.path.join(root, name), 0o444)
+                os.chmod(root, 0o555)
+            os.replace(entry + '.tmp', entry)
+            print('Populated mesh stored in the mesh cache: {}'.format(entry))
+    remove_path(MESH_DIR)
+    os.symlink(os.path.join(os.path.abspath(entry), MESH_DIR), MESH_DIR)
+    MESH['ready'] = True
+
+# Trial watchdog: timeout cap of ctest (--timeout), multiple of the incumbent's wall
+# time (--timeout-factor, None: fixed timeout) and seconds between two looks at the live log
+WATCHDOG = {'timeout': 90, 'factor': None, 'poll': 1.0}
+
+def ctest_command():
+    '''
+    The ctest command line of a trial; with the watchdog the output is verbose so the
+    test output reaches ctest.out while the test runs.
+    '''
+    command = 'ctest -L "tune-gpu" --timeout ' + str(WATCHDOG['timeout'])
+    return command + ' -V' if WATCHDOG['factor'] else command
+
+def live_objective(filename):
+    '''
+    The primary objective of the timers already printed to the live output of a running
+    trial, the missing ones counted as 0; 0 if none yet, or if the objective can decrease
+    as a timer grows (i.e. a ratio), so its partial value is no lower bound.
+    Parameters:
+        filename(string): live output of ctest -V
+    Returns:
+        partial(float): seconds accumulated so far (a lower bound of the objective)
+    '''
+    objective = PRIMARY['objective']
+    if not os.path.isfile(filename) or not objective['monotone']:
+        return 0.0
+    latest = dict()
+    with open(filename, errors='replace') as f:
+        for line in f:
+            row = TIMER_ROW.match(re.sub(r'^\d+: ', '', line.rstrip('\n')))
+            if row:
+                latest[row.group(1)] = float(TIMER_VALUE.findall(row.group(2))[0][0])
+    if not latest:
+        return 0.0
+    timers = {timer: latest.get(timer, 0.0) for timer, _ in objective['columns']}
+    partial = objective_values(objective, [{'passed': True, 'timers': timers}])[0]
+    return float(partial) if np.isfinite(partial) else 0.0
+
+def watchdog_best(executor):
+    '''
+    The best trial so far, that the watchdog compares running trials with.
+    Parameters:
+        executor(dictionary): trial executor with a results log, or None
+    Returns:
+        best(dictionary): results log record, None if the watchdog is off or has no measured trial yet
     '''
-    return subprocess.run(command, shell=True, executable='/bin/bash')
+    results = executor.get('results') if executor else None
+    best = results['best'] if results else None
+    if not WATCHDOG['factor'] or best is None or not np.isfinite(best['time']) or 'ctest' not in best['ledger']:
+        return None
+    return best
 
-def run_sim(iter, inFile):
+def watchdog_verdict(best, elapsed, output):
+    '''
+    Decide whether a running trial is killed: once it runs longer than --timeout-factor
+    times the wall time of the best trial so far, or once the objective timers in its
+    live output pass the best time.
+    Parameters:
+        best(dictionary): the best trial so far, see watchdog_best
+        elapsed(float): seconds the trial has been running
+        output(string): live output of the trial (ctest.out)
+    Returns:
+        censored(dictionary): {'time':lower bound of the objective, 'reason', 'elapsed'} if
+                              the trial is to be killed, None to let it run
+    '''
+    limit = min(WATCHDOG['factor'] * best['ledger']['ctest'], WATCHDOG['timeout'])
+    overhead = max(best['ledger']['ctest'] - best['time'], 0) # setup, fill and launch of the incumbent
+    partial = live_objective(output)
+    if elapsed > limit:
+        reason = 'ran {0:.0f} s > {1:.1f} x the best trial'.format(elapsed, WATCHDOG['factor'])
+    elif partial > best['time']:
+        reason = 'objective {0:.2f} s > best {1:.2f} s'.format(partial, best['time'])
+    else:
+        return None
+    # what is known of the objective: at least the timers printed so far and,
+    # if the setup took as long as the incumbent's, the rest of the elapsed time
+    return {'time': max(partial, elapsed - overhead, best['time']), 'reason': reason, 'elapsed': elapsed}
+
+def run_watched(command, executor=None, cwd=None, env=None):
+    '''
+    Run a trial's ctest command under the watchdog, see watchdog_verdict.
+    Parameters:
+        command(string): the command line, its output redirected to ctest.out
+        executor(dictionary): trial executor with a results log, or None
+        cwd(string): directory to run the command in (default: current directory)
+        env(dictionary): environment for the command (default: inherited)
+    Returns:
+        censored(dictionary): see watchdog_verdict, None if the trial ran to the end
+    '''
+    best = watchdog_best(executor)
+    if best is None:
+        run_bash(command, cwd=cwd, env=env)
+        return None
+    output = os.path.join(cwd or '.', 'ctest.out')
+    start = time.time()
+    process = subprocess.Popen(command, shell=True, executable='/bin/bash', cwd=cwd, env=env, start_new_session=True)
+    while process.poll() is None:
+        time.sleep(WATCHDOG['poll'])
+        if process.poll() is not None:
+            break
+        censored = watchdog_verdict(best, time.time() - start, output)
+        if censored is None:
+            continue
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+        return censored
+    return None
+
+def run_sim(iter, inFile, executor=None):
     '''
     Run yaml input file.
     Parameters:
         iter(integer): represents iteration
         inFile(file): the input yaml file
+        executor(dictionary): trial executor with a results log for the watchdog, or None
+    Returns:
+        censored(dictionary): see run_watched, None if the trial ran to the end
     '''
-    # Check if mesh-pop exists
-    if os.path.isdir('mesh-pop-wdg'):
-      print('Populated mesh already exists!')
-    else:
-      run_bash('ctest -L "pop"')
+    with timed('mesh', name='populate_mesh'):
+        populate_mesh()
 
     # Run simulation
-    run_bash('ctest -L "tune-gpu" --timeout 90')
+    with timed('ctest', iter):
+        command = ctest_command()
+        censored = run_watched(command + ' > ctest.out 2>&1' if WATCHDOG['factor'] else command, executor)
+
+    # Generate output file (the log of a killed trial would be the previous one)
+    if censored is None and os.path.isfile('Testing/Temporary/LastTest.log'):
+        shutil.copy('Testing/Temporary/LastTest.log', 'LastTest_'+str(iter)+'-0.log')
+    return censored
+
+###############################################################################
+def make_executor(jobs=1, slots=None, backend=None):
+    '''
+    Build the trial executor shared by the search functions. Backends:
+    serial runs every trial in place through run_sim; pool gives each trial its own
+    sandbox directory and runs it on a local worker pool; slurm runs each sandbox (or
+    pack of sandboxes, see SLURM) as a batch job, with up to jobs jobs queued at once.
+    Parameters:
+        jobs(integer): number of trials to run at once (slurm: batch jobs in the queue)
+        slots(list): slot descriptors, one per worker, i.e. ['0-3', '4-7'] (core sets
+                     passed to taskset) or ['gpu:0', 'gpu:1'] (CUDA devices);
+                     overrides jobs when given
+        backend(string): serial, pool or slurm (default: serial for a single unpinned worker, else pool)
+    Returns:
+        executor(dictionary): {'backend', 'jobs':number of trials at once, 'pool':worker pool or None,
+                               'slots':queue of free slots, 'futures':list of submitted trials}
+    '''
+    slot_list = list(slots) if slots else [None] * max(jobs, 1)
+    if backend is None:
+        backend = 'pool' if len(slot_list) > 1 or slots else 'serial'
+    executor = {'backend': backend, 'jobs': len(slot_list), 'pool': None, 'slots': None, 'futures': list()}
+    if backend == 'serial':
+        executor['jobs'] = 1
+    elif backend == 'slurm':
+        executor['pool'] = ThreadPoolExecutor(max_workers=len(slot_list))
+        executor['jobs'] = len(slot_list) * SLURM['pack']
+    elif backend == 'pool':
+        executor['pool'] = ThreadPoolExecutor(max_workers=len(slot_list))
+        executor['slots'] = queue.Queue()
+        for slot in slot_list:
+            executor['slots'].put(slot)
+    return executor
+
+def slot_command(command, slot):
+    '''
+    Pin a command to a worker slot.
+    Parameters:
+        command(string): the command line to run
+        slot(string): slot descriptor, a core set ('0-3') or a device ('gpu:0'), or None
+    Returns:
+        command(string): the command line, prefixed with taskset for core sets
+        env(dictionary): environment with CUDA_VISIBLE_DEVICES for devices, else None
+    '''
+    if slot is None:
+        return command, None
+    if slot.startswith('gpu:'):
+        return command, dict(os.environ, CUDA_VISIBLE_DEVICES=slot[len('gpu:'):])
+    return 'taskset -c ' + slot + ' ' + command, None
+
+def make_sandbox(iter, inFile):
+    '''
+    Create an isolated working directory for one trial: the entries of the build
+    directory are symlinked except the input yaml, the ctest output folder, the
+    outputs of the tuner (named after the input, ctest jsons, autotune_runs), ctest.out and
+    CTestTestfile.cmake, which is copied with its paths pointing to the sandbox.
+    Parameters:
+        iter(integer): represents iteration
+        inFile(file): the input yaml file
+    Returns:
+        sandbox(string): the sandbox directory, trial_[#iter_id]
+    '''
+    cwd = os.getcwd()
+    sandbox = 'trial_' + str(iter)
+    if os.path.isdir(sandbox):
+        shutil.rmtree(sandbox)
+    os.mkdir(sandbox)
+    # ctest.out of a serial run would be shared by every sandbox through its link
+    skip = [inFile, 'Testing', 'CTestTestfile.cmake', 'ctest.out', RUNS_DIR]
+    # the outputs of the tuner grow with the campaign, linking them would make each sandbox
+    # slower: copies and results of the input ([input]_*.yaml/csv/json/jsonl, [input].csv),
+    # ctest-*.json, the nightly history and the other trials. Other files are inputs of Albany.
+    outputs = re.compile(r'({0}(_.+)?\.(yaml|csv|json|jsonl)|ctest-.+\.json|.+_hist(_sorted)?\.(csv|sqlite)|'
+                         r'(trial|LastTest|json)_.+)$'.format(re.escape(inFile.split('.')[0])))
+    for entry in os.listdir(cwd):
+        if entry in skip or outputs.match(entry):
+            continue
+        os.symlink(os.path.join(cwd, entry), os.path.join(sandbox, entry))
+    with open('CTestTestfile.cmake') as f:
+        cmake = f.read()
+    with open(os.path.join(sandbox, 'CTestTestfile.cmake'), 'w') as f:
+        f.write(cmake.replace(cwd, os.path.join(cwd, sandbox)))
+    return sandbox
+
+def run_sim_sandbox(executor, trial, inFile, sandbox):
+    '''
+    Run yaml input file inside its sandbox on the first free worker slot, copy the
+    ctest log back under the same name run_sim produces, and remove the sandbox once
+    the trial is in the results log.
+    Parameters:
+        executor(dictionary): trial executor from make_executor
+        trial(dictionary): {'iter':#iter_id, 'round':simu, 'params':{smoother:{parameter:value}}}
+        inFile(file): the input yaml file
+        sandbox(string): the trial's sandbox directory
+    '''
+    iter = trial['iter']
+    with traced_trial(trial):
+        with traced('wait for a slot', 'sandbox'):
+            slot = executor['slots'].get()
+        try:
+            command, env = slot_command(ctest_command() + ' > ctest.out 2>&1', slot)
+            with timed('ctest', iter):
+                trial['censored'] = run_watched(command, executor, cwd=sandbox, env=env)
+        finally:
+            executor['slots'].put(slot)
+        print('[CASE {0}] finished in {1} (slot: {2})'.format(iter, sandbox, slot))
+
+        lastTest = os.path.join(sandbox, 'Testing', 'Temporary', 'LastTest.log')
+        if trial['censored'] is None and os.path.isfile(lastTest):
+            shutil.copy(lastTest, 'LastTest_'+str(iter)+'-0.log')
+        ingest_trial(executor, trial)
+        with timed('sandbox', iter, name='remove sandbox'):
+            shutil.rmtree(sandbox, ignore_errors=True)
+
+###############################################################################
+# Slurm backend: sbatch options (i.e. '-N1 -p k80 --time=0:30:00'), trials per batch
+# job, seconds between two squeue polls, and the sandboxes waiting to fill a pack
+SLURM = {'options': '', 'pack': 1, 'poll': 10.0, 'pending': list()}
 
-    # Generate input file
+def slurm_script(sandboxes):
+    '''
+    Write the batch script of a job running the trials of its sandboxes one after
+    another; each sandbox gets the start and end time of its trial in slurm.times.
+    Parameters:
+        sandboxes(list): sandbox directories of the trials
+    Returns:
+        script(string): the batch script, in the first sandbox
+    '''
+    first = os.path.abspath(sandboxes[0])
+    lines = ['#!/bin/bash', '#SBATCH --job-name=autotune-' + os.path.basename(first),
+             '#SBATCH --output=' + os.path.join(first, 'slurm.out')]
+    for sandbox in sandboxes:
+        path = os.path.abspath(sandbox)
+        lines.append('cd "{0}" && date +%s.%N > slurm.times && {1} > ctest.out 2>&1; date +%s.%N >> "{0}/slurm.times"'.format(
+                     path, ctest_command()))
+    script = os.path.join(first, 'trial.sbatch')
+    with open(script, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return script
+
+def slurm_state(job):
+    '''
+    State of a batch job in the queue (PENDING, RUNNING, ...), None once it has left it.
+    '''
+    output = subprocess.run(['squeue', '-h', '-j', job, '-o', '%T'], capture_output=True, text=True).stdout
+    return output.strip() or None
+
+def slurm_times(sandbox):
+    '''
+    Start and end time of the trial of a sandbox, from slurm.times (None if unknown).
+    '''
+    filename = os.path.join(sandbox, 'slurm.times')
+    if not os.path.isfile(filename):
+        return None, None
+    with open(filename) as f:
+        times = [float(line) for line in f if line.strip()]
+    return (times + [None, None])[:2]
+
+def run_slurm(executor, trials, sandboxes):
+    '''
+    Submit trials as one batch job, poll the queue until the job has left it, then
+    collect the ctest logs of the sandboxes under the names run_sim produces and remove
+    the sandboxes. A job of
+    a single trial is watched and cancelled like a local trial, see run_watched.
+    Parameters:
+        executor(dictionary): trial executor from make_executor
+        trials(list): [{'iter':#iter_id, 'round':simu, 'params':{smoother:{parameter:value}}}]
+        sandboxes(list): the trials' sandbox directories
+    '''
+    submitted = time.time()
+    command = 'sbatch --parsable ' + SLURM['options'] + ' ' + slurm_script(sandboxes)
+    job = subprocess.run(command, shell=True, capture_output=True, text=True, check=True).stdout.strip().split(';')[0]
+    print('[CASE {0}] submitted as Slurm job {1}'.format(', '.join(trial['iter'] for trial in trials), job))
+    best = watchdog_best(executor) if len(trials) == 1 else None
+    censored = None
+    while slurm_state(job) is not None:
+        time.sleep(SLURM['poll'])
+        start, end = slurm_times(sandboxes[0])
+        if best is None or censored is not None or start is None or end is not None:
+            continue
+        censored = watchdog_verdict(best, time.time() - start, os.path.join(sandboxes[0], 'ctest.out'))
+        if censored is not None:
+            subprocess.run(['scancel', job])
+    for trial, sandbox in zip(trials, sandboxes):
+        start, end = slurm_times(sandbox)
+        if trial is trials[0] and start is not None:
+            with LEDGER['lock']:
+                LEDGER['totals']['queue'] = LEDGER['totals'].get('queue', 0) + start - submitted
+            add_span('Slurm job ' + job + ' (queued)', 'queue', submitted, start - submitted,
+                     args={'iters': [trial['iter'] for trial in trials]})
+        if start is not None:
+            wall = (end or time.time()) - start # a cancelled job has no end time
+            with LEDGER['lock']:
+                LEDGER['totals']['ctest'] = LEDGER['totals'].get('ctest', 0) + wall
+                LEDGER['trials'].setdefault(trial['iter'], dict())['ctest'] = wall
+        trial['censored'] = censored
+        print('[CASE {0}] finished in {1} (Slurm job {2})'.format(trial['iter'], sandbox, job))
+        lastTest = os.path.join(sandbox, 'Testing', 'Temporary', 'LastTest.log')
+        if censored is None and os.path.isfile(lastTest):
+            shutil.copy(lastTest, 'LastTest_'+str(trial['iter'])+'-0.log')
+        if start is not None: # the ctest run on the node, drawn on the track of this job
+            add_span('ctest', 'ctest', start, wall, trial['iter'], {'params': flatten_params(trial['params'])})
+        with traced_trial(trial):
+            ingest_trial(executor, trial)
+        shutil.rmtree(sandbox, ignore_errors=True)
+
+def flush_slurm(executor):
+    '''
+    Submit the sandboxes waiting for their pack to fill as one batch job.
+    Parameters:
+        executor(dictionary): trial executor from make_executor
+    '''
+    if SLURM['pending']:
+        trials, sandboxes = [list(entries) for entries in zip(*SLURM['pending'])]
+        executor['futures'].append(executor['pool'].submit(run_slurm, executor, trials, sandboxes))
+        SLURM['pending'] = list()
+
+def submit_sim(executor, iter, inputDict, inFile, params=None, simu=0):
+    '''
+    Write the trial's input file and run it, in place or on the worker pool.
+    Parameters:
+        executor(dictionary): trial executor from make_executor, or None to run in place
+        iter(integer): represents iteration
+        inputDict(dictionary): the patched input yaml dictionary
+        inFile(file): the input yaml file
+        params(dictionary): {smoother:{parameter:value}} recorded in the results log
+        simu(integer): a nonneg integer that represents the current round of simulation
+    '''
+    # the search functions add the time to their parameter dictionaries afterwards
+    trial = {'iter': str(iter), 'round': simu, 'params': copy.deepcopy(params) if params else dict()}
+    with traced_trial(trial):
+        if replay_trial(executor, trial) or serve_cached(executor, trial, inputDict, inFile) or screen_trial(executor, trial):
+            return
+        newInFile = inFile.split('.')[0] + '_' + str(iter) + '.' + inFile.split('.')[1]
+        if executor is None or executor['pool'] is None:
+            write_trial_yaml(inputDict, [inFile, newInFile])
+            trial['censored'] = run_sim(iter, inFile, executor)
+            ingest_trial(executor, trial)
+        else:
+            # populate once in the build directory; sandboxes link to it
+            with timed('mesh', name='populate_mesh'):
+                populate_mesh()
+            with timed('sandbox', name='make_sandbox'):
+                sandbox = make_sandbox(iter, inFile)
+            write_trial_yaml(inputDict, [os.path.join(sandbox, inFile), newInFile])
+            if executor['backend'] == 'slurm':
+                SLURM['pending'].append((trial, sandbox))
+                if len(SLURM['pending']) >= SLURM['pack']:
+                    flush_slurm(executor)
+            else:
+                executor['futures'].append(executor['pool'].submit(run_sim_sandbox, executor, trial, inFile, sandbox))
+    if executor is not None and executor.get('cache') and executor['cache']['build'] is None:
+        # the first run of the session tells which build the cache entries must match
+        wait_sims(executor)
+        convert_logs(executor)
+        update_cache(executor)
+
+def wait_sims(executor):
+    '''
+    Block until every submitted trial has finished.
+    Parameters:
+        executor(dictionary): trial executor from make_executor, or None
+    '''
+    if executor is None:
+        return
+    if executor['backend'] == 'slurm':
+        flush_slurm(executor)
+    for future in executor['futures']:
+        future.result()
+    executor['futures'] = list()
+
+###############################################################################
+# ctest log lines read by parse_ctest_log
+TEST_START = re.compile(r'^\s*\d+/\d+ Test(?:ing)?: (\S+)')
+TEST_END = re.compile(r'^"(\S+)" end time:')
+TEST_TIME = re.compile(r'^Test time =\s*([0-9.]+) sec')
+METADATA = re.compile(r'^((?:Albany|Trilinos|Kokkos|Simulation) [^:]+): (.+)$')
+TIMER_ROW = re.compile(r'^(.+?:)((?:\s+[-+0-9.eE]+(?:\s+\(\d+\))?)+)\s*$')
+TIMER_VALUE = re.compile(r'([-+0-9.eE]+)(?:\s+\((\d+)\))?')
+
+def parse_ctest_log(filename, date=0):
+    '''
+    Parse a ctest LastTest.log line by line into the structure of the ctest-*.json
+    files: {testname:{'case', 'np', 'date', 'passed', 'timers', build metadata}}.
+    A partial log (trial still running) returns what has been written so far, with
+    'passed' False until ctest reports the test as passed. 'Test time' is the wall
+    time ctest reports for the test. On more than one rank,
+    'timers' holds the max over procs and 'timer_stats' holds min/mean/max.
+    Parameters:
+        filename(string): ctest log, i.e. Testing/Temporary/LastTest.log or LastTest_[#iter_id]-0.log
+        date(integer): value of the 'date' field
+    Returns:
+        dat(dictionary): {testname:record}, same as json.load of a ctest-*.json
+    '''
+    dat = dict()
+    record = None
+    in_table = False
+    with open(filename, errors='replace') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            match = TEST_START.match(line)
+            if match:
+                name = match.group(1)
+                if name not in dat:
+                    case, _, np_count = name.rpartition('_np')
+                    dat[name] = {'case': case if np_count.isdigit() else name,
+                                 'np': int(np_count) if np_count.isdigit() else 1,
+                                 'date': date, 'passed': False, 'timers': dict()}
+                record = dat[name]
+                in_table = False
+                continue
+            if record is None:
+                continue
+            if line.startswith('Timer Name'):
+                in_table = True
+                continue
+            if in_table:
+                if line.startswith('='):
+                    in_table = False
+                    continue
+                match = TIMER_ROW.match(line)
+                if match:
+                    values = [float(value) for value, _ in TIMER_VALUE.findall(match.group(2))]
+                    if len(values) == 1:
+                        record['timers'][match.group(1)] = values[0]
+                    else: # MinOverProcs, MeanOverProcs, MaxOverProcs(, MeanOverCallCounts)
+                        record['timers'][match.group(1)] = values[2]
+                        record.setdefault('timer_stats', dict())[match.group(1)] = \
+                            {'min': values[0], 'mean': values[1], 'max': values[2]}
+                continue
+            match = METADATA.match(line)
+            if match:
+                record[match.group(1)] = match.group(2).strip()
+            elif TEST_TIME.match(line):
+                record['Test time'] = float(TEST_TIME.match(line).group(1))
+            elif line.startswith('Test Passed'):
+                record['passed'] = True
+            elif line.startswith('Test Failed') or line.startswith('Test Timeout'):
+                record['passed'] = False
+            elif TEST_END.match(line):
+                record = None
+    return dat
+
+def convert_log(iter, censored=None, case=None):
+    '''
+    Parse LastTest_[#iter_id]-0.log and write it to ctest-[#iter_id].json. A trial killed
+    by the watchdog has no log: its record holds the lower bound of its time instead.
+    Parameters:
+        iter(string): #iter_id of the finished trial
+        censored(dictionary): see run_watched, None if the trial ran to the end
+        case(string): casename of the record of a killed trial
+    Returns:
+        dat(dictionary): parsed log, empty if the log is missing
+    '''
+    log_file = 'LastTest_' + str(iter) + '-0.log'
+    if censored is not None:
+        dat = {case: {'case': case, 'passed': False, 'censored': censored['time'],
+                      'killed': censored['reason'], 'Test time': censored['elapsed'], 'timers': dict()}}
+    elif not os.path.isfile(log_file):
+        return dict()
+    else:
+        with timed('json', name='parse_ctest_log'):
+            dat = parse_ctest_log(log_file)
+    with timed('json', name='json.dump ctest'), open('ctest-' + str(iter) + '.json', 'w') as f:
+        json.dump(dat, f, indent=1)
+    return dat
+
+def convert_logs(executor):
+    '''
+    Convert the logs of a sweep to json, unless every trial was already ingested
+    into the results log as it finished.
+    Parameters:
+        executor(dictionary): trial executor from make_executor, or None
+    '''
+    if executor is None or executor.get('results') is None:
+        for logname in glob.glob('LastTest_*-0.log'):
+            convert_log(logname[len('LastTest_'):-len('-0.log')])
+
+def open_results(filename, case, session=None):
+    '''
+    Start a new session in the append-only results log (JSON Lines). Each line is
+    one finished trial: session, round, #iter id, parameters, pass/fail, time, all
+    timers and when it finished, so a crash only loses the trials still running.
+    Parameters:
+        filename(string): results log (.jsonl), appended to across sessions
+        case(string): a string that represents the targeted casename from output
+        session(string): session id, the run id (default: date and process id)
+    Returns:
+        results(dictionary): results log state attached to the executor
+    '''
+    session = session or time.strftime('%Y%m%d-%H%M%S') + '-' + str(os.getpid())
+    print("RESULTS LOG: {0} (session {1})".format(filename, session))
+    return {'file': filename, 'case': case, 'session': session, 'lock': threading.Lock(),
+            'records': list(), 'best': None}
+
+def to_builtin(value):
+    '''
+    json.dump fallback for numpy and ruamel scalars.
+    '''
+    return value.item() if hasattr(value, 'item') else str(value)
+
+def ingest_trial(executor, trial, served=False):
+    '''
+    Parse a finished trial right away and append it to the results log.
+    Parameters:
+        executor(dictionary): trial executor from make_executor, or None
+        trial(dictionary): {'iter':#iter_id, 'round':simu, 'params':{smoother:{parameter:value}}}
+        served(boolean): the result came from the trial cache
+    '''
+    results = executor.get('results') if executor else None
+    if results is None:
+        return
+    with results['lock']:
+        if served or trial.get('skipped') is not None:
+            with timed('json', name='json.load ctest'), open('ctest-' + trial['iter'] + '.json') as f:
+                dat = json.load(f)
+        else:
+            dat = convert_log(trial['iter'], trial.get('censored'), results['case'])
+        record = dict(trial)
+        wall = None if served or trial.get('skipped') is not None else LEDGER['trials'].pop(trial['iter'], dict()).get('ctest')
+        record.update({'session': results['session'], 'served': served, 'finished': time.time(),
+                       'passed': dat.get(results['case'], {}).get('passed') is True,
+                       'time': get_time(dat, results['case']),
+                       'timers': dat.get(results['case'], {}).get('timers', {}),
+                       'timer_stats': dat.get(results['case'], {}).get('timer_stats'),
+                       'ledger': trial_breakdown(dat.get(results['case'], {}).get('timers', {}), wall),
+                       'build': {field: dat.get(results['case'], {}).get(field) for field in BUILD_FIELDS}})
+        # the trial's files are in the run directory before its line commits it to the journal
+        archive_trial(trial)
+        with timed('json', name='results log'), open(results['file'], 'a') as f:
+            f.write(json.dumps(record, default=to_builtin) + '\n')
+        results['records'].append(record)
+        if not record.get('censored') and (results['best'] is None or record['time'] < results['best']['time']):
+            results['best'] = record
+        if record.get('censored'):
+            print('[CASE {0}] killed by the watchdog ({1}), time >= {2:.4f}'.format(
+                  trial['iter'], record['censored']['reason'], record['time']))
+        best = results['best'] or record # every trial so far was killed
+        print('[CASE {0}] time: {1} (best so far: {2}, CASE {3})'.format(
+              trial['iter'], record['time'], best['time'], best['iter']))
+
+def get_time_results(executor):
+    '''
+    Return the times of this session from the results log.
+    Parameters:
+        executor(dictionary): trial executor with a results log
+    Returns:
+        iter_time_dict(dictionary): {#iter:list(time)}, one time per round
+    '''
+    iter_time_dict = dict()
+    for record in executor['results']['records']:
+        iter_time_dict.setdefault(record['iter'], list()).append(record['time'])
+    return iter_time_dict
+
+def read_results(filename, session=None):
+    '''
+    Read a results log.
+    Parameters:
+        filename(string): results log (.jsonl)
+        session(string): only keep this session (default: the last one in the log, '*' for all)
+    Returns:
+        records(list): one dictionary per finished trial
+    '''
+    records = list()
+    with open(filename) as f:
+        for line in f:
+            if line.strip():
+                records.append(json.loads(line))
+    if session == '*':
+        return records
+    if records and session is None:
+        session = records[-1]['session']
+    return [record for record in records if record['session'] == session]
+
+def print_status(filename):
+    '''
+    Print the progress and the best result so far of the last session in a
+    results log; safe to run from another shell while the sweep is going on.
+    Parameters:
+        filename(string): results log (.jsonl)
+    '''
+    records = read_results(filename)
+    if not records:
+        print("No finished trial in {}".format(filename))
+        return
+    best = min(records, key = lambda record: (bool(record.get('censored')), record['time']))
+    print("SESSION: {0}, FINISHED TRIALS: {1}, FAILED: {2}".format(
+          records[-1]['session'], len(records), sum(1 for record in records if not record['passed'])))
+    print("BEST SO FAR: CASE {0} (round {1}), time {2}".format(best['iter'], best['round'], best['time']))
+    for smoother, params in best['params'].items():
+        print("[{}] ".format(smoother), params)
+    for logname in sorted(glob.glob(os.path.join('trial_*', 'Testing', 'Temporary', 'LastTest.log'))):
+        sandbox = logname.split(os.sep)[0]
+        if sandbox[len('trial_'):] in [record['iter'] for record in records]:
+            continue
+        for name, record in parse_ctest_log(logname).items():
+            print("RUNNING: CASE {0} ({1}), timers so far: {2}".format(sandbox[len('trial_'):], name, record['timers']))
+
+def rescore_results(filename, objective, csv_filename):
+    '''
+    Rank the configurations of a results log (every session) under another objective,
+    from the recorded timers, without running anything. The runs of a configuration
+    are reduced to their median; killed, skipped and cache-served trials are left out.
+    Parameters:
+        filename(string): results log (.jsonl)
+        objective(dictionary): compiled objective from compile_objective
+        csv_filename(string): output ranking (.csv)
+    '''
+    records = [record for record in read_results(filename, '*')
+               if not record.get('censored') and record.get('skipped') is None and not record.get('served')]
+    if not records:
+        print("No measured trial in {}".format(filename))
+        return
+    values = objective_values(objective, records)
+    groups = dict()
+    for record, value in zip(records, values):
+        params = flatten_params(record['params'])
+        group = groups.setdefault(json.dumps(params, sort_keys=True, default=to_builtin), {'params': params, 'time': list(), 'objective': list()})
+        group['time'].append(record['time'])
+        group['objective'].append(value)
+    rows = [dict(group['params'], runs=len(group['time']), time=statistics.median(group['time']),
+                 objective=statistics.median(group['objective'])) for group in groups.values()]
+    df = pd.DataFrame.from_records(rows).sort_values(by=['objective', 'time']).reset_index(drop=True)
+    df.to_csv(csv_filename, index=False)
+    finite = df[np.isfinite(df['objective']) & np.isfinite(df['time'])]
+    print("RESCORED: {0} runs of {1} configurations under {2}".format(len(records), len(df), objective['expression']))
+    if len(finite) > 2:
+        print("RANK CORRELATION WITH THE RECORDED TIME (Spearman): {:.3f}".format(spearmanr(finite['time'], finite['objective'])[0]))
+    print(df.head(10).to_string())
+    print("RANKING: {}".format(csv_filename))
+
+###############################################################################
+# Run journal: the inputs, options and RNG state of each run, and the files of its
+# finished trials, in autotune_runs/[run_id]; the results log session is the run id
+RUNS_DIR = 'autotune_runs'
+RUN = {'id': None, 'dir': None, 'journal': None, 'yaml': None, 'finished': dict()}
+# options that change which trials a run makes, restored by --resume
+RUN_OPTIONS = ['halving', 'racing', 'confidence', 'cache', 'cache_samples', 'objective', 'objectives', 'trade_off',
+               'warm_start', 'warm_similarity', 'freeze', 'feasibility']
+
+def save_journal(journal):
+    '''
+    Write the journal of the run atomically.
+    Parameters:
+        journal(dictionary): see open_run
+    '''
+    filename = os.path.join(RUN['dir'], 'journal.json')
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(journal, f, indent=1)
+    os.replace(filename + '.tmp', filename)
+
+def open_run(run_id, yaml_filename, algo, options, resume=False):
+    '''
+    Start the journal of a new run, or load the journal of an interrupted run and
+    restore the state of the random module (random.choices of random-multi); the
+    samplers of numpy are rebuilt from the journaled seed.
+    Parameters:
+        run_id(string): run id
+        yaml_filename(string): the input yaml file
+        algo(string): searching algorithm
+        options(dictionary): command line options
+        resume(boolean): continue the run instead of starting it
+    Returns:
+        journal(dictionary): {'run_id', 'yaml', 'algorithm', 'options', 'inputs':{name:value}, 'random':state}
+    '''
+    RUN.update({'id': run_id, 'dir': os.path.join(RUNS_DIR, run_id), 'yaml': yaml_filename})
+    if resume:
+        if not os.path.isfile(os.path.join(RUN['dir'], 'journal.json')):
+            raise ValueError("No journal of run {0} in {1}".format(run_id, RUNS_DIR))
+        with open(os.path.join(RUN['dir'], 'journal.json')) as f:
+            journal = json.load(f)
+        if journal['yaml'] != yaml_filename or journal['algorithm'] != algo:
+            raise ValueError("Run {0} is {1} {2}, resume it with the same arguments".format(
+                             run_id, journal['yaml'], journal['algorithm']))
+        random.setstate((journal['random'][0], tuple(journal['random'][1]), journal['random'][2]))
+    else:
+        if os.path.exists(RUN['dir']):
+            raise ValueError("Run {0} already exists: continue it with --resume {0}".format(run_id))
+        os.makedirs(RUN['dir'])
+        journal = {'run_id': run_id, 'yaml': yaml_filename, 'algorithm': algo, 'options': options,
+                   'inputs': dict(), 'random': random.getstate()}
+    RUN['journal'] = journal
+    save_journal(journal)
+    print("RUN: {0} ({1}{2})".format(run_id, RUN['dir'], ', resumed' if resume else ''))
+    return journal
+
+def ask_input(name, prompt):
+    '''
+    Read an integer input of the run (#rounds, #iters, seed), from the journal if the
+    run is resumed.
+    Parameters:
+        name(string): name of the input in the journal
+        prompt(string): the question
+    Returns:
+        value(integer): the answer
+    '''
+    inputs = RUN['journal']['inputs']
+    if name in inputs:
+        print(prompt + str(inputs[name]))
+        return inputs[name]
+    inputs[name] = int(input(prompt))
+    save_journal(RUN['journal'])
+    return inputs[name]
+
+def trial_files(trial):
+    '''
+    Names of the files of a trial: ctest-[#iter_id].json, LastTest_[#iter_id]-0.log
+    and [input_yaml]_[#iter_id].yaml.
+    '''
+    iter = trial['iter']
+    return ['ctest-' + iter + '.json', 'LastTest_' + iter + '-0.log',
+            RUN['yaml'].split('.')[0] + '_' + iter + '.' + RUN['yaml'].split('.')[1]]
+
+def archive_trial(trial):
+    '''
+    Copy the files of a finished trial to autotune_runs/[run_id]/round_[round], out of
+    reach of remove_files.
+    Parameters:
+        trial(dictionary): {'iter':#iter_id, 'round':simu, 'params':{smoother:{parameter:value}}}
+    '''
+    if RUN['dir'] is None:
+        return
+    path = os.path.join(RUN['dir'], 'round_' + str(trial['round']))
+    with timed('json', name='archive_trial'):
+        os.makedirs(path, exist_ok=True)
+        for filename in trial_files(trial):
+            if os.path.isfile(filename):
+                shutil.copy(filename, os.path.join(path, filename))
+
+def load_finished(filename, run_id):
+    '''
+    Read the trials a resumed run finished before it was interrupted.
+    Parameters:
+        filename(string): results log (.jsonl)
+        run_id(string): run id, the session of its trials in the results log
+    Returns:
+        finished(dictionary): {(round, #iter_id):record}
+    '''
+    if not os.path.isfile(filename):
+        return dict()
+    records = read_results(filename, run_id)
+    print("RESUMING: {0} trials of run {1} already finished".format(len(records), run_id))
+    return {(record['round'], record['iter']): record for record in records}
+
+def replay_trial(executor, trial):
+    '''
+    Instead of running a trial the resumed run already finished, restore its files
+    from the run directory and its record from the results log.
+    Parameters:
+        executor(dictionary): trial executor from make_executor, or None
+        trial(dictionary): {'iter':#iter_id, 'round':simu, 'params':{smoother:{parameter:value}}}
+    Returns:
+        replayed(boolean): True if the trial had finished
+    '''
+    record = RUN['finished'].pop((trial['round'], trial['iter']), None)
+    results = executor.get('results') if executor else None
+    if record is None or results is None:
+        return False
+    if json.dumps(record['params'], sort_keys=True) != json.dumps(trial['params'], sort_keys=True, default=to_builtin):
+        print('[CASE {}] has other parameters than before the interruption, running it again'.format(trial['iter']))
+        return False
+    path = os.path.join(RUN['dir'], 'round_' + str(trial['round']))
+    for filename in trial_files(trial):
+        if os.path.isfile(os.path.join(path, filename)):
+            shutil.copy(os.path.join(path, filename), filename)
+    with results['lock']:
+        results['records'].append(record)
+        if not record.get('censored') and (results['best'] is None or record['time'] < results['best']['time']):
+            results['best'] = record
+    print('[CASE {0}] finished before the interruption, time: {1}'.format(trial['iter'], record['time']))
+    return True
+
+###############################################################################
+
+def load_cache(filename, case, samples=False):
+    '''
+    Load the persistent trial cache {build_key:{trial_key:list(record)}}.
+    Parameters:
+        filename(string): cache file (.json), created on the first update
+        case(string): a string that represents the targeted casename from output
+        samples(boolean): run every trial and use cached records as extra samples,
+                          instead of serving them in place of a run
+    Returns:
+        cache(dictionary): cache state attached to the executor
+    '''
+    entries = dict()
+    if os.path.isfile(filename):
+        with open(filename) as f:
+            entries = json.load(f)
+    return {'file': filename, 'case': case, 'samples': samples, 'build': None,
+            'entries': entries, 'prior': copy.deepcopy(entries),
+            'keys': dict(), 'pending': set(), 'used': dict(), 'served': set()}
+
+def save_cache(cache):
+    '''
+    Write the trial cache atomically.
+    Parameters:
+        cache(dictionary): cache state from load_cache
+    '''
+    with open(cache['file'] + '.tmp', 'w') as f:
+        json.dump(cache['entries'], f, indent=1)
+    os.replace(cache['file'] + '.tmp', cache['file'])
+
+def serve_cached(executor, trial, inputDict, inFile):
+    '''
+    Serve a trial from the cache instead of running it. The n-th request of a
+    configuration in this session gets its n-th cached record, so repeated rounds
+    still see distinct samples and only run once the cached ones are used up.
+    The build is known after the first trial of the session has been recorded.
+    Parameters:
+        executor(dictionary): trial executor from make_executor, or None
+        trial(dictionary): {'iter':#iter_id, 'round':simu, 'params':{smoother:{parameter:value}}}
+        inputDict(dictionary): the patched input yaml dictionary
+        inFile(file): the input yaml file
+    Returns:
+        served(boolean): True if ctest-[#iter_id].json was written from the cache
+    '''
+    cache = executor.get('cache') if executor else None
+    if cache is None:
+        return False
+    iter = trial['iter']
+    with timed('cache'):
+        key = get_trial_key(inputDict, cache['case'])
+    cache['keys'][iter] = key
+    count = cache['used'].get(key, 0)
+    cache['used'][key] = count + 1
+    records = cache['entries'].get(cache['build'], dict()).get(key, list())
+    if cache['samples'] or count >= len(records):
+        cache['pending'].add(iter)
+        return False
     newInFile = inFile.split('.')[0] + '_' + str(iter) + '.' + inFile.split('.')[1]
-    run_bash('cp ' + inFile + ' ' + newInFile)
+    write_trial_yaml(inputDict, [newInFile])
+    with timed('cache'), open('ctest-' + str(iter) + '.json', 'w') as f:
+        json.dump({cache['case']: records[count]}, f, indent=2)
+    cache['served'].add(iter)
+    print('[CASE {}] served from the trial cache'.format(iter))
+    ingest_trial(executor, trial, served=True)
+    return True
+
+def update_cache(executor):
+    '''
+    Record the results of the trials run since the last update. The session's build is
+    that of its first record with a full log header; records without one (a run that
+    failed before Albany printed it) are not cached.
+    Parameters:
+        executor(dictionary): trial executor from make_executor, or None
+    '''
+    cache = executor.get('cache') if executor else None
+    if cache is None:
+        return
+    for iter in sorted(cache['pending'], key=int):
+        filename = 'ctest-' + iter + '.json'
+        if not os.path.isfile(filename):
+            continue
+        with open(filename) as f:
+            record = json.load(f).get(cache['case'])
+        if record is None or record.get('censored') is not None or record.get('skipped') is not None:
+            continue # a killed or skipped trial was not measured
+        if not all(record.get(field) for field in BUILD_REQUIRED):
+            continue
+        if cache['build'] is None:
+            cache['build'] = get_build_key(record)
+        cache['entries'].setdefault(cache['build'], dict()).setdefault(cache['keys'][iter], list()).append(record)
+    cache['pending'] = set()
+    with timed('cache'):
+        save_cache(cache)
 
-    # Generate output file
-    run_bash('cp Testing/Temporary/LastTest.log LastTest_'+str(iter)+'-0.log')
+def cached_samples(executor):
+    '''
+    Times recorded for each trial's configuration before this session, on the
+    current build, to be used as extra noise samples (--cache-samples only).
+    Parameters:
+        executor(dictionary): trial executor from make_executor, or None
+    Returns:
+        iter_samples_dict(dictionary): {#iter:list(time)}
+    '''
+    cache = executor.get('cache') if executor else None
+    if cache is None or not cache['samples'] or cache['build'] is None:
+        return dict()
+    prior = cache['prior'].get(cache['build'], dict())
+    iter_samples_dict = dict()
+    for iter, key in cache['keys'].items():
+        if iter in cache['served']:
+            continue # its time already is a cached record
+        records = prior.get(key, list())
+        if records:
+            iter_samples_dict[iter] = [get_time({cache['case']: record}, cache['case']) for record in records]
+    return iter_samples_dict
+
+###############################################################################
+# Failure-region classifier of the passed/failed trials (--feasibility)
+FEASIBILITY = {'threshold': None, 'history': list(), 'model': None, 'trained': None}
+
+def flatten_params(params):
+    '''
+    Flatten {smoother:{parameter:value}} to {'smoother::parameter':value}.
+    '''
+    return {smoother + '::' + key: value for smoother, subdict in params.items() for key, value in subdict.items()}
+
+def feasibility_model(executor):
+    '''
+    The classifier fitted to the trials of the current architecture, in this and
+    earlier sessions of the results log; refitted when new trials have finished.
+    Parameters:
+        executor(dictionary): trial executor from make_executor, or None
+    Returns:
+        model(dictionary): see fit_feasibility, None until it can be fitted
+    '''
+    results = executor.get('results') if executor else None
+    if FEASIBILITY['threshold'] is None or results is None:
+        return None
+    records = FEASIBILITY['history'] + list(results['records'])
+    known = [get_architecture(record.get('build')) for record in records]
+    known = [architecture for architecture in known if architecture != 'unknown']
+    architecture = known[-1] if known else 'unknown'
+    records = [record for record in records if get_architecture(record.get('build')) in (architecture, 'unknown')]
+    if FEASIBILITY['trained'] != (architecture, len(records)):
+        # trials killed by the watchdog or skipped by the classifier did not fail
+        fitted = [record for record in records if record.get('censored') is None and record.get('skipped') is None]
+        FEASIBILITY['model'] = fit_feasibility([flatten_params(record['params']) for record in fitted],
+                                               [not record['passed'] for record in fitted])
+        FEASIBILITY['trained'] = (architecture, len(records))
+        if FEASIBILITY['model'] is not None:
+            FEASIBILITY['model']['architecture'] = architecture
+    return FEASIBILITY['model']
+
+def screen_trial(executor, trial):
+    '''
+    Skip a trial the classifier predicts to fail: it is recorded as failed without a
+    run, and left out of the classifier and the trial cache.
+    Parameters:
+        executor(dictionary): trial executor from make_executor, or None
+        trial(dictionary): {'iter':#iter_id, 'round':simu, 'params':{smoother:{parameter:value}}}
+    Returns:
+        skipped(boolean): True if ctest-[#iter_id].json was written for a skipped trial
+    '''
+    model = feasibility_model(executor)
+    if model is None or not trial['params']:
+        return False
+    p_fail = float(fail_probability(model, [flatten_params(trial['params'])])[0])
+    if p_fail <= FEASIBILITY['threshold']:
+        return False
+    trial['skipped'] = round(p_fail, 4)
+    case = executor['results']['case']
+    with timed('json'), open('ctest-' + trial['iter'] + '.json', 'w') as f:
+        json.dump({case: {'case': case, 'passed': False, 'skipped': trial['skipped'], 'timers': dict()}}, f, indent=1)
+    print('[CASE {0}] skipped: predicted to fail (p = {1:.2f})'.format(trial['iter'], p_fail))
+    ingest_trial(executor, trial)
+    return True
+
+def report_feasibility(filename, executor):
+    '''
+    Print the infeasible parameter regions of this case on the current architecture
+    and write them to a json file, see report_infeasible.
+    Parameters:
+        filename(string): output report (.json)
+        executor(dictionary): trial executor with a results log
+    '''
+    model = feasibility_model(executor)
+    if model is None:
+        print("INFEASIBLE REGIONS: not enough passed and failed trials to fit the classifier")
+        return
+    report_infeasible(model, executor['results']['case'], model['architecture'], filename)
 
 ###############################################################################
-def grid_search_multi(inFile, simu):
+def grid_search_multi(inFile, simu, executor=None, active=None):
     '''
     Run experiment with parameter grid -- Grid Search. 
     Parameters:
         inFile(file): the input yaml file
         simu(integer): a nonneg integer that represents the current round of simulation
+        executor(dictionary): trial executor from make_executor (default: run in place)
+        active(set): #iter ids to run this round (default: all); the others are only listed
     Returns:
         iter_param_dict(dictionary): {#iter:{parameter_to_change:new_value}} where
                                      #iter is the unique iter id for each experiment
@@ -129,6 +1384,9 @@ def grid_search_multi(inFile, simu):
                     'relaxation: sweeps': SWEEP_4
                    }
 
+    param_grid_1 = freeze(param_grid_1, 'mySmoother1')
+    param_grid_3 = freeze(param_grid_3, 'mySmoother3')
+    param_grid_4 = freeze(param_grid_4, 'mySmoother4')
     grid_1 = ParameterGrid(param_grid_1)
     grid_3 = ParameterGrid(param_grid_3)
     grid_4 = ParameterGrid(param_grid_4)
@@ -148,6 +1406,12 @@ def grid_search_multi(inFile, simu):
             dic3 = { key:((float)(round(value, 4)) if isinstance(value, float) else value) for key, value in p3.items() }
             paramList_3.update(dic3)
             for p4 in grid_4:
+                iter_param_dict_1.update({str(ite):p1})
+                iter_param_dict_3.update({str(ite):p3})
+                iter_param_dict_4.update({str(ite):p4})
+                if active is not None and str(ite) not in active:
+                    ite = ite + 1
+                    continue
                 print('\n')
                 print("########################## CASE {} ##########################".format(ite))
                 dic4 = { key:((float)(round(value, 4)) if isinstance(value, float) else value) for key, value in p4.items() }
@@ -155,25 +1419,25 @@ def grid_search_multi(inFile, simu):
                 print("[mySmoother1] ", dic1)
                 print("[mySmoother3] ", dic3)
                 print("[mySmoother4] ", dic4) 
-                write_yaml(inputDict, inFile)
-                run_sim(ite, inFile)
-                iter_param_dict_1.update({str(ite):p1})
-                iter_param_dict_3.update({str(ite):p3})
-                iter_param_dict_4.update({str(ite):p4})
+                submit_sim(executor, ite, inputDict, inFile,
+                           {'mySmoother1': dic1, 'mySmoother3': dic3, 'mySmoother4': dic4}, simu)
                 ite = ite + 1
     print('\n')
     print('######### TOTAL NUM OF CASES IN EACH SIMULATION: {} #########'.format(ite))
     print('#################### END OF SIMULATION {} ###################'.format(simu))
+    wait_sims(executor)
     # Convert logs to json
-    run_bash('python ctest2json.py')
+    convert_logs(executor)
     return iter_param_dict_1, iter_param_dict_3, iter_param_dict_4
 
-def grid_search_single(inFile, simu):
+def grid_search_single(inFile, simu, executor=None, active=None):
     '''
     Run experiment with parameter grid -- Grid Search. 
     Parameters:
         inFile(file): the input yaml file
         simu(integer): a nonneg integer that represents the current round of simulation
+        executor(dictionary): trial executor from make_executor (default: run in place)
+        active(set): #iter ids to run this round (default: all); the others are only listed
     Returns:
         iter_param_dict(dictionary): {#iter:{parameter_to_change:new_value}} where
                                      #iter is the unique iter id for each experiment
@@ -195,6 +1459,7 @@ def grid_search_single(inFile, simu):
                   'relaxation: sweeps': SWEEPS
                  # add more params here to tune if applicable
                  }
+    param_grid = freeze(param_grid, 'mySmoother1')
     grid = ParameterGrid(param_grid)
     print("TOTAL NUM OF CASES TO BE RUN: {}".format(len(list(grid))))
     
@@ -202,26 +1467,46 @@ def grid_search_single(inFile, simu):
     ite = 0 # current #iter id
     iter_param_dict = dict()
     for params in grid:
+        iter_param_dict.update({str(ite):params})
+        if active is not None and str(ite) not in active:
+            ite = ite + 1
+            continue
         print('\n')
         print("########################## CASE {} ##########################".format(ite))
         # Change parameter
         for key, value in params.items():
             if key in paramList: 
-                paramList[key] = value.item()
-                print('{0}: {1}'.format(key, value.item()))
-        iter_param_dict.update({str(ite):params})
-        # Write input file
-        write_yaml(inputDict, inFile)
-        # Run yaml input file
-        run_sim(ite, inFile)
+                # frozen values (--freeze) are plain Python numbers already
+                value = value.item() if hasattr(value, 'item') else value
+                paramList[key] = value
+                print('{0}: {1}'.format(key, value))
+        # Write input file and run it
+        submit_sim(executor, ite, inputDict, inFile, {'mySmoother1': params}, simu)
         ite = ite + 1
     print('\n')
     print('######### TOTAL NUM OF CASES IN EACH SIMULATION: {} #########'.format(ite))
     print('#################### END OF SIMULATION {} ###################'.format(simu))
+    wait_sims(executor)
     # Convert logs to json
-    run_bash('python ctest2json.py')
+    convert_logs(executor)
     return iter_param_dict
 
+def get_time(dat, case):
+    '''
+    Return the time of one run: the primary objective (--objective, default: NOX Total
+    Linear Solve + NOX Total Preconditioner Construction).
+    Parameters:
+        dat(dictionary): content of a ctest-*.json file
+        case(string): a string that represents the targeted casename from output
+    Returns:
+        time(float): the time, its lower bound if the trial was killed, inf if the test did not pass
+    '''
+    # a trial killed by the watchdog counts with the lower bound of its time
+    if dat.get(case, {}).get('censored') is not None:
+        return float(dat[case]['censored'])
+    # ensure the test passed to get timer -- otherwise set to arbitrary large
+    return float(objective_values(PRIMARY['objective'], [dat.get(case, {})])[0])
+
 def get_time_gridsearch(filenames, case, simu, iter_time_dict):
     '''
     Return a dictionary with time extracted from the output json files.
@@ -239,23 +1524,123 @@ def get_time_gridsearch(filenames, case, simu, iter_time_dict):
     for each_file in filenames:
         with open(each_file) as f:
             dat = json.load(f)
-            # ensure the test passed to get timer -- otherwise set to arbitrary large
-            if dat.get(case, {}).get('passed') is True:
-                time_linearsolve = dat.get(case, {}).get('timers', {}).get('NOX Total Linear Solve:')
-                time_precondition = dat.get(case, {}).get('timers', {}).get('NOX Total Preconditioner Construction:')
-                time = float(time_linearsolve) + float(time_precondition)
-            else:
-                time = float('inf')
+            time = get_time(dat, case)
             # extract time value and add to dictionary
             # output_num is the current #iter id
             output_num = each_file.split('-')[-1]
             output_num = os.path.splitext(output_num)[0]
-            if simu == 0: 
+            if output_num not in iter_time_dict: 
                 iter_time_dict[output_num] = list() # for the 1st time, initialize empty list
             iter_time_dict[output_num].append(time) # update the list of time
     return iter_time_dict
 
+def successive_halving(iter_time_dict, active, eta):
+    '''
+    Keep the fastest configurations for the next round of simulation.
+    Parameters:
+        iter_time_dict(dictionary): {#iter:list(time)} from get_time_gridsearch
+        active(set): #iter ids that ran in the last round, or None for all
+        eta(float): halving rate, the top 1/eta of the active configurations survive
+    Returns:
+        active(set): #iter ids to run in the next round
+    '''
+    if active is None:
+        active = set(iter_time_dict)
+    ranked = sorted(active, key = lambda k: statistics.median(iter_time_dict[k]))
+    keep = max(1, int(len(ranked) / eta))
+    print('############ SUCCESSIVE HALVING: {0} OF {1} CASES KEPT ###########'.format(keep, len(ranked)))
+    return set(ranked[:keep])
+
+def confidence_interval(time_list, confidence=0.95):
+    '''
+    Student-t confidence interval of the mean time of one configuration.
+    Parameters:
+        time_list(list): times from all rounds
+        confidence(float): confidence level
+    Returns:
+        low(float), high(float): bounds, nan with fewer than 2 rounds, inf if a run failed
+    '''
+    if not all(np.isfinite(time_list)):
+        return float('inf'), float('inf')
+    if len(time_list) < 2:
+        return float('nan'), float('nan')
+    mean = statistics.mean(time_list)
+    half = student_t.ppf((1 + confidence) / 2, len(time_list) - 1) * statistics.stdev(time_list) / np.sqrt(len(time_list))
+    return mean - half, mean + half
+
+def racing(iter_time_dict, active, confidence, min_reps=3):
+    '''
+    Race the configurations: once every one has min_reps rounds, drop those whose
+    confidence interval lies entirely above the interval of the best configuration.
+    The ones still tied with the best get another round.
+    Parameters:
+        iter_time_dict(dictionary): {#iter:list(time)} from get_time_gridsearch
+        active(set): #iter ids that ran in the last round, or None for all
+        confidence(float): confidence level of the intervals
+        min_reps(integer): rounds before the first elimination
+    Returns:
+        active(set): #iter ids to run in the next round
+    '''
+    if active is None:
+        active = set(iter_time_dict)
+    if min(len(iter_time_dict[k]) for k in active) < min_reps:
+        return active
+    bounds = {k: confidence_interval(iter_time_dict[k], confidence) for k in active}
+    best = min(active, key = lambda k: bounds[k][1])
+    kept = set(k for k in active if bounds[k][0] <= bounds[best][1])
+    print('################ RACING: {0} OF {1} CASES KEPT ###############'.format(len(kept), len(active)))
+    return kept
+
 ###############################################################################
+# Parameters fixed by autotune_importance.py (--freeze): {smoother:{parameter:value}}
+FROZEN = dict()
+
+def load_freeze(filename):
+    '''
+    Load the parameters frozen at their best values by autotune_importance.py.
+    Parameters:
+        filename(string): freeze file ([results]_freeze.json), keys N::parameter (or parameter for mySmoother1)
+    '''
+    with open(filename) as f:
+        frozen = json.load(f)['frozen']
+    FROZEN.clear()
+    for key, value in frozen.items():
+        prefix, parameter = key.split('::', 1) if '::' in key else ('1', key)
+        FROZEN.setdefault('mySmoother' + prefix, dict())[parameter] = value
+    for smoother, params in FROZEN.items():
+        print("FROZEN [{}] ".format(smoother), params)
+
+def freeze(grid, smoother):
+    '''
+    Fix the frozen parameters of a smoother in a ParameterGrid/ParameterSampler dictionary.
+    A frozen distribution stays a distribution (drawing one value), so the sampler
+    keeps drawing with replacement.
+    Parameters:
+        grid(dictionary): {parameter:list or distribution}
+        smoother(string): mySmoother1/3/4
+    Returns:
+        grid(dictionary): {parameter:list or distribution}
+    '''
+    frozen = FROZEN.get(smoother, dict())
+    def fixed(value):
+        return types.SimpleNamespace(rvs=lambda random_state=None: value)
+    return {k: (fixed(frozen[k]) if hasattr(v, 'rvs') else [frozen[k]]) if k in frozen else v for k, v in grid.items()}
+
+def freeze_space(space):
+    '''
+    Fix the frozen parameters in a search space of sample_space.
+    Parameters:
+        space(dictionary): {smoother:{parameter:spec}}
+    Returns:
+        space(dictionary): {smoother:{parameter:spec}}
+    '''
+    frozen_space = dict()
+    for smoother, subspace in space.items():
+        frozen = FROZEN.get(smoother, dict())
+        frozen_space[smoother] = {k: ([frozen[k]] if isinstance(spec, list) else (type(spec[0])(frozen[k]),) * 2)
+                                  if k in frozen else spec for k, spec in subspace.items()}
+    return frozen_space
+
 def get_truncated_normal(mean=1, sd=0.1, low=0.8, upp=1.2):
     '''
     Generate a truncated normal continuous distribution with range.
@@ -268,13 +1653,14 @@ def get_truncated_expon(low=0.7, upp=1.4, sd=0.3):
     '''
     return truncexpon(b=(upp-low)/sd, loc=low, scale=sd)
 
-def random_search_multi(inFile, n_iter, seed):
+def random_search_multi(inFile, n_iter, seed, executor=None):
     '''
     Run experiment with Random Search.
     Parameters:
         inFile(file): the input yaml file
         n_iter(integer): a nonneg integer that represents the current round of iteration
         seed(integer): an integer between 0 and 2**32 - 1 inclusive
+        executor(dictionary): trial executor from make_executor (default: run in place)
     Returns:
         iter_param_dict(dictionary): {#iter:{parameter_to_change:new_value}} where
                                     #iter is the unique iter id for each experiment
@@ -313,6 +1699,9 @@ def random_search_multi(inFile, n_iter, seed):
                     'relaxation: sweeps': SWEEP_4
                    }
 
+    param_grid_1 = freeze(param_grid_1, 'mySmoother1')
+    param_grid_3 = freeze(param_grid_3, 'mySmoother3')
+    param_grid_4 = freeze(param_grid_4, 'mySmoother4')
     grid_1 = ParameterSampler(param_grid_1, n_iter=n_iter, random_state=random_state)
     grid_3 = ParameterSampler(param_grid_3, n_iter=n_iter, random_state=random_state)
     grid_4 = ParameterGrid(param_grid_4)
@@ -346,8 +1735,8 @@ def random_search_multi(inFile, n_iter, seed):
         paramList_4.update(param_4[random_mS4[i]])
         print("[mySmoother4] ", param_4[random_mS4[i]])
 
-        write_yaml(inputDict, inFile)
-        run_sim(i, inFile)
+        submit_sim(executor, i, inputDict, inFile,
+                   {'mySmoother1': param_1[i], 'mySmoother3': param_3[i], 'mySmoother4': param_4[random_mS4[i]]})
         
         iter_param_dict_1.update({str(i):param_1[i]})
         iter_param_dict_3.update({str(i):param_3[i]})
@@ -356,16 +1745,18 @@ def random_search_multi(inFile, n_iter, seed):
         
     print('\n')
     print('################### TOTAL NUM OF CASES: {} ##################'.format(len(param_1)))
-    run_bash('python ctest2json.py')
+    wait_sims(executor)
+    convert_logs(executor)
     return iter_param_dict_1, iter_param_dict_3, iter_param_dict_4
 
-def random_search_single(inFile, n_iter, seed):
+def random_search_single(inFile, n_iter, seed, executor=None):
     '''
     Run experiment with Random Search.
     Parameters:
         inFile(file): the input yaml file
         n_iter(integer): a nonneg integer that represents the current round of iteration
         seed(integer): an integer between 0 and 2**32 - 1 inclusive
+        executor(dictionary): trial executor from make_executor (default: run in place)
     Returns:
         iter_param_dict(dictionary): {#iter:{parameter_to_change:new_value}} where
                                      #iter is the unique iter id for each experiment
@@ -390,6 +1781,7 @@ def random_search_single(inFile, n_iter, seed):
     param_distributions = {'relaxation: damping factor': DAMPING_FACTOR,
                            'relaxation: sweeps': SWEEPS}
 
+    param_distributions = freeze(param_distributions, 'mySmoother1')
     sampler = ParameterSampler(param_distributions,
                                n_iter=n_iter,
                                random_state=random_state)
@@ -407,14 +1799,13 @@ def random_search_single(inFile, n_iter, seed):
                 print('{0}: {1}'.format(key, value))
                 paramList[key] = value
         iter_param_dict.update({str(ite):params})
-        # Write input file
-        write_yaml(inputDict, inFile)
-        # Run yaml input file
-        run_sim(ite, inFile)
+        # Write input file and run it
+        submit_sim(executor, ite, inputDict, inFile, {'mySmoother1': params})
         ite = ite + 1
     print('\n')
     print('################### TOTAL NUM OF CASES: {} ##################'.format(ite))
-    run_bash('python ctest2json.py')
+    wait_sims(executor)
+    convert_logs(executor)
     return iter_param_dict
 
 def get_time_randomsearch(filenames, case):
@@ -431,13 +1822,7 @@ def get_time_randomsearch(filenames, case):
     for each_file in filenames:
         with open(each_file) as f:
             dat = json.load(f)
-            # ensure the test passed to get timer -- otherwise set to arbitrary large
-            if dat.get(case, {}).get('passed') is True:
-                time_linearsolve = dat.get(case, {}).get('timers', {}).get('NOX Total Linear Solve:')
-                time_precondition = dat.get(case, {}).get('timers', {}).get('NOX Total Preconditioner Construction:')
-                time = float(time_linearsolve) + float(time_precondition)
-            else:
-                time = float('inf')
+            time = get_time(dat, case)
             # extract time value and add to dictionary
             # output_num is the current #iter id 
             output_num = each_file.split('-')[-1]
@@ -445,6 +1830,493 @@ def get_time_randomsearch(filenames, case):
             iter_time_dict.update({output_num:time})
     return iter_time_dict
 
+###############################################################################
+def sample_space(space, n, random_state):
+    '''
+    Draw uniform random points from a search space.
+    Parameters:
+        space(dictionary): {smoother:{parameter:spec}} where spec is a list (categorical),
+                           an (int, int) tuple (inclusive integer range) or a
+                           (float, float) tuple (continuous range)
+        n(integer): number of points to draw
+        random_state(RandomState): numpy random state
+    Returns:
+        points(list): [{smoother:{parameter:value}}]
+    '''
+    points = list()
+    for _ in range(n):
+        point = dict()
+        for smoother, subspace in space.items():
+            point[smoother] = dict()
+            for key, spec in subspace.items():
+                if isinstance(spec, list):
+                    value = spec[random_state.randint(len(spec))]
+                elif isinstance(spec[0], int):
+                    value = int(random_state.randint(spec[0], spec[1] + 1))
+                else:
+                    value = float(round(random_state.uniform(spec[0], spec[1]), 4))
+                point[smoother][key] = value
+        points.append(point)
+    return points
+
+def encode_point(space, point):
+    '''
+    Map a point of the search space to the unit hypercube for the surrogate:
+    ranges are scaled to [0, 1] and categories are one-hot encoded.
+    Parameters:
+        space(dictionary): {smoother:{parameter:spec}}, see sample_space
+        point(dictionary): {smoother:{parameter:value}}
+    Returns:
+        x(list): encoded point
+    '''
+    x = list()
+    for smoother, subspace in space.items():
+        for key, spec in subspace.items():
+            value = point[smoother][key]
+            if isinstance(spec, list):
+                x.extend([1.0 if value == option else 0.0 for option in spec])
+            elif spec[1] > spec[0]:
+                x.append((value - spec[0]) / (spec[1] - spec[0]))
+            else:
+                x.append(0.0)
+    return x
+
+def expected_improvement(gp, X, best):
+    '''
+    Expected improvement (for minimization) of candidates over the best time so far.
+    Parameters:
+        gp(GaussianProcessRegressor): fitted surrogate
+        X(array): encoded candidates
+        best(float): best time observed so far
+    Returns:
+        ei(array): expected improvement of each candidate
+    '''
+    mu, sd = gp.predict(X, return_std=True)
+    sd = np.maximum(sd, 1e-9)
+    z = (best - mu) / sd
+    return (best - mu) * norm.cdf(z) + sd * norm.pdf(z)
+
+def propose_points(space, points, times, n, random_state, n_candidates=2000, priors=None, feasibility=None):
+    '''
+    Propose the next points by expected improvement on a Gaussian-process surrogate
+    of the time. A batch of n points is built with the constant liar strategy: each
+    pending point is fed back to the surrogate with the best time so far.
+    With a warm start, the observations of earlier campaigns are fitted together with
+    this campaign's, in z-scores and with a noise growing as their similarity drops.
+    With the failure-region classifier, the expected improvement is weighted by the
+    probability of passing.
+    Parameters:
+        space(dictionary): {smoother:{parameter:spec}}, see sample_space
+        points(list): evaluated points [{smoother:{parameter:value}}]
+        times(list): time of each evaluated point, inf for failed runs
+        n(integer): number of points to propose
+        random_state(RandomState): numpy random state
+        n_candidates(integer): number of random candidates scored per proposal
+        priors(list): earlier campaigns from read_warm_start (default: none)
+        feasibility(dictionary): fitted classifier from fit_feasibility (default: none)
+    Returns:
+        proposals(list): [{smoother:{parameter:value}}]
+    '''
+    finite = [t for t in times if np.isfinite(t)]
+    if len(finite) < 2:
+        return sample_space(space, n, random_state)
+    # failed runs are treated as the slowest run so far
+    X = [encode_point(space, p) for p in points]
+    y = [t if np.isfinite(t) else max(finite) for t in times]
+    noise = [1e-10] * len(y)
+    if priors:
+        y = list((np.array(y) - np.mean(finite)) / (np.std(finite) or 1.0))
+        for prior in priors:
+            similarity = warm_similarity(prior, space, points, times)
+            print("Warm start: {0} ({1} rows), similarity {2:.2f}".format(prior['name'], len(prior['points']), similarity))
+            if similarity < 0.05:
+                continue
+            X = [encode_point(space, p) for p in prior['points']] + X
+            y = list(prior['scores']) + y
+            noise = [(1.0 - similarity) / similarity + 1e-10] * len(prior['points']) + noise
+    best = min(y[len(y) - len(times):])
+    proposals = list()
+    for _ in range(n):
+        kernel = ConstantKernel(1.0) * Matern(length_scale=np.ones(len(X[0])), nu=2.5) + WhiteKernel(1e-2)
+        gp = GaussianProcessRegressor(kernel=kernel, alpha=np.array(noise), normalize_y=True, random_state=random_state)
+        gp.fit(np.array(X), np.array(y))
+        candidates = sample_space(space, n_candidates, random_state)
+        ei = expected_improvement(gp, np.array([encode_point(space, c) for c in candidates]), best)
+        if feasibility is not None:
+            ei = ei * (1.0 - fail_probability(feasibility, [flatten_params(c) for c in candidates]))
+        proposal = candidates[int(np.argmax(ei))]
+        proposals.append(proposal)
+        X.append(encode_point(space, proposal))
+        y.append(best)
+        noise.append(1e-10)
+    return proposals
+
+def read_warm_start(filenames, space, similarity=0.5):
+    '''
+    Read the results of earlier campaigns (csv outputs of autotune.py, nightly
+    [case]_hist.csv, or every campaign of a dataset of autotune_dataset.py) as prior
+    observations: the rows whose parameters map to the search space ([N::]parameter
+    columns), with their times as z-scores within each campaign so that other
+    hardware, builds or related cases (np1 vs np12) share one scale.
+    Parameters:
+        filenames(list): csv files of earlier campaigns, or dataset directories
+        space(dictionary): {smoother:{parameter:spec}}, see sample_space
+        similarity(float): weight of a campaign until it can be estimated, see warm_similarity
+    Returns:
+        priors(list): [{'name', 'points', 'scores', 'similarity'}]
+    '''
+    campaigns = list()
+    for filename in filenames:
+        with timed('search'):
+            if os.path.isdir(filename):
+                campaigns.extend(read_dataset_campaigns(filename))
+            else:
+                campaigns.append((filename, pd.read_csv(filename)))
+    priors = list()
+    for filename, df in campaigns:
+        time_column = 'time' if 'time' in df.columns else 'time_NOX'
+        if 'passed' in df.columns:
+            df = df[df['passed'].astype(str) == 'True']
+        points, times = list(), list()
+        for _, row in df.iterrows():
+            point = dict()
+            for smoother, subspace in space.items():
+                point[smoother] = dict()
+                for key, spec in subspace.items():
+                    column = smoother[len('mySmoother'):] + '::' + key
+                    value = row.get(column, row.get(key) if len(space) == 1 else None)
+                    if value is None or pd.isna(value) or (isinstance(spec, list) and value not in spec):
+                        break
+                    point[smoother][key] = value if isinstance(spec, list) else type(spec[0])(value)
+                if len(point[smoother]) < len(subspace):
+                    break
+            else:
+                t = pd.to_numeric(row.get(time_column), errors='coerce')
+                if np.isfinite(t):
+                    points.append(point)
+                    times.append(float(t))
+        if len(times) < 3:
+            print("Warm start: {} has fewer than 3 rows in this search space, skipped".format(filename))
+            continue
+        scores = (np.array(times) - np.mean(times)) / (np.std(times) or 1.0)
+        priors.append({'name': filename, 'points': points, 'scores': list(scores), 'similarity': similarity})
+    return priors
+
+def warm_similarity(prior, space, points, times, min_points=3):
+    '''
+    Similarity of an earlier campaign to this one: the rank correlation between the
+    times measured here and the predictions of a surrogate fitted to the earlier
+    campaign alone (clipped at 0). Its default weight until min_points runs passed.
+    Parameters:
+        prior(dictionary): an earlier campaign from read_warm_start
+        space(dictionary): {smoother:{parameter:spec}}, see sample_space
+        points(list): evaluated points [{smoother:{parameter:value}}]
+        times(list): time of each evaluated point, inf for failed runs
+        min_points(integer): passed runs needed for the estimate
+    Returns:
+        similarity(float): in [0, 1]
+    '''
+    measured = [(p, t) for p, t in zip(points, times) if np.isfinite(t)]
+    if len(measured) < min_points:
+        return prior['similarity']
+    X = np.array([encode_point(space, p) for p in prior['points']])
+    kernel = ConstantKernel(1.0) * Matern(length_scale=np.ones(X.shape[1]), nu=2.5) + WhiteKernel(1e-2)
+    gp = GaussianProcessRegressor(kernel=kernel, normalize_y=True).fit(X, np.array(prior['scores']))
+    predicted = gp.predict(np.array([encode_point(space, p) for p, _ in measured]))
+    rho = spearmanr(predicted, [t for _, t in measured])[0]
+    return 0.0 if np.isnan(rho) else max(0.0, float(rho))
+
+def warm_seeds(priors, space, n):
+    '''
+    The n best points of the earlier campaigns that lie inside the search space,
+    weighted by their similarity, to run first.
+    Parameters:
+        priors(list): earlier campaigns from read_warm_start
+        space(dictionary): {smoother:{parameter:spec}}, see sample_space
+        n(integer): number of seeds
+    Returns:
+        seeds(list): [{smoother:{parameter:value}}]
+    '''
+    def inside(point):
+        return all(isinstance(spec, list) or spec[0] <= point[smoother][key] <= spec[1]
+                   for smoother, subspace in space.items() for key, spec in subspace.items())
+    ranked = sorted((score / max(prior['similarity'], 1e-3), i, point) for prior in priors
+                    for i, (point, score) in enumerate(zip(prior['points'], prior['scores'])) if inside(point))
+    seeds = list()
+    for _, _, point in ranked:
+        if point not in seeds:
+            seeds.append(point)
+        if len(seeds) == n:
+            break
+    return seeds
+
+###############################################################################
+
+def get_objective(record, name):
+    '''
+    Return one objective of a run.
+    Parameters:
+        record(dictionary): ctest json record of the case {'passed', 'timers', ...}
+        name(string): objective expression, see compile_objective (i.e. 'total' or 'Albany: Setup Time:')
+    Returns:
+        value(float): the objective, inf if the test did not pass or a timer is missing
+    '''
+    return float(objective_values(compile_objective(name), [record])[0])
+
+# Objective minimized by every search (--objective): the time of a run, see get_time
+PRIMARY = {'objective': compile_objective('nox')}
+
+def propose_points_pareto(space, points, values, n, random_state, n_candidates=2000, kappa=1.0, feasibility=None):
+    '''
+    Propose the next points by hypervolume improvement: one Gaussian-process
+    surrogate per objective, and each candidate is scored by how much its lower
+    confidence bound (mean - kappa * std) would grow the hypervolume of the current
+    front. Pending points of a batch are added to the front at their predicted mean.
+    With the failure-region classifier, the improvement is weighted by the probability
+    of passing.
+    Parameters:
+        space(dictionary): {smoother:{parameter:spec}}, see sample_space
+        points(list): evaluated points [{smoother:{parameter:value}}]
+        values(list): objective vector of each evaluated point, inf for failed runs
+        n(integer): number of points to propose
+        random_state(RandomState): numpy random state
+        n_candidates(integer): number of random candidates scored per proposal
+        kappa(float): weight of the surrogate std in the lower confidence bound
+        feasibility(dictionary): fitted classifier from fit_feasibility (default: none)
+    Returns:
+        proposals(list): [{smoother:{parameter:value}}]
+    '''
+    finite = [i for i, v in enumerate(values) if np.all(np.isfinite(v))]
+    if len(finite) < 2:
+        return sample_space(space, n, random_state)
+    X = np.array([encode_point(space, points[i]) for i in finite])
+    Y = np.array([values[i] for i in finite], dtype=float)
+    ref = Y.max(axis=0) + 0.1 * (Y.max(axis=0) - Y.min(axis=0)) + 1e-9
+    gps = list()
+    for k in range(Y.shape[1]):
+        kernel = ConstantKernel(1.0) * Matern(length_scale=np.ones(X.shape[1]), nu=2.5) + WhiteKernel(1e-2)
+        gp = GaussianProcessRegressor(kernel=kernel, normalize_y=True, random_state=random_state)
+        gps.append(gp.fit(X, Y[:, k]))
+    front = [list(Y[i]) for i in pareto_front(list(Y))]
+    proposals = list()
+    for _ in range(n):
+        candidates = sample_space(space, n_candidates, random_state)
+        C = np.array([encode_point(space, c) for c in candidates])
+        predictions = [gp.predict(C, return_std=True) for gp in gps]
+        mean = np.column_stack([mu for mu, sd in predictions])
+        lcb = np.column_stack([mu - kappa * sd for mu, sd in predictions])
+        base = hypervolume(front, ref)
+        hvi = np.array([hypervolume(front + [list(l)], ref) - base for l in lcb])
+        if feasibility is not None:
+            hvi = hvi * (1.0 - fail_probability(feasibility, [flatten_params(c) for c in candidates]))
+        if hvi.max() > 0:
+            best = int(np.argmax(hvi))
+        else: # every candidate is dominated: closest to the front after scaling
+            best = int(np.argmin(((lcb - Y.min(axis=0)) / (ref - Y.min(axis=0))).sum(axis=1)))
+        proposals.append(candidates[best])
+        front = front + [list(mean[best])]
+        front = [front[i] for i in pareto_front(front)]
+    return proposals
+
+def get_trial_objectives(iter, case, objectives):
+    '''
+    Return the objective vector of a single finished trial.
+    Parameters:
+        iter(integer): represents iteration
+        case(string): a string that represents the targeted casename from output
+        objectives(list): objective expressions, see compile_objective
+    Returns:
+        values(list): one value per objective, inf if the run failed
+    '''
+    if not os.path.isfile('ctest-' + str(iter) + '.json'): # unless served from the cache
+        convert_log(iter)
+    with open('ctest-' + str(iter) + '.json') as f:
+        record = json.load(f).get(case, {})
+    return [get_objective(record, name) for name in objectives]
+
+def report_pareto(executor, objectives, rule, yaml_filename):
+    '''
+    Write the Pareto front of the session to [input_yaml]_pareto.csv and promote one
+    configuration of it to [input_yaml]_Best.yaml by the trade-off rule. Repeated
+    rounds of a case are reduced to the median of each objective.
+    Parameters:
+        executor(dictionary): trial executor with a results log
+        objectives(list): objective expressions, see compile_objective
+        rule(string): trade-off rule, see choose_trade_off
+        yaml_filename(string): the input yaml file name
+    '''
+    samples = dict()
+    params = dict()
+    records = executor['results']['records']
+    table = np.column_stack([objective_values(compile_objective(name), records) for name in objectives])
+    for record, row in zip(records, table):
+        samples.setdefault(record['iter'], list()).append(list(row))
+        params[record['iter']] = record['params']
+    iters = list(samples)
+    values = [list(np.median(np.array(samples[k]), axis=0)) for k in iters]
+    front = pareto_front(values)
+    if not front:
+        print("No passed trial: no Pareto front")
+        return
+    promoted = front[choose_trade_off([values[i] for i in front], rule)]
+    rows = list()
+    for i in front:
+        row = {'iter_id': iters[i]}
+        for smoother, smoother_params in params[iters[i]].items():
+            row.update({smoother + '::' + key: value for key, value in smoother_params.items()})
+        row.update(dict(zip(objectives, values[i])))
+        row['promoted'] = (i == promoted)
+        rows.append(row)
+    pareto_df = pd.DataFrame.from_records(rows).sort_values(by=objectives[0])
+    print('######################## PARETO FRONT ########################')
+    print(pareto_df)
+    pareto_df.to_csv(os.path.splitext(yaml_filename)[0] + str('_pareto.csv'), index=False)
+    yaml_promoted = yaml_filename.split('.')[0] + '_' + iters[promoted] + '.' + yaml_filename.split('.')[1]
+    yaml_best = yaml_filename.split('.')[0] + '_Best.' + yaml_filename.split('.')[1]
+    if os.path.isfile(yaml_promoted):
+        shutil.copy(yaml_promoted, yaml_best)
+    print("PROMOTED ({0}): CASE {1} -> {2}".format(rule, iters[promoted], yaml_best))
+
+def get_trial_time(iter, case):
+    '''
+    Return the time of a single finished trial, converting the logs to json if
+    the trial was not ingested into a results log.
+    Parameters:
+        iter(integer): represents iteration
+        case(string): a string that represents the targeted casename from output
+    Returns:
+        time(float): NOX linear solve + preconditioner time, inf if the run failed
+    '''
+    if not os.path.isfile('ctest-' + str(iter) + '.json'): # unless served from the cache
+        convert_log(iter)
+    return get_time_randomsearch(['ctest-' + str(iter) + '.json'], case)[str(iter)]
+
+def bo_search(inFile, space, n_iter, seed, case, executor=None, objectives=None, warm=None):
+    '''
+    Run experiment with Bayesian Optimization: after a few random trials, each
+    new trial is picked by expected improvement on a surrogate fitted to all
+    previous times, or by hypervolume improvement with more than one objective.
+    With a parallel executor one batch of points runs at a time. With a warm start,
+    the best points of earlier campaigns run first and their results join the surrogate.
+    Parameters:
+        inFile(file): the input yaml file
+        space(dictionary): {smoother:{parameter:spec}}, see sample_space
+        n_iter(integer): total number of trials
+        seed(integer): an integer between 0 and 2**32 - 1 inclusive
+        case(string): a string that represents the targeted casename from output
+        executor(dictionary): trial executor from make_executor (default: run in place)
+        objectives(list): objective names for the multi-objective mode, see get_objective
+        warm(dictionary): {'files': csv of earlier campaigns, 'similarity': default weight} (default: cold start)
+    Returns:
+        iter_param_dicts(dictionary): {smoother:{#iter:{parameter_to_change:new_value}}}
+    '''
+    # Read input file
+    inputDict = read_yaml(inFile)
+
+    # Extract MueLu dictionary
+    linsolDict = inputDict['ANONYMOUS']['Piro']['NOX']['Direction']['Newton']['Stratimikos Linear Solver']
+    muDict = linsolDict['Stratimikos']['Preconditioner Types']['MueLu']
+
+    # Define Random State with the Mersenne Twister pseudo-random number generator
+    random_state = np.random.RandomState(seed)
+    space = freeze_space(space)
+
+    batch = executor['jobs'] if executor else 1
+    n_init = min(n_iter, max(5, batch)) # random trials before the surrogate takes over
+
+    pareto = objectives is not None and len(objectives) > 1
+    priors = read_warm_start(warm['files'], space, warm['similarity']) if warm else list()
+    seeds = list()
+    if priors:
+        # the surrogate starts from the earlier campaigns: fewer trials before it takes over,
+        # the first half of them the best points found before
+        n_init = min(n_iter, max(3, batch))
+        seeds = warm_seeds(priors, space, (n_init + 1) // 2)
+        print("Warm start: {0} earlier campaigns, {1} seed points".format(len(priors), len(seeds)))
+    points = list()
+    times = list()
+    values = list() # objective vectors in the multi-objective mode
+    ite = 0 # current #iter id
+    while ite < n_iter:
+        if ite < n_init:
+            proposals = seeds[ite:n_init][:batch]
+            proposals = proposals + sample_space(space, min(batch, n_init - ite) - len(proposals), random_state)
+        else:
+            with timed('search', name='propose_points'):
+                feasibility = feasibility_model(executor)
+                if pareto:
+                    proposals = propose_points_pareto(space, points, values, min(batch, n_iter - ite), random_state,
+                                                      feasibility=feasibility)
+                else:
+                    proposals = propose_points(space, points, times, min(batch, n_iter - ite), random_state,
+                                               priors=priors, feasibility=feasibility)
+        first = ite
+        for point in proposals:
+            print('\n')
+            print("########################## CASE {} ##########################".format(ite))
+            for smoother, params in point.items():
+                muDict['Factories'][smoother]['ParameterList'].update(params)
+                print("[{}] ".format(smoother), params)
+            submit_sim(executor, ite, inputDict, inFile, point)
+            ite = ite + 1
+        wait_sims(executor)
+        for i, point in enumerate(proposals, first):
+            points.append(point)
+            times.append(get_trial_time(i, case))
+            if pareto:
+                values.append(get_trial_objectives(i, case, objectives))
+        update_cache(executor)
+    print('\n')
+    print('################### TOTAL NUM OF CASES: {} ##################'.format(ite))
+    iter_param_dicts = {smoother: {str(i): dict(point[smoother]) for i, point in enumerate(points)} for smoother in space}
+    return iter_param_dicts
+
+def bo_search_multi(inFile, n_iter, seed, case, executor=None, objectives=None, warm=None):
+    '''
+    Run Bayesian Optimization on mySmoother1/3/4.
+    Parameters:
+        inFile(file): the input yaml file
+        n_iter(integer): total number of trials
+        seed(integer): an integer between 0 and 2**32 - 1 inclusive
+        case(string): a string that represents the targeted casename from output
+        executor(dictionary): trial executor from make_executor (default: run in place)
+        objectives(list): objective names for the multi-objective mode, see get_objective
+        warm(dictionary): warm start from earlier campaigns, see bo_search
+    Returns:
+        iter_param_dict(dictionary): {#iter:{parameter_to_change:new_value}} for each smoother
+    '''
+    TYPE = ['Two-stage Gauss-Seidel', 'MT Gauss-Seidel']
+    space = {'mySmoother1': {'relaxation: type': TYPE,
+                             'relaxation: sweeps': (1, 2),
+                             'relaxation: inner damping factor': (0.1, 0.7)},
+             'mySmoother3': {'relaxation: type': TYPE,
+                             'relaxation: sweeps': (1, 2),
+                             'relaxation: damping factor': (0.4, 1.2)},
+             'mySmoother4': {'relaxation: type': TYPE,
+                             'relaxation: sweeps': (1, 4)}
+            }
+    iter_param_dicts = bo_search(inFile, space, n_iter, seed, case, executor, objectives, warm)
+    return iter_param_dicts['mySmoother1'], iter_param_dicts['mySmoother3'], iter_param_dicts['mySmoother4']
+
+def bo_search_single(inFile, n_iter, seed, case, executor=None, objectives=None, warm=None):
+    '''
+    Run Bayesian Optimization on mySmoother1.
+    Parameters:
+        inFile(file): the input yaml file
+        n_iter(integer): total number of trials
+        seed(integer): an integer between 0 and 2**32 - 1 inclusive
+        case(string): a string that represents the targeted casename from output
+        executor(dictionary): trial executor from make_executor (default: run in place)
+        objectives(list): objective names for the multi-objective mode, see get_objective
+        warm(dictionary): warm start from earlier campaigns, see bo_search
+    Returns:
+        iter_param_dict(dictionary): {#iter:{parameter_to_change:new_value}}
+    '''
+    space = {'mySmoother1': {'relaxation: damping factor': (0.8, 1.2),
+                             'relaxation: sweeps': (1, 1)}
+            }
+    return bo_search(inFile, space, n_iter, seed, case, executor, objectives, warm)['mySmoother1']
+
 ###############################################################################
 def get_casename(yamlfile):
     '''
@@ -477,7 +2349,7 @@ def innerdict_namecheck(count, dic):
             new_dict[key] = value
     return new_dict
 
-def dict_to_df_multi(param_dict_1, param_dict_3, param_dict_4, time_dict):
+def dict_to_df_multi(param_dict_1, param_dict_3, param_dict_4, time_dict, extra_dicts=None):
     '''
     Match and merge two dictionaries (params/time) into one pandas dataframe. 
     The keys for each dictionary, #iter, represent the unique iter id's 
@@ -485,6 +2357,7 @@ def dict_to_df_multi(param_dict_1, param_dict_3, param_dict_4, time_dict):
     Parameters:
         param_dict(dictionary): {#iter:{parameter_to_change:new_value}}
         time_dict(dictionary): {#iter:Albany_Total_Time}
+        extra_dicts(dictionary): {column:{#iter:value}} extra columns after time, i.e. reps
     Returns:
         df(dataframe): pandas dataframe
     '''
@@ -500,6 +2373,8 @@ def dict_to_df_multi(param_dict_1, param_dict_3, param_dict_4, time_dict):
             param_dict_1[key].update(param_dict_4[key])
     for key, val in param_dict_1.items():
         param_dict_1[key]['time'] = time_dict[key]
+        for column, extra_dict in (extra_dicts or dict()).items():
+            param_dict_1[key][column] = extra_dict.get(key)
     sorted_dict = sorted(param_dict_1.items(), key = lambda val: (val[1]["time"]))
     list_to_pd = list()
     for sorted_dic in sorted_dict:
@@ -508,7 +2383,7 @@ def dict_to_df_multi(param_dict_1, param_dict_3, param_dict_4, time_dict):
     df = pd.DataFrame.from_dict(list_to_pd)
     return df
 
-def dict_to_df_single(param_dict, time_dict):
+def dict_to_df_single(param_dict, time_dict, extra_dicts=None):
     '''
     Match and merge two dictionaries (params/time) into one pandas dataframe.
     The keys for each dictionary, #iter, represent the unique iter id's
@@ -516,6 +2391,7 @@ def dict_to_df_single(param_dict, time_dict):
     Parameters:
         param_dict(dictionary): {#iter:{parameter_to_change:new_value}}
         time_dict(dictionary): {#iter:Albany_Total_Time}
+        extra_dicts(dictionary): {column:{#iter:value}} extra columns after time, i.e. reps
     Returns:
         df(dataframe): pandas dataframe
     '''
@@ -523,6 +2399,8 @@ def dict_to_df_single(param_dict, time_dict):
     #print(time_dict)
     for key, val in param_dict.items():
         param_dict[key]['time'] = time_dict[key]
+        for column, extra_dict in (extra_dicts or dict()).items():
+            param_dict[key][column] = extra_dict.get(key)
     sorted_dict = sorted(param_dict.items(), key = lambda val: (val[1]["time"]))
     list_to_pd = list()
     for sorted_dic in sorted_dict:
@@ -534,7 +2412,8 @@ def dict_to_df_single(param_dict, time_dict):
 def remove_files(yaml_filename):
     '''
     Remove previously-generated files: [input_yaml]_[#iter_id].yaml, *.log, ctest-*.json 
-    from the current directory.
+    and trial_[#iter_id] sandboxes from the current directory. The results log and the
+    copies of the finished trials in autotune_runs/[run_id] are kept.
     Parameters:
         yaml_filename(string): the input yaml file name
     '''
@@ -547,6 +2426,8 @@ def remove_files(yaml_filename):
             os.remove(filePath)
         except OSError:
             print("Error while deleting file") 
+    for sandbox in glob.glob('trial_*', recursive=False) + glob.glob('json_*', recursive=False):
+        shutil.rmtree(sandbox, ignore_errors=True)
 
 ###############################################################################
 if __name__ == "__main__":
@@ -559,7 +2440,68 @@ if __name__ == "__main__":
     parser.add_argument("yaml_input_file", type=str,
                     help="YAML input filename (with .yaml extension)")
     parser.add_argument("searching_algorithm", type=str,
-                    help="Searching algorithm (grid-single/grid-multi/random-single/random-multi)")
+                    help="Searching algorithm (grid-single/grid-multi/random-single/random-multi/bo-single/bo-multi), "
+                         "status to print the best result so far of the running/last sweep, or rescore to rank "
+                         "the results log under --objective without running anything")
+    parser.add_argument("--jobs", type=int, default=1,
+                    help="Number of trials to run at once, each in its own sandbox (default: 1)")
+    parser.add_argument("--slots", type=str, nargs='+',
+                    help="Worker slots, one per concurrent trial: core sets for taskset (0-3 4-7) or devices (gpu:0 gpu:1)")
+    parser.add_argument("--backend", type=str, choices=['serial', 'pool', 'slurm'],
+                    help="Where trials run: serial (in place), pool (local sandboxes, --jobs at once) or slurm (sandboxes "
+                         "submitted with sbatch, --jobs batch jobs queued at once) (default: serial, pool with --jobs/--slots)")
+    parser.add_argument("--sbatch-options", type=str, default='',
+                    help="Slurm only: options of each batch job, i.e. \"-N1 -p k80 --time=0:30:00\"")
+    parser.add_argument("--pack", type=int, default=1,
+                    help="Slurm only: trials run one after another in each batch job (default: 1)")
+    parser.add_argument("--slurm-poll", type=float, default=10.0,
+                    help="Slurm only: seconds between two squeue polls (default: 10)")
+    parser.add_argument("--halving", type=float,
+                    help="Grid search only: after each round keep the fastest 1/HALVING of the cases (i.e. 2)")
+    parser.add_argument("--racing", action='store_true',
+                    help="Grid search only: after 3 rounds, only cases whose confidence interval overlaps the best one get more rounds")
+    parser.add_argument("--confidence", type=float, default=0.95,
+                    help="Confidence level of the racing intervals (default: 0.95)")
+    parser.add_argument("--cache", type=str,
+                    help="Trial cache (.json): serve configurations already measured on the same build instead of running them")
+    parser.add_argument("--cache-samples", action='store_true',
+                    help="Run every trial and use cached results as extra samples for the median")
+    parser.add_argument("--objective", type=str, default='nox',
+                    help="Objective minimized by every search: an expression over timers, i.e. \"total\", "
+                         "\"'Albany Total Time:' - setup\" or \"max(nox, 0.5 * total)\" (default: nox, NOX linear "
+                         "solve + preconditioner construction)")
+    parser.add_argument("--objectives", type=str, nargs='+', default=['nox'],
+                    help="Objectives to minimize (nox, total, setup, fill, a timer name or an expression); with more than one, "
+                         "the Pareto front is written and BO proposes by hypervolume improvement (default: nox)")
+    parser.add_argument("--trade-off", type=str, default='knee',
+                    help="Rule promoting one configuration of the Pareto front: knee, weights:w1,w2 or within:P (default: knee)")
+    parser.add_argument("--mesh-cache", type=str,
+                    help="Shared directory of populated meshes, keyed by their sources and build")
+    parser.add_argument("--warm-start", type=str, nargs='+',
+                    help="BO only: results of earlier campaigns (.csv, e.g. output/output_0517-0/*.csv or a nightly "
+                         "_hist.csv) used as seed points and prior observations")
+    parser.add_argument("--timeout", type=int, default=90,
+                    help="Timeout of each trial in seconds (default: 90)")
+    parser.add_argument("--timeout-factor", type=float,
+                    help="Kill a trial after TIMEOUT_FACTOR x the wall time of the best trial so far (i.e. 2), or once its "
+                         "objective timers pass the best time; killed trials keep a lower bound of their time")
+    parser.add_argument("--freeze", type=str,
+                    help="Freeze file of autotune_importance.py: parameters fixed at their best values")
+    parser.add_argument("--feasibility", type=float,
+                    help="Skip trials a classifier of the passed/failed trials of the results log (same architecture) predicts "
+                         "to fail with a probability above FEASIBILITY (i.e. 0.8); BO weights its candidates by the "
+                         "probability of passing, and the infeasible regions are written to [input]_infeasible.json")
+    parser.add_argument("--run-id", type=str,
+                    help="Id of the run: its journal and the files of its finished trials are kept in autotune_runs/RUN_ID "
+                         "(default: date and process id)")
+    parser.add_argument("--resume", type=str,
+                    help="Continue the interrupted run RESUME with its journaled inputs, options and random state; "
+                         "finished trials are not run again")
+    parser.add_argument("--warm-similarity", type=float, default=0.5,
+                    help="Weight of the earlier campaigns until their similarity is estimated from 3 runs (default: 0.5)")
+    parser.add_argument("--trace", type=str,
+                    help="Write a Chrome trace (.json, for chrome://tracing or ui.perfetto.dev) of the session: a span "
+                         "for each round, trial and tuner phase, tagged with the #iter id and parameters")
     args = parser.parse_args()
     yaml_filename = args.yaml_input_file
     algo = args.searching_algorithm
@@ -568,76 +2510,212 @@ if __name__ == "__main__":
     if not yaml_filename.endswith('.yaml'):
         parser.print_help()
         raise ValueError("The 2nd argument should be .yaml format, i.e. $python autotune.py file.yaml grid-single")
-    if algo not in ["grid-single", "grid-multi", "random-single", "random-multi"]:
+    results_filename = os.path.splitext(yaml_filename)[0] + str('_results.jsonl')
+    if algo == "status":
+        print_status(results_filename)
+        sys.exit(0)
+    if algo == "rescore":
+        rescore_results(results_filename, compile_objective(args.objective),
+                        os.path.splitext(yaml_filename)[0] + str('_rescored.csv'))
+        sys.exit(0)
+    if args.trace:
+        TRACE['file'] = args.trace
+        atexit.register(write_trace)
+    if algo not in ["grid-single", "grid-multi", "random-single", "random-multi", "bo-single", "bo-multi"]:
+        parser.print_help()
+        raise ValueError("The 3rd argument should be chosen from 6 available options, i.e. $python autotune.py file.yaml grid-single")
+    if args.resume and args.run_id and args.resume != args.run_id:
+        parser.print_help()
+        raise ValueError("--run-id and --resume name different runs")
+    # check every option before open_run writes the run directory and its journal
+    if args.halving is not None and args.halving <= 1:
+        parser.print_help()
+        raise ValueError("--halving should be greater than 1, i.e. --halving 2")
+    if args.halving and args.racing:
+        parser.print_help()
+        raise ValueError("--halving and --racing can not be used together")
+    for name in [args.objective] + args.objectives:
+        compile_objective(name) # raises on an unsupported expression
+    if args.warm_start and not algo.startswith("bo-"):
+        parser.print_help()
+        raise ValueError("--warm-start is used by bo-single/bo-multi")
+    if args.backend == 'slurm' and args.slots:
+        parser.print_help()
+        raise ValueError("--slots pins local workers, the slurm backend gets its resources from --sbatch-options")
+    if args.pack < 1:
         parser.print_help()
-        raise ValueError("The 3rd argument should be chosen from 4 available options, i.e. $python autotune.py file.yaml grid-single")
+        raise ValueError("--pack should be at least 1")
+    if args.timeout_factor is not None and args.timeout_factor <= 1:
+        parser.print_help()
+        raise ValueError("--timeout-factor should be greater than 1, i.e. --timeout-factor 2")
+    if args.feasibility is not None and not 0 < args.feasibility < 1:
+        parser.print_help()
+        raise ValueError("--feasibility should be between 0 and 1, i.e. --feasibility 0.8")
+    run_id = args.resume or args.run_id or time.strftime('%Y%m%d-%H%M%S') + '-' + str(os.getpid())
+    if os.sep in run_id:
+        raise ValueError("The run id can not contain {}".format(os.sep))
+    journal = open_run(run_id, yaml_filename, algo, {key: vars(args)[key] for key in RUN_OPTIONS}, args.resume is not None)
+    for key in RUN_OPTIONS:
+        setattr(args, key, journal['options'].get(key, getattr(args, key))) # options added after the run started
+    PRIMARY['objective'] = compile_objective(args.objective)
+    warm = {'files': args.warm_start, 'similarity': args.warm_similarity} if args.warm_start else None
 
     print("YAML INPUT FILENAME: ", yaml_filename) 
     print("SEARCHING ALGORITHM: ", algo)
     casename = get_casename(yaml_filename)
+    SLURM.update({'options': args.sbatch_options, 'pack': args.pack if args.backend == 'slurm' else 1, 'poll': args.slurm_poll})
+    executor = make_executor(args.jobs, args.slots, args.backend)
+    if args.resume:
+        RUN['finished'] = load_finished(results_filename, run_id)
+    executor['results'] = open_results(results_filename, casename, run_id)
+    if args.cache:
+        executor['cache'] = load_cache(args.cache, casename, args.cache_samples)
+    MESH['cache'] = args.mesh_cache
+    if args.freeze:
+        load_freeze(args.freeze)
+    WATCHDOG.update({'timeout': args.timeout, 'factor': args.timeout_factor})
+    if args.feasibility is not None:
+        FEASIBILITY['threshold'] = args.feasibility
+        if os.path.isfile(results_filename):
+            FEASIBILITY['history'] = [record for record in read_results(results_filename, '*') if record['session'] != run_id]
     pd_output = pd.DataFrame()
 
     # GRID SEARCH
     if algo == "grid-multi":
-        num_simu = int(input("#ROUNDS OF SIMULATIONS (integer>=1): "))
+        num_simu = ask_input('rounds', "#ROUNDS OF SIMULATIONS (integer>=1): ")
         iter_time_dict = dict()
+        active = None # all cases run in the first round
         for i in range(num_simu):
             remove_files(yaml_filename)
             # perform grid search
             print('\n')
             print("####################### SIMULATION {} #######################".format(i))
-            param1, param2, param3 = grid_search_multi(yaml_filename, i)
-            # post process: get timers from generated json files
-            out_filename = glob.glob('ctest-*.json')
-            iter_time_dict = get_time_gridsearch(out_filename, casename, i, iter_time_dict)
-            #print("ITER TIME DICT: ", iter_time_dict)
+            with traced('round ' + str(i), 'round'):
+                param1, param2, param3 = grid_search_multi(yaml_filename, i, executor, active)
+                # post process: get timers from the results log
+                iter_time_dict = get_time_results(executor)
+                #print("ITER TIME DICT: ", iter_time_dict)
+                update_cache(executor)
+            if args.halving and i < num_simu - 1:
+                active = successive_halving(iter_time_dict, active, args.halving)
+            elif args.racing:
+                active = racing(iter_time_dict, active, args.confidence)
+                if len(active) == 1: break # the race is decided
+        for k, samples in cached_samples(executor).items():
+            iter_time_dict[k].extend(samples)
+        iter_rep_dict = {k: len(time_list) for k, time_list in iter_time_dict.items()}
+        iter_ci_dict = {k: confidence_interval(time_list, args.confidence) for k, time_list in iter_time_dict.items()}
+        iter_extra_dict = {'reps': iter_rep_dict}
+        if args.racing:
+            iter_extra_dict['ci_low'] = {k: round(ci[0], 4) for k, ci in iter_ci_dict.items()}
+            iter_extra_dict['ci_high'] = {k: round(ci[1], 4) for k, ci in iter_ci_dict.items()}
         # take median of time from all rounds
         iter_time_dict = {k: statistics.median(time_list) for k, time_list in iter_time_dict.items()}
         # round final digits to 4
         iter_time_dict = {k: round(iter_time_dict[k], 4) for k in iter_time_dict}
         #print("FINAL: ", iter_time_dict)
-        pd_output = dict_to_df_multi(param1, param2, param3, iter_time_dict)
+        with timed('pandas', name='dict_to_df_multi'):
+            pd_output = dict_to_df_multi(param1, param2, param3, iter_time_dict, iter_extra_dict)
     
     elif algo == "grid-single":
-        num_simu = int(input("#ROUNDS OF SIMULATIONS (integer>=1): "))
+        num_simu = ask_input('rounds', "#ROUNDS OF SIMULATIONS (integer>=1): ")
         iter_time_dict = dict()
+        active = None
         for i in range(num_simu):
             remove_files(yaml_filename)
             print('\n')
             print("####################### SIMULATION {} #######################".format(i))
-            param = grid_search_single(yaml_filename, i)
-            out_filename = glob.glob('ctest-*.json')
-            iter_time_dict = get_time_gridsearch(out_filename, casename, i, iter_time_dict)
+            with traced('round ' + str(i), 'round'):
+                param = grid_search_single(yaml_filename, i, executor, active)
+                iter_time_dict = get_time_results(executor)
+                update_cache(executor)
+            if args.halving and i < num_simu - 1:
+                active = successive_halving(iter_time_dict, active, args.halving)
+            elif args.racing:
+                active = racing(iter_time_dict, active, args.confidence)
+                if len(active) == 1: break # the race is decided
+        for k, samples in cached_samples(executor).items():
+            iter_time_dict[k].extend(samples)
+        iter_rep_dict = {k: len(time_list) for k, time_list in iter_time_dict.items()}
+        iter_ci_dict = {k: confidence_interval(time_list, args.confidence) for k, time_list in iter_time_dict.items()}
+        iter_extra_dict = {'reps': iter_rep_dict}
+        if args.racing:
+            iter_extra_dict['ci_low'] = {k: round(ci[0], 4) for k, ci in iter_ci_dict.items()}
+            iter_extra_dict['ci_high'] = {k: round(ci[1], 4) for k, ci in iter_ci_dict.items()}
         iter_time_dict = {k: statistics.median(time_list) for k, time_list in iter_time_dict.items()}
         iter_time_dict = {k: round(iter_time_dict[k], 4) for k in iter_time_dict}
-        pd_output = dict_to_df_single(param, iter_time_dict)
+        with timed('pandas', name='dict_to_df_single'):
+            pd_output = dict_to_df_single(param, iter_time_dict, iter_extra_dict)
 
     # RANDOM SEARCH
     elif algo == "random-multi":
         remove_files(yaml_filename)
-        num_randsearch = int(input("RANDOM SEARCH #ITERS (integer>=1): "))
-        seed = int(input("RANDOM SEARCH SEED (0<=integer<=2**32): "))
+        num_randsearch = ask_input('iters', "RANDOM SEARCH #ITERS (integer>=1): ")
+        seed = ask_input('seed', "RANDOM SEARCH SEED (0<=integer<=2**32): ")
         # perform random search
-        param1, param2, param3 = random_search_multi(yaml_filename, num_randsearch, seed)
-        # post process: get timers from generated json files
-        out_filename = glob.glob('ctest-*.json')
-        iter_time_dict = get_time_randomsearch(out_filename,casename)
-        pd_output = dict_to_df_multi(param1, param2, param3, iter_time_dict)
+        with traced('round 0', 'round'):
+            param1, param2, param3 = random_search_multi(yaml_filename, num_randsearch, seed, executor)
+        # post process: get timers from the results log
+        iter_time_dict = {k: time_list[-1] for k, time_list in get_time_results(executor).items()}
+        update_cache(executor)
+        for k, samples in cached_samples(executor).items():
+            iter_time_dict[k] = statistics.median([iter_time_dict[k]] + samples)
+        with timed('pandas', name='dict_to_df_multi'):
+            pd_output = dict_to_df_multi(param1, param2, param3, iter_time_dict)
 
-    else: # "random-single"
+    elif algo == "random-single":
         remove_files(yaml_filename)
-        num_randsearch = int(input("RANDOM SEARCH #ITERS (integer>=1): "))
-        seed = int(input("RANDOM SEARCH SEED (0<=integer<=2**32): "))
+        num_randsearch = ask_input('iters', "RANDOM SEARCH #ITERS (integer>=1): ")
+        seed = ask_input('seed', "RANDOM SEARCH SEED (0<=integer<=2**32): ")
         # perform random search
-        param = random_search_single(yaml_filename, num_randsearch, seed)
-        # post process: get timers from generated json files
-        out_filename = glob.glob('ctest-*.json')
-        iter_time_dict = get_time_randomsearch(out_filename,casename)
-        pd_output = dict_to_df_single(param, iter_time_dict)
+        with traced('round 0', 'round'):
+            param = random_search_single(yaml_filename, num_randsearch, seed, executor)
+        # post process: get timers from the results log
+        iter_time_dict = {k: time_list[-1] for k, time_list in get_time_results(executor).items()}
+        update_cache(executor)
+        for k, samples in cached_samples(executor).items():
+            iter_time_dict[k] = statistics.median([iter_time_dict[k]] + samples)
+        with timed('pandas', name='dict_to_df_single'):
+            pd_output = dict_to_df_single(param, iter_time_dict)
+
+    # BAYESIAN OPTIMIZATION
+    elif algo == "bo-multi":
+        remove_files(yaml_filename)
+        num_bo = ask_input('iters', "BAYESIAN OPTIMIZATION #ITERS (integer>=1): ")
+        seed = ask_input('seed', "BAYESIAN OPTIMIZATION SEED (0<=integer<=2**32): ")
+        with traced('round 0', 'round'):
+            param1, param2, param3 = bo_search_multi(yaml_filename, num_bo, seed, casename, executor, args.objectives, warm)
+        # post process: get timers from the results log
+        iter_time_dict = {k: time_list[-1] for k, time_list in get_time_results(executor).items()}
+        update_cache(executor)
+        for k, samples in cached_samples(executor).items():
+            iter_time_dict[k] = statistics.median([iter_time_dict[k]] + samples)
+        with timed('pandas', name='dict_to_df_multi'):
+            pd_output = dict_to_df_multi(param1, param2, param3, iter_time_dict)
+
+    else: # "bo-single"
+        remove_files(yaml_filename)
+        num_bo = ask_input('iters', "BAYESIAN OPTIMIZATION #ITERS (integer>=1): ")
+        seed = ask_input('seed', "BAYESIAN OPTIMIZATION SEED (0<=integer<=2**32): ")
+        with traced('round 0', 'round'):
+            param = bo_search_single(yaml_filename, num_bo, seed, casename, executor, args.objectives, warm)
+        # post process: get timers from the results log
+        iter_time_dict = {k: time_list[-1] for k, time_list in get_time_results(executor).items()}
+        update_cache(executor)
+        for k, samples in cached_samples(executor).items():
+            iter_time_dict[k] = statistics.median([iter_time_dict[k]] + samples)
+        with timed('pandas', name='dict_to_df_single'):
+            pd_output = dict_to_df_single(param, iter_time_dict)
 
     # get parameters with corresponding time in ascending order
     #pd_output = dict_to_df_multi(param1, param2, param3, iter_time_dict)
     print(pd_output)
     csv_out_str = os.path.splitext(yaml_filename)[0] + str('.csv')
     #print(csv_out_str)
-    pd_output.to_csv(csv_out_str, index=False)
+    with timed('pandas', name='to_csv'):
+        pd_output.to_csv(csv_out_str, index=False)
+    if len(args.objectives) > 1:
+        report_pareto(executor, args.objectives, args.trade_off, yaml_filename)
+    if args.feasibility is not None:
+        report_feasibility(os.path.splitext(yaml_filename)[0] + str('_infeasible.json'), executor)
+    report_ledger(os.path.splitext(yaml_filename)[0] + str('_ledger.json'), executor)
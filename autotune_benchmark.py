@@ -0,0 +1,541 @@
+#!/usr/bin/env python3
+# Benchmark of the search strategies of autotune.py without Albany: each strategy runs
+# against a stand-in ctest (this file, called through a link named ctest) whose
+# timers come from a synthetic objective or from a replay of recorded campaigns, and
+# its best-so-far regret is reported against the trial count and the tuner wall time.
+#
+# $ python autotune_benchmark.py
+# $ python autotune_benchmark.py --strategies "grid-multi --halving 2" random-multi bo-multi --seeds 0 1 2
+# $ python autotune_benchmark.py --replay output/output_0517-0/*.csv --strategies grid-multi bo-multi
+# $ python autotune_benchmark.py --objective my_objective.json --trials 30
+#
+# Synthetic objective (--objective, see SYNTHETIC): base time plus a quadratic term per
+# numeric parameter and a penalty per category, noise whose sd grows with the time,
+# and failure regions (every condition of a region holds: the test fails). Parameters
+# are named [smoother]::[parameter], i.e. "mySmoother3::relaxation: damping factor".
+# Replay objective (--replay): output csvs of autotune.py, nightly _hist.csv or
+# _hist.sqlite; a trial gets the time of a recorded run of the nearest recorded
+# configuration. The regret of a trial is the noise-free time of the best configuration
+# measured so far minus the best noise-free time reachable.
+# Writes [output]_curves.csv (one row per trial) and [output]_summary.csv.
+
+# Need: pip install --user pandas
+# Need: pip install --user ruamel.yaml
+
+# Import libraries
+import argparse
+import copy
+import fcntl
+import json
+import math
+import os
+import random
+import re
+import shlex
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from ruamel.yaml import YAML
+
+yaml = YAML(typ='rt')
+yaml.preserve_quotes = True
+yaml.width = 1000
+
+AUTOTUNE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'autotune.py')
+SOURCE_YAML = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'autotune_nightly',
+                           'input_albany_Velocity_MueLuKokkos_Wedge.yaml')
+INPUT = 'input_bench.yaml'
+CASE = 'bench_np1'
+STRATEGIES = ['random-single', 'bo-single', 'random-multi', 'bo-multi']
+FACTORIES = ['ANONYMOUS', 'Piro', 'NOX', 'Direction', 'Newton', 'Stratimikos Linear Solver', 'Stratimikos',
+             'Preconditioner Types', 'MueLu', 'Factories']
+
+# Default synthetic objective: the optima are inside the ranges of the random and
+# BO searches, the grids only reach some of them
+SYNTHETIC = {
+    'base': 10.0,
+    'terms': {'mySmoother1::relaxation: damping factor': {'optimum': 0.95, 'weight': 40.0},
+              'mySmoother1::relaxation: inner damping factor': {'optimum': 0.45, 'weight': 6.0},
+              'mySmoother1::relaxation: sweeps': {'optimum': 1, 'weight': 0.2},
+              'mySmoother1::relaxation: type': {'penalty': {'MT Gauss-Seidel': 0.3}},
+              'mySmoother3::relaxation: damping factor': {'optimum': 0.85, 'weight': 3.0},
+              'mySmoother3::relaxation: sweeps': {'optimum': 1, 'weight': 0.3},
+              'mySmoother3::relaxation: type': {'penalty': {'Two-stage Gauss-Seidel': 0.2}},
+              'mySmoother4::relaxation: sweeps': {'optimum': 3, 'weight': 0.05},
+              'mySmoother4::relaxation: type': {'penalty': {'MT Gauss-Seidel': 0.15}}},
+    'noise': {'sd': 0.02, 'slope': 0.05}, # sd = sd + slope * (time - base)
+    'fail': [{'mySmoother1::relaxation: damping factor': ['>', 1.15]},
+             {'mySmoother3::relaxation: damping factor': ['>', 1.1], 'mySmoother3::relaxation: type': ['==', 'MT Gauss-Seidel']}],
+    'sleep': 0.0 # seconds the stand-in ctest sleeps per second of objective time
+}
+OPERATORS = {'<': lambda a, b: a < b, '<=': lambda a, b: a <= b, '>': lambda a, b: a > b,
+             '>=': lambda a, b: a >= b, '==': lambda a, b: a == b, '!=': lambda a, b: a != b}
+
+###############################################################################
+# Objectives: {'kind': 'synthetic', ...SYNTHETIC} or {'kind': 'replay', 'columns',
+# 'ranges', 'configs', 'times', 'noise'}, written to a json file read by the stand-in ctest
+def flatten_input(inputDict):
+    '''
+    The smoother parameters of an input yaml dictionary.
+    Returns:
+        flat(dictionary): {[smoother]::[parameter]:value}
+    '''
+    factories = inputDict
+    for key in FACTORIES:
+        factories = factories[key]
+    return {smoother + '::' + name: value for smoother, factory in factories.items()
+            for name, value in (factory.get('ParameterList') or dict()).items()}
+
+def in_region(flat, region):
+    '''
+    Whether a configuration satisfies every condition {parameter:[operator, value]} of a failure region.
+    '''
+    for name, (operator, value) in region.items():
+        if name not in flat:
+            return False
+        try:
+            if not OPERATORS[operator](flat[name], value):
+                return False
+        except TypeError: # i.e. a category compared with a number
+            return False
+    return True
+
+def synthetic_time(objective, flat):
+    '''
+    Noise-free time of a configuration under a synthetic objective.
+    Parameters:
+        objective(dictionary): synthetic objective, see SYNTHETIC
+        flat(dictionary): {[smoother]::[parameter]:value}
+    Returns:
+        time(float): inf in a failure region
+    '''
+    if any(in_region(flat, region) for region in objective.get('fail', list())):
+        return float('inf')
+    time = objective['base']
+    for name, term in objective['terms'].items():
+        if name not in flat:
+            continue
+        if 'penalty' in term:
+            time = time + term['penalty'].get(str(flat[name]), 0)
+        else:
+            time = time + term['weight'] * (float(flat[name]) - term['optimum']) ** 2
+    return time
+
+def nearest_config(objective, flat):
+    '''
+    Index of the recorded configuration of a replay objective nearest to a configuration:
+    numeric distances scaled by the recorded range, 1 per differing category or missing value.
+    '''
+    best, best_distance = 0, float('inf')
+    for index, config in enumerate(objective['configs']):
+        distance = 0
+        for name, value in zip(objective['columns'], config):
+            mine = flat.get(name)
+            if value is None or mine is None:
+                distance = distance + (value is not mine)
+            elif name in objective['ranges'] and isinstance(mine, (int, float)) and not isinstance(mine, bool):
+                distance = distance + abs(float(mine) - value) / (objective['ranges'][name] or 1)
+            else:
+                distance = distance + (str(mine) != str(value))
+        if distance < best_distance:
+            best, best_distance = index, distance
+    return best
+
+def true_time(objective, flat):
+    '''
+    Noise-free time of a configuration: the synthetic time, or the median of the
+    recorded runs of the nearest recorded configuration (inf if none of them passed).
+    '''
+    if objective['kind'] == 'synthetic':
+        return synthetic_time(objective, flat)
+    times = [t for t in objective['times'][nearest_config(objective, flat)] if math.isfinite(t)]
+    return statistics.median(times) if times else float('inf')
+
+def measured_time(objective, flat, rng):
+    '''
+    One measurement of a configuration: the noise-free synthetic time plus noise, or a
+    recorded run of the nearest recorded configuration (plus the optional noise).
+    Parameters:
+        objective(dictionary): synthetic or replay objective
+        flat(dictionary): {[smoother]::[parameter]:value}
+        rng(Random): random state of this measurement
+    Returns:
+        time(float): inf if the test fails
+    '''
+    if objective['kind'] == 'synthetic':
+        time, base = synthetic_time(objective, flat), objective['base']
+    else:
+        time = rng.choice(objective['times'][nearest_config(objective, flat)])
+        base = objective['best']
+    if not math.isfinite(time):
+        return time
+    noise = objective.get('noise', dict())
+    sd = noise.get('sd', 0) + noise.get('slope', 0) * max(time - base, 0)
+    return max(time + rng.gauss(0, sd), 0.01 * time)
+
+def optimum(objective, base, searched):
+    '''
+    Best noise-free time reachable by a strategy. Synthetic: the searched parameters at
+    their optimum (or best category), the others at their input values. Replay: the
+    best recorded configuration.
+    Parameters:
+        objective(dictionary): synthetic or replay objective
+        base(dictionary): {[smoother]::[parameter]:value} of the input yaml
+        searched(set): [smoother]::[parameter] names the strategy changes
+    Returns:
+        time(float)
+    '''
+    if objective['kind'] == 'replay':
+        return objective['best']
+    flat = dict(base)
+    for name, term in objective['terms'].items():
+        if name not in searched:
+            continue
+        if 'penalty' in term:
+            flat[name] = min(term['penalty'], key=term['penalty'].get) if min(term['penalty'].values()) < 0 else None
+        else:
+            flat[name] = term['optimum']
+    flat = {name: value for name, value in flat.items() if value is not None}
+    time = synthetic_time(objective, flat)
+    if not math.isfinite(time):
+        raise ValueError("The optimum of the synthetic objective is in a failure region")
+    return time
+
+def read_recordings(filenames, noise=None):
+    '''
+    Build a replay objective from recorded campaigns.
+    Parameters:
+        filenames(list): output csvs of autotune.py ([smoother #]::[parameter] or mySmoother1
+                         parameters), nightly _hist.csv or _hist.sqlite
+        noise(dictionary): {'sd', 'slope'} added to the recorded times (default: none)
+    Returns:
+        objective(dictionary): replay objective, the runs of each configuration grouped
+    '''
+    import pandas as pd # only the suite reads recordings, not the stand-in ctest
+    frames = list()
+    for filename in filenames:
+        if filename.endswith('.sqlite'):
+            conn = sqlite3.connect(filename)
+            rows = conn.execute('SELECT params, time_NOX, passed FROM history WHERE passed IS NOT NULL').fetchall()
+            conn.close()
+            df = pd.DataFrame.from_records([{**json.loads(params), 'time': time if passed else float('inf')}
+                                            for params, time, passed in rows])
+        else:
+            df = pd.read_csv(filename).rename(columns={'time_NOX': 'time'})
+            df['time'] = pd.to_numeric(df['time'], errors='coerce').fillna(float('inf'))
+            if 'passed' in df.columns:
+                df.loc[df['passed'].astype(str) != 'True', 'time'] = float('inf')
+        names = dict()
+        for column in df.columns:
+            if '::' in column:
+                names[column] = 'mySmoother' + column
+            elif column.startswith(('relaxation:', 'chebyshev:')):
+                names[column] = 'mySmoother1::' + column
+        frames.append(df[list(names) + ['time']].rename(columns=names))
+    df = pd.concat(frames, ignore_index=True)
+    columns = [c for c in df.columns if c != 'time']
+    if not columns or not len(df):
+        raise ValueError("No recorded configuration in {}".format(' '.join(filenames)))
+    ranges = dict()
+    for name in columns:
+        values = pd.to_numeric(df[name], errors='coerce')
+        if values.notna().sum() == df[name].notna().sum() and values.notna().any():
+            ranges[name] = float(values.max() - values.min())
+    groups = dict()
+    for _, row in df.iterrows():
+        config = tuple(None if pd.isna(row[name]) else (float(row[name]) if name in ranges else str(row[name]))
+                       for name in columns)
+        groups.setdefault(config, list()).append(float(row['time']))
+    medians = [statistics.median([t for t in times if math.isfinite(t)]) for times in groups.values()
+               if any(math.isfinite(t) for t in times)]
+    if not medians:
+        raise ValueError("No recorded configuration passed in {}".format(' '.join(filenames)))
+    return {'kind': 'replay', 'columns': columns, 'ranges': ranges, 'configs': [list(c) for c in groups],
+            'times': list(groups.values()), 'best': min(medians), 'noise': noise or {'sd': 0, 'slope': 0}}
+
+###############################################################################
+# Stand-in ctest: runs the tests of CTestTestfile.cmake with the given label, each
+# measured on the objective of $AUTOTUNE_BENCHMARK (json file), into LastTest.log
+LOG = '''Start testing: {date}
+----------------------------------------------------------
+1/1 Testing: {name}
+1/1 Test: {name}
+Command: {command}
+Directory: {cwd}
+"{name}" start time: {date}
+Output:
+----------------------------------------------------------
+{output}<end of output>
+Test time = {wall:8.2f} sec
+----------------------------------------------------------
+Test {status}.
+"{name}" end time: {date}
+"{name}" time elapsed: 00:00:00
+----------------------------------------------------------
+
+End testing: {date}
+'''
+
+def albany_output(solve, setup=18.9742, fill=1.51123):
+    '''
+    Albany output of a passed run: build metadata and the Teuchos timer table, the
+    objective time split between the linear solves and the preconditioner construction.
+    '''
+    rows = [('Albany Fill: Jacobian:', 0.52 * fill, 4), ('Albany Fill: Residual:', 0.48 * fill, 5),
+            ('Albany Total Time:', setup + fill + solve + 2.0, 1), ('Albany: Setup Time:', setup, 1),
+            ('Albany: Total Fill Time:', fill, 1), ('NOX Total Linear Solve:', 0.7 * solve, 4),
+            ('NOX Total Preconditioner Construction:', 0.3 * solve, 4)]
+    lines = ['Albany version: benchmark', 'Albany git commit id: benchmark', 'Albany cxx compiler: GNU benchmark',
+             'Trilinos git commit id: benchmark', '=' * 120, '', 'TimeMonitor results over 1 processor', '',
+             'Timer Name' + ' ' * 68 + 'Global time (num calls)', '-' * 120]
+    lines = lines + ['{0:<78}{1:.6g} ({2})'.format(name, value, calls) for name, value, calls in rows]
+    return '\n'.join(lines + ['=' * 120]) + '\n'
+
+def next_call(state):
+    '''
+    Count the measurements of a benchmark run (the noise of each one is seeded by its number).
+    '''
+    with open(os.path.join(state, 'lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        counter = os.path.join(state, 'calls')
+        call = int(open(counter).read()) + 1 if os.path.isfile(counter) else 0
+        with open(counter, 'w') as f:
+            f.write(str(call))
+    return call
+
+def fake_ctest(argv):
+    '''
+    ctest -L LABEL [--timeout T] [-V]
+    '''
+    label = argv[argv.index('-L') + 1] if '-L' in argv else None
+    if label == 'pop':
+        os.makedirs('mesh-pop-wdg', exist_ok=True)
+        with open(os.path.join('mesh-pop-wdg', 'gis_basal_populated.exo'), 'w') as f:
+            f.write('benchmark')
+        print('1/1 Test #1: bench_pop ...   Passed')
+        return
+    filename = os.environ['AUTOTUNE_BENCHMARK']
+    with open(filename) as f:
+        objective = json.load(f)
+    tests, labels = dict(), dict()
+    with open('CTestTestfile.cmake') as f:
+        for line in f:
+            match = re.match(r'\s*add_test\((\S+) (.*)\)\s*$', line)
+            if match:
+                tests[match.group(1)] = re.findall(r'"([^"]*)"', match.group(2))
+            match = re.match(r'\s*set_tests_properties\((\S+) PROPERTIES.*LABELS "([^"]*)"', line)
+            if match:
+                labels[match.group(1)] = match.group(2).split(';')
+    state = os.path.dirname(os.path.abspath(filename))
+    log = ''
+    for name, command in tests.items():
+        if label is not None and label not in labels.get(name, list()):
+            continue
+        with open(command[-1]) as f:
+            flat = flatten_input(YAML(typ='safe').load(f))
+        rng = random.Random('{0}:{1}'.format(objective.get('seed', 0), next_call(state)))
+        time_nox = measured_time(objective, flat, rng)
+        passed = math.isfinite(time_nox)
+        output = albany_output(time_nox) if passed else 'Albany version: benchmark\nMueLu: smoother setup failed\n'
+        if '-V' in argv: # live output for the watchdog of autotune.py
+            sys.stdout.write(''.join('1: ' + line + '\n' for line in output.splitlines()))
+            sys.stdout.flush()
+        time.sleep(objective.get('sleep', 0) * (time_nox if passed else objective.get('base', 0)))
+        log = log + LOG.format(date=time.strftime('%b %d %H:%M %Z'), name=name, cwd=os.getcwd(),
+                               command=' '.join('"{}"'.format(arg) for arg in command), output=output,
+                               wall=time_nox + 22.5 if passed else 1.0, status='Passed' if passed else 'Failed')
+        print('1/1 Test #1: {0} ...   {1}'.format(name, 'Passed' if passed else '***Failed'))
+    os.makedirs(os.path.join('Testing', 'Temporary'), exist_ok=True)
+    with open(os.path.join('Testing', 'Temporary', 'LastTest.log'), 'w') as f:
+        f.write(log)
+
+###############################################################################
+def make_build(directory):
+    '''
+    Build directory of a benchmark run: the nightly input with the three smoothers the
+    multi-smoother strategies tune (mySmoother3 copied from mySmoother1 if missing), and
+    a CTestTestfile.cmake with the tune-gpu test running it.
+    Parameters:
+        directory(string): new directory
+    Returns:
+        base(dictionary): {[smoother]::[parameter]:value} of the input
+    '''
+    os.makedirs(directory)
+    with open(SOURCE_YAML) as f:
+        inputDict = yaml.load(f)
+    factories = inputDict
+    for key in FACTORIES:
+        factories = factories[key]
+    if 'mySmoother3' not in factories:
+        factories.insert(list(factories).index('mySmoother1') + 1, 'mySmoother3', copy.deepcopy(factories['mySmoother1']))
+    with open(os.path.join(directory, INPUT), 'w') as f:
+        yaml.dump(inputDict, f)
+    with open(os.path.join(directory, 'CTestTestfile.cmake'), 'w') as f:
+        f.write('# CMake generated Testfile for {}\n'.format(directory))
+        f.write('add_test({0} "mpiexec" "-np" "1" "Albany" "{1}")\n'.format(CASE, INPUT))
+        f.write('set_tests_properties({0} PROPERTIES  LABELS "tune-gpu" WORKING_DIRECTORY "{1}")\n'.format(CASE, directory))
+    return flatten_input(inputDict)
+
+def run_strategy(strategy, seed, trials, rounds, directory, env):
+    '''
+    Run autotune.py with one strategy in a fresh build directory.
+    Parameters:
+        strategy(string): searching algorithm and its options, i.e. "grid-multi --halving 2"
+        seed(integer): seed of the random and BO searches
+        trials(integer): trials of the random and BO searches
+        rounds(integer): rounds of the grid searches
+        directory(string): new build directory
+        env(dictionary): environment with the stand-in ctest first on the PATH
+    Returns:
+        records(list): results log records of the run, in the order the trials finished
+        start(float): launch time of the tuner
+        base(dictionary): {[smoother]::[parameter]:value} of the input
+    '''
+    base = make_build(directory)
+    algo, options = shlex.split(strategy)[0], shlex.split(strategy)[1:]
+    answers = '{}\n'.format(rounds) if algo.startswith('grid-') else '{0}\n{1}\n'.format(trials, seed)
+    start = time.time()
+    with open(os.path.join(directory, 'tuner.out'), 'w') as out:
+        process = subprocess.run([sys.executable, AUTOTUNE, INPUT, algo] + options + ['--run-id', 'benchmark'],
+                                 cwd=directory, env=env, input=answers, stdout=out, stderr=subprocess.STDOUT,
+                                 universal_newlines=True)
+    if process.returncode != 0:
+        with open(os.path.join(directory, 'tuner.out')) as f:
+            tail = f.read().splitlines()[-20:]
+        raise RuntimeError("autotune.py {0} failed (seed {1}):\n{2}".format(strategy, seed, '\n'.join(tail)))
+    records = list()
+    with open(os.path.join(directory, os.path.splitext(INPUT)[0] + '_results.jsonl')) as f:
+        for line in f:
+            if line.strip() and json.loads(line)['session'] == 'benchmark':
+                records.append(json.loads(line))
+    return records, start, base
+
+def regret_curve(objective, records, start, base):
+    '''
+    Best-so-far regret of a run: after each trial, the incumbent is the configuration
+    with the best measured time, and its regret is its noise-free time minus the best
+    noise-free time reachable by the strategy (see optimum).
+    Parameters:
+        objective(dictionary): synthetic or replay objective
+        records(list): results log records of the run
+        start(float): launch time of the tuner
+        base(dictionary): {[smoother]::[parameter]:value} of the input
+    Returns:
+        curve(list): {'trial', 'wall', 'time', 'best time', 'true time', 'regret'} per trial run
+    '''
+    searched = {smoother + '::' + name for record in records for smoother, params in record['params'].items()
+                for name in params}
+    f_star = optimum(objective, base, searched)
+    curve, incumbent = list(), None
+    for record in records:
+        if record.get('skipped') is not None or record.get('served'):
+            continue
+        measured = record['time'] if record['passed'] and not record.get('censored') else float('inf')
+        if incumbent is None or measured < incumbent[0]:
+            flat = dict(base)
+            flat.update({smoother + '::' + name: value for smoother, params in record['params'].items()
+                         for name, value in params.items()})
+            incumbent = (measured, true_time(objective, flat))
+        curve.append({'trial': len(curve) + 1, 'wall': record.get('finished', start) - start, 'time': measured,
+                      'best time': incumbent[0], 'true time': incumbent[1], 'regret': incumbent[1] - f_star})
+    return curve
+
+def summarize(curves, tolerance):
+    '''
+    Per strategy, averaged over the seeds: trials, tuner wall time, final regret, regret
+    after half of the trials, and trials and wall time until the regret is within tolerance.
+    Parameters:
+        curves(dictionary): {(strategy, seed):curve of regret_curve}
+        tolerance(float): regret counted as solved
+    Returns:
+        rows(list): one dictionary per strategy
+    '''
+    rows = list()
+    for strategy in dict.fromkeys(strategy for strategy, _ in curves):
+        runs = [curve for (name, _), curve in curves.items() if name == strategy and curve]
+        if not runs:
+            continue
+        solved = [next((point for point in curve if point['regret'] <= tolerance), None) for curve in runs]
+        rows.append({'strategy': strategy, 'seeds': len(runs),
+                     'trials': statistics.mean(len(curve) for curve in runs),
+                     'wall (s)': statistics.mean(curve[-1]['wall'] for curve in runs),
+                     'final regret': statistics.mean(curve[-1]['regret'] for curve in runs),
+                     'regret at half': statistics.mean(curve[(len(curve) - 1) // 2]['regret'] for curve in runs),
+                     'solved': sum(point is not None for point in solved),
+                     'trials to solve': statistics.median(point['trial'] for point in solved if point) if any(solved) else None,
+                     'wall to solve (s)': statistics.median(point['wall'] for point in solved if point) if any(solved) else None})
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--strategies", type=str, nargs='+', default=STRATEGIES,
+                        help="searching algorithms of autotune.py, each with its options, i.e. \"grid-multi --halving 2\" "
+                             "(default: {})".format(' '.join(STRATEGIES)))
+    parser.add_argument("--seeds", type=int, nargs='+', default=[0], help="seeds, one run per strategy and seed (default: 0)")
+    parser.add_argument("--trials", type=int, default=20, help="trials of the random and BO searches (default: 20)")
+    parser.add_argument("--rounds", type=int, default=1, help="rounds of the grid searches (default: 1)")
+    parser.add_argument("--objective", type=str, help="synthetic objective (.json) with the keys of SYNTHETIC (default: SYNTHETIC)")
+    parser.add_argument("--replay", type=str, nargs='+',
+                        help="replay recorded campaigns instead: output csvs (output/output_0517-0/*.csv), nightly _hist.csv or _hist.sqlite")
+    parser.add_argument("--replay-noise", type=float, default=0.0, help="sd of the noise added to the replayed times (default: 0)")
+    parser.add_argument("--tolerance", type=float, default=0.05, help="regret counted as solved, in seconds (default: 0.05)")
+    parser.add_argument("--output", type=str, default='benchmark', help="prefix of the output csvs (default: benchmark)")
+    parser.add_argument("--keep", action='store_true', help="keep the build directories of the runs")
+    args = parser.parse_args()
+
+    if args.replay and args.objective:
+        raise ValueError("--objective and --replay can not be used together")
+    if args.replay:
+        objective = read_recordings(args.replay, {'sd': args.replay_noise, 'slope': 0})
+        print("REPLAY: {0} recorded configurations, best median time {1:.4f}".format(len(objective['configs']), objective['best']))
+    else:
+        objective = dict(SYNTHETIC)
+        if args.objective:
+            with open(args.objective) as f:
+                objective.update(json.load(f))
+        objective['kind'] = 'synthetic'
+
+    work = tempfile.mkdtemp(prefix='autotune_benchmark_')
+    bin_dir = os.path.join(work, 'bin')
+    os.makedirs(bin_dir)
+    os.symlink(os.path.abspath(__file__), os.path.join(bin_dir, 'ctest'))
+    curves = dict()
+    try:
+        for strategy in args.strategies:
+            for seed in args.seeds:
+                # each run gets its own objective file: its measurements are counted from 0
+                state = os.path.join(work, 'run_{}'.format(len(curves)))
+                os.makedirs(state)
+                with open(os.path.join(state, 'objective.json'), 'w') as f:
+                    json.dump(dict(objective, seed=seed), f)
+                env = dict(os.environ, PATH=bin_dir + os.pathsep + os.environ.get('PATH', ''),
+                           AUTOTUNE_BENCHMARK=os.path.join(state, 'objective.json'))
+                records, start, base = run_strategy(strategy, seed, args.trials, args.rounds, os.path.join(state, 'build'), env)
+                curves[(strategy, seed)] = regret_curve(objective, records, start, base)
+                curve = curves[(strategy, seed)]
+                print("[{0}, seed {1}] {2} trials in {3:.1f} s, final regret {4:.4f}".format(
+                      strategy, seed, len(curve), curve[-1]['wall'] if curve else 0, curve[-1]['regret'] if curve else float('nan')))
+    finally:
+        if args.keep:
+            print("BUILD DIRECTORIES KEPT IN: {}".format(work))
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+
+    import pandas as pd
+    rows = [dict(point, strategy=strategy, seed=seed) for (strategy, seed), curve in curves.items() for point in curve]
+    columns = ['strategy', 'seed', 'trial', 'wall', 'time', 'best time', 'true time', 'regret']
+    pd.DataFrame(rows, columns=columns).to_csv(args.output + str('_curves.csv'), index=False)
+    summary = pd.DataFrame(summarize(curves, args.tolerance))
+    summary.to_csv(args.output + str('_summary.csv'), index=False)
+    print("REGRET (tolerance {0} s), curves in {1}:".format(args.tolerance, args.output + str('_curves.csv')))
+    print(summary.round(4).to_string(index=False))
+
+if __name__ == "__main__":
+    if os.path.basename(sys.argv[0]) == 'ctest':
+        fake_ctest(sys.argv[1:])
+    else:
+        main()
@@ -0,0 +1,585 @@
+# Code shared by autotune.py and autotune_nightly/autotune_nightly.py: the compiled
+# input templates, the trial and build keys of the trial cache, the objective
+# expressions, the Pareto front, the failure-region classifier, the wall time ledger
+# and the reading of autotune_dataset.py datasets.
+# Both drivers import it, so a fix here applies to both; keep this file next to
+# autotune.py (autotune_nightly.py also finds it in its parent directory).
+
+# Need: pip install --user pandas
+# Need: pip install --user ruamel.yaml
+# Need: pip install --user scikit-learn
+
+# Import libraries
+import ast
+import hashlib
+import io
+import json
+import numpy as np
+import os
+import pandas as pd
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import reduce
+from sklearn.tree import DecisionTreeClassifier
+from ruamel.yaml import YAML
+
+yaml = YAML(typ='rt')  # Round trip loading and dumping
+yaml.preserve_quotes = True
+yaml.width = 1000
+
+###############################################################################
+# Wall time ledger of the session, see timed and the report_ledger of each driver
+LEDGER = {'start': time.time(), 'lock': threading.Lock(), 'totals': dict(), 'trials': dict()}
+# Chrome trace of the session (autotune.py --trace): output file, complete events, thread
+# names, and the trial each thread is working on (see traced_trial in autotune.py)
+TRACE = {'file': None, 'events': list(), 'threads': dict(), 'local': threading.local()}
+
+def add_span(name, category, start, elapsed, iter=None, args=None):
+    '''
+    Append a complete event to the Chrome trace, on the calling thread, tagged with
+    the trial of the thread. Does nothing without --trace.
+    Parameters:
+        name(string): span name
+        category(string): span category
+        start(float): time.time() at the start of the span
+        elapsed(float): duration in seconds
+        iter(string): #iter id, if the span belongs to a trial outside traced_trial
+        args(dictionary): extra tags
+    '''
+    if TRACE['file'] is None:
+        return
+    tags = dict(getattr(TRACE['local'], 'trial', None) or dict())
+    if iter is not None:
+        tags.setdefault('iter', str(iter))
+    tags.update(args or dict())
+    thread = threading.current_thread()
+    with LEDGER['lock']:
+        TRACE['threads'][thread.ident] = thread.name
+        TRACE['events'].append({'name': name, 'cat': category, 'ph': 'X', 'pid': os.getpid(), 'tid': thread.ident,
+                                'ts': round((start - LEDGER['start']) * 1e6, 1), 'dur': round(elapsed * 1e6, 1),
+                                'args': tags})
+
+@contextmanager
+def timed(category, iter=None, name=None):
+    '''
+    Add the wall time of the enclosed block to a ledger category, and to the trial's
+    own entry if an #iter id is given. Categories: yaml, json, cache, sandbox,
+    search, mesh and pandas (tuner overhead), history (nightly store) and ctest
+    (trial runs). With --trace the block is also a span named name (default: the
+    category).
+    '''
+    start = time.time()
+    try:
+        yield
+    finally:
+        elapsed = time.time() - start
+        with LEDGER['lock']:
+            LEDGER['totals'][category] = LEDGER['totals'].get(category, 0) + elapsed
+            if iter is not None:
+                entry = LEDGER['trials'].setdefault(str(iter), dict())
+                entry[category] = entry.get(category, 0) + elapsed
+        add_span(name or category, category, start, elapsed, iter)
+
+def trial_breakdown(timers, wall=None):
+    '''
+    Split the wall time of a trial with its Albany timers.
+    Parameters:
+        timers(dictionary): timers of the ctest json
+        wall(float): wall time of the ctest run, None if unknown (i.e. served from the cache)
+    Returns:
+        breakdown(dictionary): seconds of launch (ctest/MPI), setup, fill, solve (NOX linear solve + preconditioner construction) and other Albany time
+    '''
+    setup = float(timers.get('Albany: Setup Time:', 0))
+    fill = float(timers.get('Albany: Total Fill Time:', 0))
+    solve = float(timers.get('NOX Total Linear Solve:', 0)) + float(timers.get('NOX Total Preconditioner Construction:', 0))
+    breakdown = {'setup': setup, 'fill': fill, 'solve': solve}
+    total = timers.get('Albany Total Time:')
+    if total is not None:
+        breakdown['albany other'] = max(float(total) - setup - fill - solve, 0)
+    if wall is not None:
+        breakdown['ctest'] = wall
+        if total is not None:
+            breakdown['launch'] = max(wall - float(total), 0)
+    return breakdown
+
+###############################################################################
+# Compiled input templates, keyed by the shape of the tunable keys under Factories
+TEMPLATES = dict()
+SLOT_MARK = 'AUTOTUNESLOT'
+SCALARS = dict() # formatted scalars of builtin types
+
+def get_factories(inputDict):
+    '''
+    Return the MueLu Factories block of an input yaml dictionary.
+    '''
+    linsolDict = inputDict['ANONYMOUS']['Piro']['NOX']['Direction']['Newton']['Stratimikos Linear Solver']
+    return linsolDict['Stratimikos']['Preconditioner Types']['MueLu']['Factories']
+
+def tunable_slots(factories):
+    '''
+    List the tunable scalars under Factories: the 'type' of each factory and every
+    value of its ParameterList.
+    Parameters:
+        factories(dictionary): MueLu Factories block
+    Returns:
+        slots(list): (container, key) of each tunable scalar, in dump order
+    '''
+    slots = list()
+    def walk(container):
+        for key, value in container.items():
+            if isinstance(value, dict):
+                walk(value)
+            elif value is not None:
+                slots.append((container, key))
+    for factory in factories.values():
+        if not isinstance(factory, dict):
+            continue
+        if factory.get('type') is not None:
+            slots.append((factory, 'type'))
+        if isinstance(factory.get('ParameterList'), dict):
+            walk(factory['ParameterList'])
+    return slots
+
+def template_shape(factories):
+    '''
+    Everything that decides the layout of the tunable part of Factories except the
+    scalar values themselves: key names, order and nesting.
+    '''
+    def shape(node):
+        if isinstance(node, dict):
+            return tuple((key, shape(value)) for key, value in node.items())
+        return None if node is None else type(node).__name__
+    return tuple((name, shape(factory.get('type')), shape(factory.get('ParameterList')))
+                 for name, factory in factories.items() if isinstance(factory, dict))
+
+def format_scalar(value):
+    '''
+    Format a scalar exactly as the round-trip dumper writes it as a mapping value.
+    Parameters:
+        value(scalar): value of a tunable key
+    Returns:
+        text(string): dumped scalar, None if it does not fit on one line
+    '''
+    builtin = type(value) in (bool, int, float, str)
+    if builtin and (type(value), value) in SCALARS:
+        return SCALARS[(type(value), value)]
+    stream = io.StringIO()
+    yaml.dump({'k': value}, stream)
+    lines = [line for line in stream.getvalue().split('\n')[:-1]
+             if not line.startswith('%') and line != '---'] # directives of the loaded document
+    text = lines[0][len('k: '):] if len(lines) == 1 and lines[0].startswith('k: ') else None
+    if builtin:
+        SCALARS[(type(value), value)] = text
+    return text
+
+def compile_template(inputDict):
+    '''
+    Dump the input once with a marker in place of every tunable scalar and split the
+    text around the markers, so a trial only formats the scalars it changes. The
+    template is checked against a full dump and dropped if they differ.
+    Parameters:
+        inputDict(dictionary): the input yaml dictionary
+    Returns:
+        template(dictionary): {'root':inputDict, 'chunks':list(text)}, chunks None if unusable
+    '''
+    slots = tunable_slots(get_factories(inputDict))
+    saved = [container[key] for container, key in slots]
+    stream = io.StringIO()
+    try:
+        for n, (container, key) in enumerate(slots):
+            container[key] = SLOT_MARK + str(n) + 'X'
+        yaml.dump(inputDict, stream)
+    finally:
+        for (container, key), value in zip(slots, saved):
+            container[key] = value
+    chunks = re.split(SLOT_MARK + r'(\d+)X', stream.getvalue() + '...\n')
+    template = {'root': inputDict, 'chunks': chunks[0::2]}
+    full = io.StringIO()
+    yaml.dump(inputDict, full)
+    if ([int(n) for n in chunks[1::2]] != list(range(len(slots)))
+            or render_template(template, inputDict) != full.getvalue() + '...\n'):
+        template['chunks'] = None
+    return template
+
+def render_template(template, inputDict):
+    '''
+    Splice the current tunable scalars of the input into its template.
+    Returns:
+        text(string): the yaml document, None if the template cannot render it
+    '''
+    if template['chunks'] is None:
+        return None
+    values = [format_scalar(container[key]) for container, key in tunable_slots(get_factories(inputDict))]
+    if None in values:
+        return None
+    text = [template['chunks'][0]]
+    for value, chunk in zip(values, template['chunks'][1:]):
+        text.append(value)
+        text.append(chunk)
+    return ''.join(text)
+
+###############################################################################
+# Build fields of the ctest json that identify the Albany/Trilinos build
+BUILD_FIELDS = ['Albany git commit id', 'Trilinos git commit id',
+                'Albany cxx compiler', 'Albany cuda compiler']
+# the fields every build prints in its log header (CPU builds have no cuda compiler)
+BUILD_REQUIRED = BUILD_FIELDS[:3]
+
+def get_build_key(record):
+    '''
+    Hash the build fields of a ctest json record.
+    Parameters:
+        record(dictionary): the case entry of a ctest-*.json file
+    Returns:
+        key(string): hex digest identifying the build
+    '''
+    build = {field: record.get(field) for field in BUILD_FIELDS}
+    return hashlib.sha256(json.dumps(build, sort_keys=True).encode()).hexdigest()
+
+def get_trial_key(inputDict, case):
+    '''
+    Hash the MueLu Factories block of a patched input together with the casename.
+    Parameters:
+        inputDict(dictionary): the patched input yaml dictionary
+        case(string): a string that represents the targeted casename from output
+    Returns:
+        key(string): hex digest identifying the configuration
+    '''
+    factories = get_factories(inputDict)
+    canonical = json.dumps({'case': case, 'Factories': factories}, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+###############################################################################
+# Named objectives, usable alone or inside an objective expression (see compile_objective)
+OBJECTIVES = {'nox': "'NOX Total Linear Solve:' + 'NOX Total Preconditioner Construction:'",
+              'total': "'Albany Total Time:'",
+              'setup': "'Albany: Setup Time:'",
+              'fill': "'Albany: Total Fill Time:'"}
+OBJECTIVE_OPERATORS = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide, ast.Pow: np.power}
+OBJECTIVE_FUNCTIONS = {'abs': np.abs, 'log': np.log, 'sqrt': np.sqrt}
+RANK_STATISTICS = {'rank_min': 'min', 'rank_mean': 'mean', 'rank_max': 'max'}
+COMPILED = dict() # compiled objectives by expression
+
+def compile_objective(expression):
+    '''
+    Compile an objective expression over Teuchos timers once, into a function of a
+    table of timer columns. An expression is made of timer names in quotes
+    ('Albany Total Time:'), the names of OBJECTIVES, numbers, + - * / ** and unary -,
+    min(...) and max(...) (element-wise), abs, log and sqrt, and rank_min, rank_mean
+    and rank_max('timer') (statistics over the MPI ranks; a bare timer is its max over
+    ranks, see parse_ctest_log). A timer name alone needs no quotes.
+    i.e. "nox", "'Albany Total Time:' - setup", "max(nox, 0.5 * total)", "rank_mean('NOX Total Linear Solve:')"
+    Parameters:
+        expression(string): objective expression
+    Returns:
+        objective(dictionary): {'expression', 'columns':list((timer, statistic)) read,
+                                'function':f({(timer, statistic):array}) -> array,
+                                'monotone':True if it never decreases when a timer grows}
+    '''
+    if expression in COMPILED:
+        return COMPILED[expression]
+    text = expression.strip()
+    if text.endswith(':') and text[0] not in '\'"': # a bare timer name
+        text = repr(text)
+    columns = list()
+    def build(node, depth=0):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            key = (node.value, 'value')
+            columns.append(key)
+            return (lambda table: table[key]), True
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            value = float(node.value)
+            return (lambda table: value), value >= 0
+        if isinstance(node, ast.Name) and node.id in OBJECTIVES and depth < 10:
+            return build(ast.parse(OBJECTIVES[node.id], mode='eval').body, depth + 1)
+        if isinstance(node, ast.BinOp) and type(node.op) in OBJECTIVE_OPERATORS:
+            (left, left_up), (right, right_up) = build(node.left, depth), build(node.right, depth)
+            operator = OBJECTIVE_OPERATORS[type(node.op)]
+            return (lambda table: operator(left(table), right(table))), \
+                   left_up and right_up and isinstance(node.op, (ast.Add, ast.Mult))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            operand, _ = build(node.operand, depth)
+            return (lambda table: -operand(table)), False
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            name, args = node.func.id, node.args
+            if name in RANK_STATISTICS and len(args) == 1 and isinstance(args[0], ast.Constant) and isinstance(args[0].value, str):
+                key = (args[0].value, RANK_STATISTICS[name])
+                columns.append(key)
+                return (lambda table: table[key]), True
+            if name in ['min', 'max'] and args:
+                built = [build(arg, depth) for arg in args]
+                operator = np.minimum if name == 'min' else np.maximum
+                return (lambda table: reduce(operator, [f(table) for f, _ in built])), all(up for _, up in built)
+            if name in OBJECTIVE_FUNCTIONS and len(args) == 1:
+                operand, up = build(args[0], depth)
+                function = OBJECTIVE_FUNCTIONS[name]
+                return (lambda table: function(operand(table))), up and name != 'abs'
+        raise ValueError("Unsupported term in the objective {0}: {1}".format(expression, ast.dump(node)))
+    try:
+        tree = ast.parse(text, mode='eval')
+    except SyntaxError:
+        raise ValueError("The objective {} is not an expression, quote timer names: 'Albany Total Time:'".format(expression))
+    function, monotone = build(tree.body)
+    COMPILED[expression] = {'expression': expression, 'columns': list(dict.fromkeys(columns)),
+                            'function': function, 'monotone': monotone}
+    return COMPILED[expression]
+
+def objective_values(objective, records):
+    '''
+    Evaluate a compiled objective over a table of runs at once.
+    Parameters:
+        objective(dictionary): compiled objective from compile_objective
+        records(list): ctest json records of the case or results log records {'passed', 'timers', 'timer_stats'}
+    Returns:
+        values(array): one value per run, inf if the test did not pass, a timer is missing
+                       or the expression is undefined (i.e. a division by zero)
+    '''
+    table = dict()
+    for timer, statistic in objective['columns']:
+        column = list()
+        for record in records:
+            value = (record.get('timer_stats') or dict()).get(timer, dict()).get(statistic) if statistic != 'value' else None
+            value = record.get('timers', dict()).get(timer) if value is None else value # one rank: no statistics
+            column.append(np.nan if value is None else float(value))
+        table[(timer, statistic)] = np.array(column, dtype=float)
+    with np.errstate(all='ignore'):
+        values = np.broadcast_to(np.asarray(objective['function'](table), dtype=float), (len(records),))
+    passed = np.array([record.get('passed') is True for record in records], dtype=bool)
+    return np.where(passed & np.isfinite(values), values, np.inf)
+
+###############################################################################
+# Pareto front of the multi-objective modes
+def pareto_front(values):
+    '''
+    Return the non-dominated points (for minimization) among finite vectors.
+    Parameters:
+        values(list): list(objective vector)
+    Returns:
+        front(list): indices of the non-dominated vectors
+    '''
+    finite = [i for i, v in enumerate(values) if np.all(np.isfinite(v))]
+    front = list()
+    for i in finite:
+        dominated = any(np.all(np.array(values[j]) <= values[i]) and np.any(np.array(values[j]) < values[i])
+                        for j in finite if j != i)
+        if not dominated:
+            front.append(i)
+    return front
+
+def hypervolume(points, ref):
+    '''
+    Hypervolume dominated by points and bounded by a reference point (minimization),
+    by slicing along the last objective.
+    Parameters:
+        points(list): list(objective vector)
+        ref(list): reference point, worse than every point of interest
+    Returns:
+        volume(float)
+    '''
+    points = [list(p) for p in points if all(x < r for x, r in zip(p, ref))]
+    if not points:
+        return 0.0
+    if len(ref) == 1:
+        return ref[0] - min(p[0] for p in points)
+    points.sort(key = lambda p: p[-1])
+    volume = 0.0
+    for i, p in enumerate(points):
+        upper = points[i+1][-1] if i + 1 < len(points) else ref[-1]
+        if upper > p[-1]:
+            volume += (upper - p[-1]) * hypervolume([q[:-1] for q in points[:i+1]], ref[:-1])
+    return volume
+
+def choose_trade_off(values, rule):
+    '''
+    Pick the configuration to promote from the Pareto front.
+    Parameters:
+        values(list): objective vectors of the front
+        rule(string): knee (closest to the ideal point after scaling each objective
+                      to [0, 1] over the front), weights:w1,w2,... (smallest weighted
+                      sum of the scaled objectives) or within:P (best second objective
+                      among points within P% of the best first objective)
+    Returns:
+        index(integer): index into values
+    '''
+    V = np.array(values, dtype=float)
+    span = V.max(axis=0) - V.min(axis=0)
+    scaled = (V - V.min(axis=0)) / np.where(span > 0, span, 1)
+    if rule == 'knee':
+        return int(np.argmin(np.linalg.norm(scaled, axis=1)))
+    if rule.startswith('weights:'):
+        weights = np.array([float(w) for w in rule[len('weights:'):].split(',')])
+        if len(weights) != V.shape[1]:
+            raise ValueError("Trade-off weights need one weight per objective")
+        return int(np.argmin(scaled @ weights))
+    if rule.startswith('within:'):
+        limit = V[:, 0].min() * (1 + float(rule[len('within:'):]) / 100)
+        candidates = [i for i in range(len(V)) if V[i, 0] <= limit]
+        return min(candidates, key = lambda i: tuple(V[i, 1:]))
+    raise ValueError("Unknown trade-off rule {}: use knee, weights:w1,w2 or within:P".format(rule))
+
+###############################################################################
+# Failure-region classifier of the passed/failed trials (autotune.py --feasibility,
+# "feasibility" of the nightly properties)
+def get_architecture(build):
+    '''
+    Name the architecture of a build by its compilers.
+    Parameters:
+        build(dictionary): build fields of a results log record or a nightly history row, see BUILD_FIELDS
+    Returns:
+        architecture(string): 'cxx compiler / cuda compiler', or 'unknown'
+    '''
+    compilers = [build.get(field) for field in ['Albany cxx compiler', 'Albany cuda compiler'] if build and build.get(field)]
+    return ' / '.join(compilers) if compilers else 'unknown'
+
+def encode_feasibility(rows, columns, codes):
+    '''
+    Encode parameter rows for the classifier: numbers as they are, categories as their
+    index, and parameters a row does not set (other smoother type) as -1.
+    Parameters:
+        rows(list): [{'smoother::parameter':value}]
+        columns(list): parameter columns
+        codes(dictionary): {column:list(categories)} of the categorical columns
+    Returns:
+        X(array): encoded rows
+    '''
+    X = [[-1.0 if row.get(name) is None or (isinstance(row.get(name), float) and np.isnan(row[name]))
+          else float(codes[name].index(str(row[name])) if str(row[name]) in codes[name] else -1) if name in codes
+          else float(row[name]) for name in columns] for row in rows]
+    return np.array(X, dtype=float).reshape(len(rows), len(columns))
+
+def fit_feasibility(rows, failed, min_trials=5):
+    '''
+    Fit a decision tree telling the failed trials from the passed ones.
+    Parameters:
+        rows(list): parameters of the trials [{'smoother::parameter':value}]
+        failed(array): True for the trials that failed
+        min_trials(integer): number of trials needed to fit the tree
+    Returns:
+        model(dictionary): {'tree', 'columns', 'codes', 'unset', 'lowest', 'trials', 'failed',
+                            'leaf_trials', 'leaf_failed'}, None without both outcomes
+    '''
+    failed = np.asarray(failed, dtype=bool)
+    if len(rows) < min_trials or failed.all() or not failed.any():
+        return None
+    columns = sorted(set().union(*rows))
+    codes = {name: sorted({str(row[name]) for row in rows if row.get(name) is not None}) for name in columns
+             if any(isinstance(row.get(name), str) for row in rows)}
+    X = encode_feasibility(rows, columns, codes)
+    tree = DecisionTreeClassifier(max_depth=4, min_samples_leaf=2, random_state=0).fit(X, failed)
+    leaves = tree.apply(X)
+    return {'tree': tree, 'columns': columns, 'codes': codes,
+            'unset': {name for i, name in enumerate(columns) if (X[:, i] == -1).any()},
+            'lowest': {name: X[X[:, i] != -1, i].min() for i, name in enumerate(columns) if (X[:, i] != -1).any()},
+            'trials': len(rows), 'failed': int(failed.sum()),
+            'leaf_trials': np.bincount(leaves, minlength=tree.tree_.node_count),
+            'leaf_failed': np.bincount(leaves[failed], minlength=tree.tree_.node_count)}
+
+def fail_probability(model, rows):
+    '''
+    Probability that each parameter row fails: the share of failed trials in its leaf of
+    the tree, with one pass and one failure added so that small leaves stay uncertain.
+    Parameters:
+        model(dictionary): fitted classifier from fit_feasibility
+        rows(list): [{'smoother::parameter':value}]
+    Returns:
+        p_fail(array): probability of failing of each row
+    '''
+    leaves = model['tree'].apply(encode_feasibility(rows, model['columns'], model['codes']))
+    return (model['leaf_failed'][leaves] + 1.0) / (model['leaf_trials'][leaves] + 2.0)
+
+def describe_split(model, name, threshold, left):
+    '''
+    Condition of one branch of a split of the tree, i.e. 'mySmoother1::relaxation: sweeps <= 1.5'.
+    '''
+    if name in model['codes']:
+        labels = [(index, option) for index, option in enumerate(model['codes'][name])] + [(-1, 'unset')]
+        return '{0} in {1}'.format(name, [option for index, option in labels if (index <= threshold) == left])
+    if name in model['unset'] and threshold < model['lowest'].get(name, np.inf):
+        return name + (' unset' if left else ' set')
+    if left and name in model['unset']:
+        return '{0} <= {1:.4g} or unset'.format(name, threshold)
+    return '{0} {1} {2:.4g}'.format(name, '<=' if left else '>', threshold)
+
+def infeasible_regions(model, min_failed=2):
+    '''
+    Leaves of the tree where trials are more likely to fail than to pass.
+    Parameters:
+        model(dictionary): fitted classifier from fit_feasibility
+        min_failed(integer): number of failed trials a region needs to be reported
+    Returns:
+        regions(list): [{'conditions':list(string), 'trials':#trials, 'failed':#failed}], most failures first
+    '''
+    tree = model['tree'].tree_
+    regions = list()
+    nodes = [(0, list())]
+    while nodes:
+        node, conditions = nodes.pop()
+        if tree.children_left[node] < 0:
+            trials, failed = int(model['leaf_trials'][node]), int(model['leaf_failed'][node])
+            if failed >= min_failed and (failed + 1.0) / (trials + 2.0) >= 0.5:
+                regions.append({'conditions': conditions, 'trials': trials, 'failed': failed})
+            continue
+        name, threshold = model['columns'][tree.feature[node]], tree.threshold[node]
+        nodes.append((tree.children_right[node], conditions + [describe_split(model, name, threshold, False)]))
+        nodes.append((tree.children_left[node], conditions + [describe_split(model, name, threshold, True)]))
+    return sorted(regions, key = lambda region: -region['failed'])
+
+def report_infeasible(model, case, architecture, filename):
+    '''
+    Print the infeasible parameter regions of a case on an architecture and write them
+    to a json file {case:{architecture:{'trials', 'failed', 'regions'}}} shared by the
+    runs of every case and architecture.
+    Parameters:
+        model(dictionary): fitted classifier from fit_feasibility
+        case(string): name of the case
+        architecture(string): see get_architecture
+        filename(string): output report (.json)
+    '''
+    regions = infeasible_regions(model)
+    print("INFEASIBLE REGIONS ({0}, {1}): {2} of {3} trials failed".format(case, architecture, model['failed'], model['trials']))
+    for region in regions:
+        print("  {0}/{1} failed: {2}".format(region['failed'], region['trials'], ' and '.join(region['conditions']) or 'everywhere'))
+    report = dict()
+    if os.path.isfile(filename):
+        with open(filename) as f:
+            report = json.load(f)
+    report.setdefault(case, dict())[architecture] = {'trials': model['trials'], 'failed': model['failed'], 'regions': regions}
+    with open(filename, 'w') as f:
+        json.dump(report, f, indent=1)
+
+###############################################################################
+def read_dataset_campaigns(directory, case=None):
+    '''
+    Read the dataset of autotune_dataset.py as campaign tables in the csv layout of
+    autotune.py: [N::]parameter columns, 'time' and 'passed'. Campaigns without
+    parameter columns (i.e. ctest jsons of the default input) are left out.
+    Parameters:
+        directory(string): dataset directory
+        case(string): only read this case partition, with or without its _npN suffix (default: all)
+    Returns:
+        campaigns(list): [(name, DataFrame)], one per campaign of the dataset
+    '''
+    filters = [('case', '=', re.sub(r'_np\d+$', '', case))] if case else None
+    trials = pd.read_parquet(os.path.join(directory, 'trials'), filters=filters,
+                             columns=['trial_id', 'campaign', 'passed', 'time'])
+    if trials.empty:
+        return list()
+    params = pd.read_parquet(os.path.join(directory, 'params'), filters=filters,
+                             columns=['trial_id', 'level', 'parameter', 'value'])
+    params['column'] = params['parameter'].where(params['level'] == 0, params['level'].astype(str) + '::' + params['parameter'])
+    df = trials.join(params.pivot(index='trial_id', columns='column', values='value'), on='trial_id')
+    campaigns = list()
+    for campaign, rows in df.groupby('campaign'):
+        rows = rows.dropna(axis=1, how='all')
+        columns = rows.columns.difference(trials.columns)
+        if columns.empty:
+            continue
+        for column in columns:
+            # numbers as pd.read_csv reads them
+            values = pd.to_numeric(rows[column], errors='coerce')
+            if values.notna().sum() == rows[column].notna().sum():
+                rows[column] = values
+        campaigns.append((directory + ':' + campaign, rows.drop(columns=['trial_id', 'campaign'])))
+    return campaigns
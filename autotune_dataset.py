@@ -0,0 +1,361 @@
+# Consolidate the results of all campaigns into one columnar dataset: the csv outputs of
+# autotune.py (output/output_*/), the ctest-*.json of the first campaigns with their
+# parameters from current_output.log, the nightly histories (_hist.csv, _hist.sqlite)
+# with their ctest-[date].json, and the results logs of autotune.py (_results.jsonl).
+#
+# $ python autotune_dataset.py output autotune_nightly
+# $ python autotune_dataset.py output autotune_nightly . --output autotune_dataset --hardware V100
+#
+# The dataset is rebuilt from the sources on each run: three Parquet tables, trials
+# (one row per trial), params (one row per smoother level and parameter of a trial) and
+# timers (one row per Teuchos timer of a trial), partitioned by case and hardware.
+# autotune.py --warm-start and the nightly "warm_start" read it like a campaign csv.
+
+# Need: pip install --user pandas
+# Need: pip install --user pyarrow
+
+# Import libraries
+import argparse
+import ast
+import hashlib
+import json
+import numpy as np
+import os
+import pandas as pd
+import re
+import shutil
+import sqlite3
+
+# Cases of the perf_tests inputs, for the sources that do not name their case
+INPUT_CASES = {'input_albany_Velocity_MueLu_Wedge': 'humboldt-3-20km_vel_mu_wdg_tune',
+               'input_albany_Velocity_MueLuKokkos_Wedge': 'humboldt-3-20km_vel_muk_wdg_tune'}
+# Derived outputs that repeat the rows of another source
+DERIVED = ('_hist_sorted.csv', '_rescored.csv', '_pareto.csv', '_curves.csv', '_summary.csv', '_ledger.csv')
+SKIPPED_DIRS = ['autotune_runs', '__pycache__', '.git']
+CASE_NP = re.compile(r'(humboldt[\w-]*?_tune)_np(\d+)')
+PARTITION = re.compile(r'salloc .*?-p (\S+)')
+LOG_TRIAL = re.compile(r'^(\{.*\}): Time = (\S+) sec')
+PARAMETER = re.compile(r'^(?:(?:mySmoother)?\d+::)?(?:relaxation|chebyshev): ')
+NOX_TIMERS = ['NOX Total Linear Solve:', 'NOX Total Preconditioner Construction:']
+TRIAL_COLUMNS = ['trial_id', 'campaign', 'source', 'kind', 'iter', 'case', 'np', 'hardware', 'compilers',
+                 'albany_commit', 'trilinos_commit', 'passed', 'time', 'time_NOX', 'time_AlbanyTotal']
+PARTITIONS = ['case', 'hardware']
+
+def split_parameter(name):
+    '''
+    Split a parameter column into its smoother level and parameter: 'N::parameter' (csv
+    outputs, nightly), 'mySmootherN::parameter' (results logs), or the plain 'parameter'
+    of the single smoother of the MueLu inputs (level 0).
+    Parameters:
+        name(string): parameter column
+    Returns:
+        level(integer): smoother level
+        parameter(string): parameter name
+    '''
+    if '::' not in name:
+        return 0, name
+    smoother, parameter = name.split('::', 1)
+    return int(smoother[len('mySmoother'):] if smoother.startswith('mySmoother') else smoother), parameter
+
+def read_context(directory):
+    '''
+    What the notes of a campaign directory (README.md, current_output.log) tell about
+    it: the Slurm partition it ran on, its case and its number of ranks.
+    Parameters:
+        directory(string): campaign directory
+    Returns:
+        context(dictionary): {'hardware', 'case', 'np'}, None where unknown
+    '''
+    text = ''
+    for name in ['README.md', 'current_output.log']:
+        if os.path.isfile(os.path.join(directory, name)):
+            with open(os.path.join(directory, name), errors='replace') as f:
+                text += f.read()
+    partition, case = PARTITION.search(text), CASE_NP.search(text)
+    return {'hardware': partition.group(1) if partition else None,
+            'case': case.group(1) if case else None, 'np': int(case.group(2)) if case else None}
+
+def input_case(filename):
+    '''
+    The case of an output named after its input yaml, None if unknown.
+    '''
+    matches = [key for key in INPUT_CASES if os.path.basename(filename).startswith(key)]
+    return INPUT_CASES[max(matches, key=len)] if matches else None
+
+def new_trial(source, key, **fields):
+    '''
+    A trial {TRIAL_COLUMNS, 'params', 'timers'}, identified by its source file and its
+    key in that file so that rebuilding the dataset keeps the ids.
+    '''
+    trial = dict.fromkeys(TRIAL_COLUMNS)
+    trial.update({'trial_id': hashlib.sha1('{0}#{1}'.format(source, key).encode()).hexdigest()[:16],
+                  'source': source, 'params': dict(), 'timers': dict()})
+    trial.update(fields)
+    return trial
+
+def add_ctest(trial, dat):
+    '''
+    Add the case, build, pass/fail and timers of a ctest-*.json file to a trial.
+    '''
+    name, record = next(iter(dat.items()))
+    case = CASE_NP.search(name)
+    compilers = [record.get(field) for field in ['Albany cxx compiler', 'Albany cuda compiler'] if record.get(field)]
+    trial.update({'case': record.get('case') or (case.group(1) if case else trial['case']),
+                  'np': record.get('np') or (int(case.group(2)) if case else trial['np']),
+                  'compilers': ' / '.join(compilers) or None, 'passed': record.get('passed') is True,
+                  'albany_commit': record.get('Albany git commit id'),
+                  'trilinos_commit': record.get('Trilinos git commit id'),
+                  'timers': record.get('timers') or dict()})
+
+def add_timers(trial):
+    '''
+    Fill time_NOX and time_AlbanyTotal of a trial from its timers where it has them.
+    '''
+    timers = trial['timers']
+    if trial['time_NOX'] is None and all(timers.get(timer) is not None for timer in NOX_TIMERS):
+        trial['time_NOX'] = sum(float(timers[timer]) for timer in NOX_TIMERS)
+    if trial['time_AlbanyTotal'] is None and timers.get('Albany Total Time:') is not None:
+        trial['time_AlbanyTotal'] = float(timers['Albany Total Time:'])
+    return trial
+
+def number(value):
+    '''
+    The float of a csv or json value, None if it is missing or not a number.
+    '''
+    value = pd.to_numeric(value, errors='coerce')
+    return None if value is None or pd.isna(value) else float(value)
+
+def read_campaign_csv(filename, source, context):
+    '''
+    Read a csv output of autotune.py: [N::]parameter columns and 'time' (inf: failed).
+    '''
+    df = pd.read_csv(filename)
+    columns = [c for c in df.columns if PARAMETER.match(c)]
+    if 'time' not in df.columns or not columns:
+        print("SKIPPED {}: no parameter or time columns".format(source))
+        return list()
+    trials = list()
+    # records keep the integer columns integers
+    for index, row in enumerate(df.to_dict('records')):
+        time = number(row['time'])
+        trials.append(new_trial(source, index, campaign=os.path.basename(os.path.dirname(os.path.abspath(filename))),
+                                kind='campaign csv', case=context['case'] or input_case(filename),
+                                np=context['np'], hardware=context['hardware'],
+                                passed=time is not None and np.isfinite(time), time=time,
+                                params={c: row[c] for c in columns if pd.notna(row[c])}))
+    return trials
+
+def read_ctest_log(directory, filenames, context):
+    '''
+    Read the ctest-*.json of a campaign whose parameters are only in current_output.log,
+    where each trial is listed with its Albany Total Time and the failed ones come last
+    in the order of their #iter ids.
+    '''
+    passed, failed = dict(), list()
+    with open(os.path.join(directory, 'current_output.log'), errors='replace') as f:
+        for line in f:
+            match = LOG_TRIAL.match(line.strip())
+            if match and np.isfinite(float(match.group(2))):
+                passed[float(match.group(2))] = ast.literal_eval(match.group(1))
+            elif match:
+                failed.append(ast.literal_eval(match.group(1)))
+    def iter_id(filename):
+        return int(re.sub(r'\D', '', os.path.basename(filename)) or -1)
+    trials = list()
+    for filename in sorted(filenames, key=iter_id):
+        with open(filename) as f:
+            dat = json.load(f)
+        trial = new_trial(os.path.relpath(filename), 0, campaign=os.path.basename(os.path.abspath(directory)),
+                          kind='ctest json', iter=str(iter_id(filename)), case=context['case'], np=context['np'],
+                          hardware=context['hardware'])
+        add_ctest(trial, dat)
+        add_timers(trial)
+        params = passed.pop(trial['time_AlbanyTotal'], None) if trial['passed'] else (failed.pop(0) if failed else None)
+        if params is None:
+            print("SKIPPED {}: no parameters in current_output.log".format(os.path.relpath(filename)))
+            continue
+        trial.update({'params': params, 'time': trial['time_AlbanyTotal'] if trial['passed'] else float('inf')})
+        trials.append(trial)
+    return trials
+
+def read_nightly(filename, source, ctest_files, context):
+    '''
+    Read a nightly history (_hist.sqlite, or _hist.csv before the store), with the build
+    and timers of each night from its ctest-[date].json, matched by the Albany Total Time.
+    '''
+    nights = dict()
+    for ctest_file in ctest_files:
+        with open(ctest_file) as f:
+            dat = json.load(f)
+        total = next(iter(dat.values())).get('timers', {}).get('Albany Total Time:')
+        if total is not None:
+            nights[float(total)] = dat
+    if filename.endswith('.sqlite'):
+        conn = sqlite3.connect(filename)
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(history)')]
+        selected = [c for c in ['iter_id', 'params', 'time_NOX', 'time_AlbanyTotal', 'passed', 'build', 'kind', 'timers']
+                    if c in columns]
+        rows = [dict(zip(selected, row)) for row in conn.execute('SELECT {} FROM history'.format(', '.join(selected)))]
+        conn.close()
+    else:
+        rows = pd.read_csv(filename).to_dict('records')
+    case = CASE_NP.search(os.path.basename(filename))
+    trials = list()
+    for row in rows:
+        params = json.loads(row['params']) if isinstance(row.get('params'), str) else \
+                 {k: v for k, v in row.items() if '::' in k and pd.notna(v)}
+        trial = new_trial(source, row['iter_id'], campaign=os.path.basename(filename).rsplit('.', 1)[0],
+                          kind='nightly ' + (row.get('kind') or 'history'), iter=str(row['iter_id']),
+                          case=case.group(1) if case else context['case'], np=int(case.group(2)) if case else context['np'],
+                          hardware=context['hardware'], params=params)
+        total = number(row.get('time_AlbanyTotal'))
+        if total in nights:
+            add_ctest(trial, nights[total])
+        build = json.loads(row['build']) if isinstance(row.get('build'), str) else dict()
+        if build:
+            compilers = [build.get(field) for field in ['Albany cxx compiler', 'Albany cuda compiler'] if build.get(field)]
+            trial.update({'compilers': ' / '.join(compilers) or None, 'albany_commit': build.get('Albany git commit id'),
+                          'trilinos_commit': build.get('Trilinos git commit id')})
+        if isinstance(row.get('timers'), str):
+            trial['timers'] = json.loads(row['timers']).get('timers') or dict()
+        passed = row.get('passed')
+        trial.update({'passed': None if passed is None or (isinstance(passed, float) and np.isnan(passed))
+                                else passed in (True, 1, 'True'),
+                      'time': number(row.get('time_NOX')), 'time_NOX': number(row.get('time_NOX')),
+                      'time_AlbanyTotal': total})
+        trials.append(add_timers(trial))
+    return trials
+
+def read_results_log(filename, source, context):
+    '''
+    Read a results log of autotune.py: every session is a campaign.
+    '''
+    trials = list()
+    with open(filename) as f:
+        for index, line in enumerate(f):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            params = {smoother + '::' + key: value for smoother, subdict in record.get('params', {}).items()
+                      for key, value in subdict.items()}
+            build = record.get('build') or dict()
+            compilers = [build.get(field) for field in ['Albany cxx compiler', 'Albany cuda compiler'] if build.get(field)]
+            trial = new_trial(source, index, campaign=record['session'], kind='results log',
+                              iter='{0}/{1}'.format(record.get('round', 0), record['iter']),
+                              case=context['case'] or input_case(filename), np=context['np'], hardware=context['hardware'],
+                              compilers=' / '.join(compilers) or None, albany_commit=build.get('Albany git commit id'),
+                              trilinos_commit=build.get('Trilinos git commit id'), passed=record.get('passed') is True,
+                              time=number(record.get('time')), params=params, timers=record.get('timers') or dict())
+            trials.append(add_timers(trial))
+    return trials
+
+def collect(paths, output):
+    '''
+    Walk the source paths and read every result file they hold.
+    Parameters:
+        paths(list): files or directories
+        output(string): dataset directory, never read as a source
+    Returns:
+        trials(list): one dictionary per trial, see new_trial
+    '''
+    trials = list()
+    for path in paths:
+        walked = [(os.path.dirname(path) or '.', list(), [os.path.basename(path)])] if os.path.isfile(path) else os.walk(path)
+        for directory, dirnames, filenames in walked:
+            dirnames[:] = sorted(d for d in dirnames if d not in SKIPPED_DIRS and
+                                 os.path.abspath(os.path.join(directory, d)) != os.path.abspath(output))
+            context = read_context(directory)
+            files = [os.path.join(directory, name) for name in sorted(filenames)]
+            ctest_files = [f for f in files if re.match(r'ctest-\d+\.json$', os.path.basename(f))]
+            histories = [f for f in files if f.endswith('_hist.sqlite') or
+                         (f.endswith('_hist.csv') and f[:-len('.csv')] + '.sqlite' not in files)]
+            for filename in files:
+                source = os.path.relpath(filename)
+                if filename in histories:
+                    trials.extend(read_nightly(filename, source, ctest_files, context))
+                elif filename.endswith('_results.jsonl'):
+                    trials.extend(read_results_log(filename, source, context))
+                elif filename.endswith('.csv') and not filename.endswith(DERIVED) and not filename.endswith('_hist.csv'):
+                    trials.extend(read_campaign_csv(filename, source, context))
+            if ctest_files and not histories and os.path.isfile(os.path.join(directory, 'current_output.log')):
+                trials.extend(read_ctest_log(directory, ctest_files, context))
+    return trials
+
+def to_tables(trials, hardware='unknown'):
+    '''
+    Normalize the trials into the trials, params and timers tables.
+    Parameters:
+        trials(list): trials of collect
+        hardware(string): hardware of the trials whose sources do not name it
+    Returns:
+        tables(dictionary): {'trials', 'params', 'timers'}: DataFrame
+    '''
+    params, timers = list(), list()
+    for trial in trials:
+        trial['case'] = trial['case'] or 'unknown'
+        trial['hardware'] = trial['hardware'] or hardware
+        keys = {key: trial[key] for key in ['trial_id'] + PARTITIONS}
+        for name, value in trial['params'].items():
+            level, parameter = split_parameter(name)
+            value = value.item() if hasattr(value, 'item') else value
+            params.append({**keys, 'level': level, 'parameter': parameter, 'value': str(value), 'number': number(value)})
+        for timer, seconds in trial['timers'].items():
+            timers.append({**keys, 'timer': timer, 'seconds': number(seconds)})
+    trials_df = pd.DataFrame([{c: trial[c] for c in TRIAL_COLUMNS} for trial in trials], columns=TRIAL_COLUMNS)
+    trials_df = trials_df.astype({'np': 'Int64', 'passed': 'boolean', 'time': float, 'time_NOX': float,
+                                  'time_AlbanyTotal': float})
+    return {'trials': trials_df,
+            'params': pd.DataFrame(params, columns=['trial_id', 'level', 'parameter', 'value', 'number'] + PARTITIONS),
+            'timers': pd.DataFrame(timers, columns=['trial_id', 'timer', 'seconds'] + PARTITIONS)}
+
+def write_dataset(tables, directory):
+    '''
+    Replace the tables of the dataset in directory, partitioned by case and hardware.
+    '''
+    for name, df in tables.items():
+        path = os.path.join(directory, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        df.to_parquet(path, partition_cols=PARTITIONS, index=False)
+
+def load_dataset(directory, table='trials', filters=None, columns=None):
+    '''
+    Read a table of the dataset, i.e. load_dataset('autotune_dataset', 'params',
+    filters=[('case', '=', 'humboldt-3-20km_vel_muk_wdg_tune'), ('level', '=', 1)]).
+    Parameters:
+        directory(string): dataset directory
+        table(string): 'trials', 'params' or 'timers'
+        filters(list): pyarrow filters [(column, op, value)], partitions are pruned
+        columns(list): columns to read (default: all)
+    Returns:
+        df(DataFrame): rows of the table
+    '''
+    df = pd.read_parquet(os.path.join(directory, table), filters=filters, columns=columns)
+    for column in PARTITIONS:
+        if column in df.columns:
+            df[column] = df[column].astype(str)
+    return df
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sources", type=str, nargs='*', default=['output', 'autotune_nightly'],
+                        help="files or directories of campaign results (default: output autotune_nightly)")
+    parser.add_argument("--output", type=str, default='autotune_dataset',
+                        help="dataset directory, rebuilt on each run (default: autotune_dataset)")
+    parser.add_argument("--hardware", type=str, default='unknown',
+                        help="hardware of the sources whose notes do not name their Slurm partition (default: unknown)")
+    args = parser.parse_args()
+
+    tables = to_tables(collect(args.sources, args.output), args.hardware)
+    if tables['trials'].empty:
+        raise ValueError("No campaign results found in {}".format(' '.join(args.sources)))
+    write_dataset(tables, args.output)
+    trials = tables['trials']
+    print("DATASET {0}: {1} trials, {2} parameter values, {3} timer values".format(
+          args.output, len(trials), len(tables['params']), len(tables['timers'])))
+    summary = trials.groupby(PARTITIONS + ['campaign'], dropna=False).agg(
+        trials=('trial_id', 'size'), passed=('passed', 'sum'), best_time=('time', 'min')).reset_index()
+    print(summary.to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# Parameter importance of a finished campaign: Sobol indices on a random-forest
+# surrogate of time_NOX, and a freeze file fixing the unimportant parameters.
+#
+# $ python autotune_importance.py input_albany_Velocity_MueLuKokkos_Wedge_Tune.csv --freeze-below 0.05
+# $ python autotune_importance.py humboldt-3-20km_vel_muk_wdg_tune_np1_hist.sqlite
+#
+# The freeze file ([results]_freeze.json) is read by autotune.py --freeze and by the
+# nightly driver ("freeze" in _properties.json).
+
+# Need: pip install --user pandas
+# Need: pip install --user scikit-learn
+
+# Import libraries
+import argparse
+import json
+import numpy as np
+import os
+import pandas as pd
+import sqlite3
+from itertools import combinations
+from sklearn.ensemble import RandomForestRegressor
+
+def read_campaign(filename):
+    '''
+    Read the measured rows of a campaign: a csv output of autotune.py, a nightly
+    [case]_hist.csv or a nightly [case]_hist.sqlite.
+    Parameters:
+        filename(string): .csv or .sqlite
+    Returns:
+        df(DataFrame): parameter columns and 'time', passed rows with a finite time only
+    '''
+    if filename.endswith('.sqlite'):
+        conn = sqlite3.connect(filename)
+        rows = conn.execute('SELECT params, time_NOX FROM history WHERE passed = 1').fetchall()
+        conn.close()
+        df = pd.DataFrame.from_records([{**json.loads(params), 'time': time} for params, time in rows])
+    else:
+        df = pd.read_csv(filename).rename(columns={'time_NOX': 'time'})
+        if 'passed' in df.columns:
+            df = df[df['passed'].astype(str) == 'True']
+    columns = [c for c in df.columns if c.startswith('relaxation:') or c.startswith('chebyshev:') or '::' in c]
+    df = df[columns + ['time']]
+    df = df[np.isfinite(pd.to_numeric(df['time'], errors='coerce'))].reset_index(drop=True)
+    # parameters that never change carry no information
+    return df[[c for c in columns if df[c].nunique(dropna=False) > 1] + ['time']]
+
+def encode(df, columns):
+    '''
+    Encode the parameter columns for the surrogate: numbers as they are, categories as
+    codes, and parameters unused by the smoother type (empty) as -1.
+    Parameters:
+        df(DataFrame): rows of read_campaign
+        columns(list): parameter columns
+    Returns:
+        X(array): encoded rows
+        codes(dictionary): {column:list(categories)} of the categorical columns
+    '''
+    X, codes = list(), dict()
+    for name in columns:
+        values = pd.to_numeric(df[name], errors='coerce')
+        if values.notna().sum() == df[name].notna().sum():
+            X.append(values.fillna(-1).to_numpy(dtype=float))
+        else:
+            codes[name] = sorted(df[name].dropna().astype(str).unique())
+            X.append(np.array([codes[name].index(str(v)) if pd.notna(v) else -1 for v in df[name]], dtype=float))
+    return np.column_stack(X), codes
+
+def sobol_indices(model, X, n=2048, interactions=True, random_state=None):
+    '''
+    First-order (Saltelli) and total (Jansen) Sobol indices of the surrogate, and the
+    second-order index of each pair of parameters. The inputs are drawn independently
+    from the observed values of each parameter.
+    Parameters:
+        model(RandomForestRegressor): fitted surrogate
+        X(array): encoded rows the surrogate was fitted to
+        n(integer): number of base samples
+        interactions(boolean): also compute the second-order indices
+        random_state(RandomState): numpy random state
+    Returns:
+        first(array): first-order index of each parameter
+        total(array): total index of each parameter
+        second(dictionary): {(i, j): second-order index}
+    '''
+    random_state = random_state or np.random.RandomState(0)
+    d = X.shape[1]
+    A = np.column_stack([random_state.choice(X[:, i], n) for i in range(d)])
+    B = np.column_stack([random_state.choice(X[:, i], n) for i in range(d)])
+    f_A, f_B = model.predict(A), model.predict(B)
+    var = np.var(np.concatenate([f_A, f_B]))
+    if var == 0:
+        return np.zeros(d), np.zeros(d), dict()
+    def mixed(columns):
+        AB = A.copy()
+        AB[:, columns] = B[:, columns]
+        return model.predict(AB)
+    f_AB = [mixed([i]) for i in range(d)]
+    first = np.array([np.mean(f_B * (f_AB[i] - f_A)) for i in range(d)]) / var
+    total = np.array([0.5 * np.mean((f_A - f_AB[i]) ** 2) for i in range(d)]) / var
+    second = dict()
+    if interactions:
+        for i, j in combinations(range(d), 2):
+            closed = np.mean(f_B * (mixed([i, j]) - f_A)) / var
+            second[(i, j)] = closed - first[i] - first[j]
+    return first, total, second
+
+def freeze_values(df, columns, total, threshold):
+    '''
+    Values of the fastest row for the parameters whose total index is below threshold
+    (parameters unused by the fastest row's smoother type stay free).
+    Parameters:
+        df(DataFrame): rows of read_campaign
+        columns(list): parameter columns
+        total(array): total index of each parameter
+        threshold(float): total index below which a parameter is frozen
+    Returns:
+        frozen(dictionary): {column:value}
+    '''
+    best = df.loc[df['time'].astype(float).idxmin()]
+    frozen = dict()
+    for name, index in zip(columns, total):
+        if index < threshold and pd.notna(best[name]):
+            value = best[name]
+            value = value.item() if hasattr(value, 'item') else value
+            # integer parameters of a column with empty rows were read as floats
+            observed = pd.to_numeric(df[name], errors='coerce').dropna()
+            if isinstance(value, float) and len(observed) == df[name].notna().sum() and (observed % 1 == 0).all():
+                value = int(value)
+            frozen[name] = value
+    return frozen
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("results_file", type=str,
+                        help="results of a campaign: autotune.py output (.csv), nightly history (_hist.csv or _hist.sqlite)")
+    parser.add_argument("--samples", type=int, default=2048, help="base samples of the Sobol estimates (default: 2048)")
+    parser.add_argument("--top", type=int, default=5, help="number of interactions to print (default: 5)")
+    parser.add_argument("--freeze-below", type=float,
+                        help="write [results]_freeze.json fixing the parameters with a total index below this value at their best values")
+    parser.add_argument("--min-r2", type=float, default=0.5,
+                        help="out-of-bag R^2 of the surrogate needed to write the freeze file (default: 0.5)")
+    args = parser.parse_args()
+
+    df = read_campaign(args.results_file)
+    columns = [c for c in df.columns if c != 'time']
+    if len(df) < 10 or not columns:
+        raise ValueError("{0} has {1} measured rows and {2} varying parameters: too few for an importance analysis".format(
+            args.results_file, len(df), len(columns)))
+    X, codes = encode(df, columns)
+    y = df['time'].to_numpy(dtype=float)
+    model = RandomForestRegressor(n_estimators=200, min_samples_leaf=2, oob_score=True, random_state=0).fit(X, y)
+    first, total, second = sobol_indices(model, X, args.samples)
+
+    print("SURROGATE: random forest on {0} rows, out-of-bag R^2 {1:.2f}".format(len(df), model.oob_score_))
+    ranking = pd.DataFrame({'parameter': columns, 'first order': first.round(4), 'total': total.round(4)})
+    ranking = ranking.sort_values(by='total', ascending=False).reset_index(drop=True)
+    print(ranking.to_string(index=False))
+    pairs = sorted(second.items(), key=lambda item: -item[1])[:args.top]
+    if pairs:
+        print("INTERACTIONS (second order):")
+        for (i, j), index in pairs:
+            print("  {0:.4f}  {1} x {2}".format(index, columns[i], columns[j]))
+
+    base = os.path.splitext(args.results_file)[0]
+    report = {'rows': len(df), 'oob_r2': model.oob_score_,
+              'importance': {c: {'first': f, 'total': t} for c, f, t in zip(columns, first, total)},
+              'interactions': {columns[i] + ' x ' + columns[j]: index for (i, j), index in second.items()}}
+    with open(base + str('_importance.json'), 'w') as f:
+        json.dump(report, f, indent=1)
+    if args.freeze_below is not None and model.oob_score_ < args.min_r2:
+        print("NOT FROZEN: the surrogate explains too little of the time (out-of-bag R^2 {0:.2f} < {1}), "
+              "measure more configurations first".format(model.oob_score_, args.min_r2))
+    elif args.freeze_below is not None:
+        frozen = freeze_values(df, columns, total, args.freeze_below)
+        with open(base + str('_freeze.json'), 'w') as f:
+            json.dump({'frozen': frozen, 'threshold': args.freeze_below, 'source': args.results_file}, f, indent=1)
+        print("FROZEN ({0} of {1} parameters) in {2}:".format(len(frozen), len(columns), base + str('_freeze.json')))
+        for name, value in frozen.items():
+            print("  {0}: {1}".format(name, value))
+
+if __name__ == "__main__":
+    main()
@@ -4,22 +4,46 @@ import numpy as np
 import os
 import pandas as pd
 import random
+import sqlite3
 import statistics
 import subprocess
 import sys
-from scipy.stats import truncnorm
+import time
+from scipy.stats import spearmanr, truncnorm, ttest_ind, ttest_ind_from_stats
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import ConstantKernel, Matern, WhiteKernel
 from sklearn.model_selection import ParameterSampler
-from ruamel.yaml import YAML
+# autotune_common.py is next to this file or, in the repository, in its parent directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from autotune_common import BUILD_FIELDS, TEMPLATES, choose_trade_off, compile_objective, compile_template, get_build_key
+from autotune_common import get_factories, get_trial_key, hypervolume, objective_values, pareto_front
+from autotune_common import read_dataset_campaigns, render_template, template_shape, yaml
+from autotune_common import fail_probability, fit_feasibility, get_architecture, report_infeasible
+from autotune_common import LEDGER, timed, trial_breakdown
 
-yaml = YAML(typ='rt')  # Round trip loading and dumping
-yaml.preserve_quotes = True
-yaml.width = 1000
+LEDGER_COLUMNS = ['iter_id', 'tuner wall', 'tuner yaml', 'tuner json', 'tuner cache', 'tuner history',
+                  'ctest', 'launch', 'setup', 'fill', 'solve', 'albany other']
+
+def report_ledger(filename, iter_id, record=None):
+    '''
+    Print where the time of this nightly step and of last night's trial went, and
+    append it as a row of the ledger csv.
+    '''
+    row = {'iter_id': iter_id, 'tuner wall': time.time() - LEDGER['start']}
+    row.update({'tuner ' + category: LEDGER['totals'].get(category, 0) for category in ['yaml', 'json', 'cache', 'history']})
+    if record is not None:
+        row.update(trial_breakdown(record.get('timers', {}), record.get('Test time')))
+    print('###################### TUNING TIME LEDGER ######################')
+    for key, value in row.items():
+        print('  {0:<20} {1:10.2f}'.format(key, value))
+    df = pd.DataFrame.from_records([row], columns=LEDGER_COLUMNS)
+    df.to_csv(filename, mode='a', index=False, header=not os.path.isfile(filename))
 
 def run_bash(command):
     return subprocess.run(command, shell=True, executable='/bin/bash')
 
 def read_yaml(filename):
-    with open(filename) as f:
+    with timed('yaml'), open(filename) as f:
         dictionary = yaml.load(f)
     return dictionary
 
@@ -28,6 +52,34 @@ def write_yaml(dictionary, filename):
         yaml.dump(dictionary, f)
         f.write('...\n')
 
+# Parsed inputs and compiled templates, see write_trial_yaml
+INPUTS = dict()
+
+def read_input(filename):
+    '''
+    Parse the input yaml once per run; later draws patch the same tree.
+    '''
+    if filename not in INPUTS:
+        INPUTS[filename] = read_yaml(filename)
+    return INPUTS[filename]
+
+def write_trial_yaml(inputDict, filenames):
+    '''
+    Write the patched input to each file by splicing its tunable scalars into the
+    compiled template of its shape, or with write_yaml if it has none.
+    '''
+    with timed('yaml'):
+        shape = template_shape(get_factories(inputDict))
+        if shape not in TEMPLATES or TEMPLATES[shape]['root'] is not inputDict:
+            TEMPLATES[shape] = compile_template(inputDict)
+        text = render_template(TEMPLATES[shape], inputDict)
+        for filename in filenames:
+            if text is None:
+                write_yaml(inputDict, filename)
+            else:
+                with open(filename, 'w') as f:
+                    f.write(text)
+
 def check_json(filename, casename):
     with open(filename) as f:
         dictionary = json.load(f)
@@ -41,6 +93,23 @@ def merge_dict(dict1, dict2, dict3, dict4):
 def revise_keystring(count, dic):
     return { str(count)+'::'+str(key) : (revise_keystring(value) if isinstance(value, dict) else value) for key, value in dic.items()}
 
+def load_cache(filename):
+    '''
+    Load the persistent trial cache {build_key:{trial_key:list(record)}}.
+    '''
+    if not os.path.isfile(filename):
+        return dict()
+    with timed('cache'), open(filename) as f:
+        return json.load(f)
+
+def save_cache(cache, filename):
+    '''
+    Write the trial cache atomically.
+    '''
+    with timed('cache'), open(filename + '.tmp', 'w') as f:
+        json.dump(cache, f, indent=1)
+    os.replace(filename + '.tmp', filename)
+
 def get_truncated_normal(mean=1, sd=0.1, low=0.8, upp=1.2):
     '''
     Generate a truncated normal continuous distribution with range.
@@ -114,17 +183,10 @@ def paramdict_generator(mySmoother, mS_type, properties_file):
     return category, param_dict
         
     
-def random_search(inFile, iter_id, properties_file):
-    inputDict = read_yaml(inFile)
-
-    # Extract MueLu dictionary
-    linsolDict = inputDict['ANONYMOUS']['Piro']['NOX']['Direction']['Newton']['Stratimikos Linear Solver']
-    muDict = linsolDict['Stratimikos']['Preconditioner Types']['MueLu']
-
-    # Parameter to change
-    paramList_1 = muDict['Factories']['mySmoother1']
-    paramList_4 = muDict['Factories']['mySmoother4']
-
+def draw_config(properties_file):
+    '''
+    Draw a random configuration (CATE_1, p1, CATE_4, p4) of mySmoother1/4.
+    '''
     TYPE_1, TYPE_4 = randomtype_generator(properties_file)
     CATE_1, PARAMDICT_1 = paramdict_generator("mS1", TYPE_1, properties_file)
     CATE_4, PARAMDICT_4 = paramdict_generator("mS4", TYPE_4, properties_file)
@@ -138,27 +200,67 @@ def random_search(inFile, iter_id, properties_file):
     param_4 = [dict((k, v) for (k, v) in d.items()) for d in sample_4]
     param_1 = [{ k: float(round(v,4)) if isinstance(v,float) else v for k,v in x.items()} for x in param_1]
     param_4 = [{ k: float(round(v,4)) if isinstance(v,float) else v for k,v in x.items()} for x in param_4]
+    return CATE_1, param_1[0], CATE_4, param_4[0]
+
+def freeze_config(config, properties_file):
+    '''
+    Fix the parameters frozen by autotune_importance.py ("freeze" in the properties) in a
+    configuration (CATE_1, p1, CATE_4, p4). A frozen type redraws the smoother's branch.
+    '''
+    with open(properties_file) as prop:
+        freeze_file = json.load(prop).get('freeze')
+    if not freeze_file:
+        return config
+    with open(freeze_file) as f:
+        frozen = json.load(f)['frozen']
+    config = list(config)
+    for k, (prefix, mySmoother) in enumerate([('1', 'mS1'), ('4', 'mS4')]):
+        params = dict(config[2 * k + 1])
+        mS_type = frozen.get(prefix + '::relaxation: type')
+        if mS_type is not None and mS_type != params.get('relaxation: type'):
+            category, param_dict = paramdict_generator(mySmoother, mS_type, properties_file)
+            sample = list(ParameterSampler(param_dict, n_iter=1, random_state=np.random.RandomState()))[0]
+            params = {key: float(round(v, 4)) if isinstance(v, float) else v for key, v in sample.items()}
+            config[2 * k] = category
+        for key in params:
+            if prefix + '::' + key in frozen:
+                params[key] = frozen[prefix + '::' + key]
+        config[2 * k + 1] = params
+    return tuple(config)
+
+def random_search(inFile, iter_id, properties_file, config=None):
+    inputDict = read_input(inFile)
+
+    # Extract MueLu dictionary
+    linsolDict = inputDict['ANONYMOUS']['Piro']['NOX']['Direction']['Newton']['Stratimikos Linear Solver']
+    muDict = linsolDict['Stratimikos']['Preconditioner Types']['MueLu']
+
+    # Parameter to change
+    paramList_1 = muDict['Factories']['mySmoother1']
+    paramList_4 = muDict['Factories']['mySmoother4']
+
+    # a random configuration unless one was proposed (see propose_config)
+    CATE_1, p1, CATE_4, p4 = freeze_config(config if config is not None else draw_config(properties_file), properties_file)
 
     # Run simulations
     #iter_param_dict_1 = dict()
     #iter_param_dict_4 = dict()
     
     # MS1
-    p1 = param_1[0]
     paramList_1['type'] = CATE_1
     paramList_1['ParameterList'].clear()
     paramList_1['ParameterList'].update(p1)
 
     # MS4
-    p4 = param_4[0]
     paramList_4['type'] = CATE_4
     paramList_4['ParameterList'].clear()
     paramList_4['ParameterList'].update(p4)
     
-    print("[mySmoother1] ", param_1[0])
-    print("[mySmoother4] ", param_4[0])
+    print("[mySmoother1] ", p1)
+    print("[mySmoother4] ", p4)
     print('\n')
-    write_yaml(inputDict, inFile) 
+    # the input for the next run, and its copy [input_yaml]_[#iter_id].yaml
+    write_trial_yaml(inputDict, [inFile, inFile.split('.')[0] + '_' + str(iter_id) + '.' + inFile.split('.')[1]])
 
     iter_id = {'iter_id': iter_id} 
     p1 = revise_keystring(1, p1)
@@ -169,6 +271,619 @@ def random_search(inFile, iter_id, properties_file):
 
     return merged
 
+def config_row(config):
+    CATE_1, p1, CATE_4, p4 = config
+    return {**revise_keystring(1, p1), **revise_keystring(4, p4)}
+
+def encode_rows(df):
+    '''
+    Encode the parameter columns (N::parameter) for the surrogate: numbers scaled to
+    [0, 1] (-1 if the parameter is not used by the smoother type), categories one-hot.
+    '''
+    columns = list()
+    for name in [c for c in df.columns if '::' in c]:
+        values = pd.to_numeric(df[name], errors='coerce')
+        if values.notna().sum() == df[name].notna().sum():
+            span = values.max() - values.min()
+            columns.append(((values - values.min()) / (span if span > 0 else 1)).fillna(-1))
+        else:
+            columns.append(pd.get_dummies(df[name].astype(str), prefix=name).astype(float))
+    return pd.concat(columns, axis=1).to_numpy(dtype=float)
+
+def propose_config(hist_df, properties_file, objectives, n_candidates):
+    '''
+    Propose the next configuration by hypervolume improvement: random candidates are
+    scored with the lower confidence bound of one Gaussian-process surrogate per
+    objective, fitted to the passed history rows.
+    '''
+    candidates = [draw_config(properties_file) for _ in range(n_candidates)]
+    passed = hist_df[hist_df['passed'] == True]
+    Y = passed[objectives].to_numpy(dtype=float)
+    Y = Y[np.all(np.isfinite(Y), axis=1)]
+    if len(Y) < 3:
+        return candidates[0]
+    known = passed[np.all(np.isfinite(passed[objectives].to_numpy(dtype=float)), axis=1)]
+    X = encode_rows(pd.concat([known, pd.DataFrame.from_records([config_row(c) for c in candidates])], ignore_index=True))
+    X_known, X_candidates = X[:len(known)], X[len(known):]
+    ref = Y.max(axis=0) + 0.1 * (Y.max(axis=0) - Y.min(axis=0)) + 1e-9
+    lcb = list()
+    for k in range(Y.shape[1]):
+        kernel = ConstantKernel(1.0) * Matern(length_scale=np.ones(X.shape[1]), nu=2.5) + WhiteKernel(1e-2)
+        gp = GaussianProcessRegressor(kernel=kernel, normalize_y=True).fit(X_known, Y[:, k])
+        mu, sd = gp.predict(X_candidates, return_std=True)
+        lcb.append(mu - sd)
+    lcb = np.column_stack(lcb)
+    front = [list(Y[i]) for i in pareto_front(list(Y))]
+    base = hypervolume(front, ref)
+    hvi = np.array([hypervolume(front + [list(l)], ref) - base for l in lcb])
+    print("Proposed by hypervolume improvement {0:.4g} among {1} candidates".format(hvi.max(), n_candidates))
+    if hvi.max() > 0:
+        return candidates[int(np.argmax(hvi))]
+    # every candidate is dominated: closest to the front after scaling
+    return candidates[int(np.argmin(((lcb - Y.min(axis=0)) / (ref - Y.min(axis=0))).sum(axis=1)))]
+
+def smoother_type(row, prefix):
+    '''
+    Smoother type of a history row for mySmoother[prefix], None if unknown.
+    '''
+    value = row.get(prefix + '::relaxation: type')
+    if isinstance(value, str):
+        return value
+    if pd.notna(row.get(prefix + '::chebyshev: degree', np.nan)):
+        return "CHEBYSHEV"
+    return None
+
+def parzen(values, x, spec, weights=None):
+    '''
+    Parzen density at x of the observed values of a parameter: a Gaussian kernel per
+    value (discrete: count per option) mixed with the prior range as one more component.
+    Values of earlier campaigns count with their weight (default: 1).
+    '''
+    pairs = [(v, w) for v, w in zip(values, weights or [1.0] * len(values)) if pd.notna(v)]
+    total = sum(w for _, w in pairs)
+    if isinstance(spec, list):
+        return (sum(w for v, w in pairs if v == x) + 1.0) / (total + len(spec))
+    low, high = spec.support()
+    sigma = 0.25 * (high - low) * max(1, total) ** (-0.2)
+    kernels = sum(w * truncnorm.pdf(x, (low - v) / sigma, (high - v) / sigma, loc=v, scale=sigma) for v, w in pairs)
+    return (1.0 / (high - low) + kernels) / (total + 1)
+
+def sample_parzen(values, spec, rng, weights=None):
+    '''
+    Draw a parameter value from the Parzen density of the observed values.
+    '''
+    pairs = [(v, w) for v, w in zip(values, weights or [1.0] * len(values)) if pd.notna(v)]
+    total = sum(w for _, w in pairs)
+    if isinstance(spec, list):
+        weights = np.array([sum(w for v, w in pairs if v == option) + 1.0 for option in spec])
+        return spec[rng.choice(len(spec), p=weights / weights.sum())]
+    if not pairs or rng.uniform() < 1.0 / (total + 1):
+        return float(round(spec.rvs(random_state=rng), 4))
+    low, high = spec.support()
+    sigma = 0.25 * (high - low) * max(1, total) ** (-0.2)
+    p = np.array([w for _, w in pairs])
+    v = pairs[rng.choice(len(pairs), p=p / p.sum())][0]
+    return float(round(truncnorm.rvs((low - v) / sigma, (high - v) / sigma, loc=v, scale=sigma, random_state=rng), 4))
+
+def split_good_bad(done, gamma, weight=1.0):
+    '''
+    Good (best gamma fraction by time_NOX) and bad rows (the rest and failures), with a 'weight' column.
+    '''
+    times = np.where(done['passed'] == True, pd.to_numeric(done['time_NOX'], errors='coerce'), np.inf)
+    times = np.where(np.isnan(times), np.inf, times)
+    n_good = max(1, int(np.ceil(gamma * np.isfinite(times).sum())))
+    order = np.argsort(times, kind='stable')
+    return done.iloc[order[:n_good]].assign(weight=weight), done.iloc[order[n_good:]].assign(weight=weight)
+
+def tpe_propose(hist_df, properties_file, n_candidates=24, gamma=0.25, n_startup=5, priors=None):
+    '''
+    Propose the next configuration with a tree-structured Parzen estimator. The
+    measured history is split into good (best gamma fraction by time_NOX) and bad
+    rows (the rest and failures). For each smoother, the type and then the parameters
+    of that type's branch are drawn from the density of the good rows of the same
+    type, and the candidate with the highest ratio good/bad density is kept.
+    Earlier campaigns (see read_warm_start) are split the same way on their own scale
+    and their rows weighted by similarity.
+    Returns None (random draw) until n_startup rows (or their weight) are measured.
+    '''
+    done = hist_df[hist_df['passed'].notna()].reset_index(drop=True)
+    splits = [split_good_bad(done, gamma)] if len(done) else list()
+    for prior in priors or list():
+        similarity = warm_similarity(prior, hist_df)
+        print("Warm start: {0} ({1} rows), similarity {2:.2f}".format(prior['name'], len(prior['rows']), similarity))
+        if similarity >= 0.05:
+            splits.append(split_good_bad(prior['rows'], gamma, similarity))
+    if sum(g['weight'].sum() + b['weight'].sum() for g, b in splits) < n_startup:
+        return None
+    with open(properties_file) as prop:
+        dic_prop = json.load(prop)
+    good = pd.concat([g for g, _ in splits], ignore_index=True)
+    bad = pd.concat([b for _, b in splits], ignore_index=True)
+    rng = np.random.RandomState()
+    best, best_score = None, -np.inf
+    for _ in range(n_candidates):
+        config, score = list(), 0.0
+        for prefix, mySmoother in [('1', 'mS1'), ('4', 'mS4')]:
+            options = dic_prop[mySmoother]['type_options']
+            good_types = [smoother_type(row, prefix) for _, row in good.iterrows()]
+            bad_types = [smoother_type(row, prefix) for _, row in bad.iterrows()]
+            mS_type = sample_parzen(good_types, options, rng, list(good['weight']))
+            score += (np.log(parzen(good_types, mS_type, options, list(good['weight'])))
+                      - np.log(parzen(bad_types, mS_type, options, list(bad['weight']))))
+            category, param_dict = paramdict_generator(mySmoother, mS_type, properties_file)
+            good_branch = good[[t == mS_type for t in good_types]]
+            bad_branch = bad[[t == mS_type for t in bad_types]]
+            params = dict()
+            for key, spec in param_dict.items():
+                good_values = list(good_branch.get(prefix + '::' + key, pd.Series([np.nan] * len(good_branch))))
+                bad_values = list(bad_branch.get(prefix + '::' + key, pd.Series([np.nan] * len(bad_branch))))
+                params[key] = sample_parzen(good_values, spec, rng, list(good_branch['weight']))
+                if isinstance(spec, list) and len(spec) == 1:
+                    continue # 'relaxation: type' is fixed by the branch
+                score += (np.log(parzen(good_values, params[key], spec, list(good_branch['weight'])))
+                          - np.log(parzen(bad_values, params[key], spec, list(bad_branch['weight']))))
+            config.extend([category, {k: (v.item() if hasattr(v, 'item') else v) for k, v in params.items()}])
+        if score > best_score:
+            best, best_score = tuple(config), score
+    print("Proposed by TPE (log density ratio {0:.3g}, {1} good / {2} bad rows)".format(best_score, len(good), len(bad)))
+    return best
+
+def read_warm_start(filenames, case, similarity=0.5):
+    '''
+    Read earlier campaigns as prior rows {'N::parameter', 'time_NOX', 'passed'}: nightly
+    [case]_hist.csv of related cases (np1 vs np12) or other hardware, csv outputs of autotune.py,
+    or the campaigns of this case (any np) in a dataset of autotune_dataset.py.
+    '''
+    campaigns = list()
+    for filename in filenames:
+        campaigns.extend(read_dataset_campaigns(filename, case) if os.path.isdir(filename) else [(filename, pd.read_csv(filename))])
+    priors = list()
+    for filename, df in campaigns:
+        df = df.rename(columns={'time': 'time_NOX'})
+        if 'passed' not in df.columns:
+            df['passed'] = np.isfinite(pd.to_numeric(df['time_NOX'], errors='coerce'))
+        df['passed'] = df['passed'].astype(str) == 'True'
+        df = df[[c for c in df.columns if c.startswith(('1::', '4::'))] + ['time_NOX', 'passed']]
+        if df['passed'].sum() < 3:
+            print("Warm start: {} has fewer than 3 passed rows, skipped".format(filename))
+            continue
+        priors.append({'name': filename, 'rows': df.reset_index(drop=True), 'similarity': similarity})
+    return priors
+
+def warm_similarity(prior, hist_df, min_rows=3):
+    '''
+    Similarity of an earlier campaign to this history: the rank correlation between the
+    measured time_NOX and the predictions of a surrogate fitted to the earlier campaign
+    alone (clipped at 0). Its default weight until min_rows rows passed.
+    '''
+    done = hist_df[hist_df['passed'] == True]
+    done = done[np.isfinite(pd.to_numeric(done['time_NOX'], errors='coerce'))]
+    if len(done) < min_rows:
+        return prior['similarity']
+    rows = prior['rows'][prior['rows']['passed']]
+    X = encode_rows(pd.concat([rows, done], ignore_index=True))
+    kernel = ConstantKernel(1.0) * Matern(length_scale=np.ones(X.shape[1]), nu=2.5) + WhiteKernel(1e-2)
+    gp = GaussianProcessRegressor(kernel=kernel, normalize_y=True).fit(X[:len(rows)], rows['time_NOX'].to_numpy(dtype=float))
+    rho = spearmanr(gp.predict(X[len(rows):]), done['time_NOX'].to_numpy(dtype=float))[0]
+    return 0.0 if np.isnan(rho) else max(0.0, float(rho))
+
+def row_config(row, properties_file):
+    '''
+    The configuration (CATE_1, p1, CATE_4, p4) of a history row, None if it lies outside the properties.
+    '''
+    with open(properties_file) as prop:
+        dic_prop = json.load(prop)
+    config = list()
+    for prefix, mySmoother in [('1', 'mS1'), ('4', 'mS4')]:
+        mS_type = smoother_type(row, prefix)
+        if mS_type not in dic_prop[mySmoother]['type_options']:
+            return None
+        category, param_dict = paramdict_generator(mySmoother, mS_type, properties_file)
+        params = dict()
+        for key, spec in param_dict.items():
+            value = row.get(prefix + '::' + key)
+            if value is None or pd.isna(value):
+                return None
+            if isinstance(spec, list):
+                if value not in spec:
+                    return None
+                value = spec[spec.index(value)]
+            else:
+                low, high = spec.support()
+                if not low <= float(value) <= high:
+                    return None
+                value = float(round(value, 4))
+            params[key] = value
+        config.extend([category, params])
+    return tuple(config)
+
+def warm_seed(priors, hist_df, properties_file, n_startup=5):
+    '''
+    While fewer than n_startup rows are measured, the fastest configuration of the most
+    similar earlier campaign that fits the properties and is not in the history yet.
+    '''
+    if len(hist_df[hist_df['passed'].notna()]) >= n_startup:
+        return None
+    tried = [{k: v for k, v in row.items() if '::' in k and pd.notna(v)} for row in hist_df.to_dict('records')]
+    for prior in sorted(priors, key=lambda prior: -prior['similarity']):
+        rows = prior['rows'][prior['rows']['passed']].sort_values(by='time_NOX')
+        for _, row in rows.iterrows():
+            config = row_config(row, properties_file)
+            if config is not None and config_row(config) not in tried:
+                print("Warm start: seeded from {}".format(prior['name']))
+                return config
+    return None
+
+def write_pareto(hist_df, objectives, rule, filename):
+    '''
+    Write the Pareto front of the history and return the #iter id promoted by the trade-off rule.
+    '''
+    passed = hist_df[hist_df['passed'] == True].reset_index(drop=True)
+    values = [list(v) for v in passed[objectives].to_numpy(dtype=float)]
+    front = pareto_front(values)
+    if not front:
+        return None
+    promoted = front[choose_trade_off([values[i] for i in front], rule)]
+    pareto_df = passed.iloc[front].copy()
+    pareto_df['promoted'] = [i == promoted for i in front]
+    pareto_df.sort_values(by=objectives[0]).to_csv(filename, index=False)
+    print("PARETO FRONT: {0} configurations, promoted ({1}): {2}".format(len(front), rule, passed.iloc[promoted]['iter_id']))
+    return passed.iloc[promoted]['iter_id']
+
+def objective_columns(conn, hist_df, objectives):
+    '''
+    Add a column per objective expression of the multi-objective mode to the history frame,
+    computed from the timers recorded with each row (inf for rows without timers, i.e. rows
+    imported from a csv). time_NOX and time_AlbanyTotal are history columns already.
+    '''
+    expressions = [name for name in objectives if name not in HISTORY_OBJECTIVES]
+    if not expressions:
+        return hist_df
+    with timed('history'):
+        rows = {iter_id: (passed, timers) for iter_id, passed, timers in
+                conn.execute('SELECT iter_id, passed, timers FROM history').fetchall()}
+    records = [dict(json.loads(timers) if timers else dict(), passed=passed == 1)
+               for passed, timers in (rows[iter_id] for iter_id in hist_df['iter_id'])]
+    hist_df = hist_df.copy()
+    for expression in expressions:
+        hist_df[expression] = objective_values(compile_objective(expression), records)
+    return hist_df
+
+def run_timers(record):
+    '''
+    The timers of a ctest record kept in the history, so the rows can be rescored.
+    '''
+    return {key: record[key] for key in ['timers', 'timer_stats'] if record.get(key)}
+
+# History store: one row per nightly trial, parameters and build fingerprint as json;
+# time_NOX holds the "objective" (default: NOX linear solve + preconditioner construction)
+# and timers the timers it was computed from
+HISTORY_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS history (
+    iter_id INTEGER PRIMARY KEY,
+    params TEXT NOT NULL,
+    time_NOX REAL,
+    time_AlbanyTotal REAL,
+    passed INTEGER,
+    build TEXT,
+    kind TEXT,
+    timers TEXT);
+CREATE INDEX IF NOT EXISTS history_nox ON history (passed, time_NOX);
+CREATE INDEX IF NOT EXISTS history_total ON history (passed, time_AlbanyTotal);
+CREATE TABLE IF NOT EXISTS promotions (
+    night INTEGER PRIMARY KEY,
+    iter_id INTEGER NOT NULL,
+    p_value REAL);
+'''
+HISTORY_COLUMNS = 'iter_id, params, time_NOX, time_AlbanyTotal, passed, build, kind'
+# objectives of the multi-objective mode read from the history as they are, any
+# other name is an objective expression over the recorded timers
+HISTORY_OBJECTIVES = ['time_NOX', 'time_AlbanyTotal']
+
+def open_history(filename, csv_hist):
+    '''
+    Open the SQLite history of a case, importing [case]_hist.csv the first time.
+    '''
+    with timed('history'):
+        conn = sqlite3.connect(filename)
+        conn.executescript(HISTORY_SCHEMA)
+        # stores written before the build fingerprints get the new columns
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(history)')]
+        for column in ['build', 'kind', 'timers']:
+            if column not in columns:
+                conn.execute('ALTER TABLE history ADD COLUMN {} TEXT'.format(column))
+        if conn.execute('SELECT COUNT(*) FROM history').fetchone()[0] == 0 and os.path.isfile(csv_hist):
+            hist_df = pd.read_csv(csv_hist)
+            with conn:
+                for merged in hist_df.to_dict('records'):
+                    insert_history(conn, merged)
+            print("Imported {0} rows of {1} into {2}".format(len(hist_df), csv_hist, filename))
+    return conn
+
+def insert_history(conn, merged):
+    '''
+    Append a row {'iter_id', 'N::parameter', ..., 'time_NOX', 'time_AlbanyTotal', 'passed', 'kind', 'timers'}.
+    '''
+    def value(key):
+        v = merged.get(key)
+        return None if v is None or (isinstance(v, float) and np.isnan(v)) else v
+    params = {k: (v.item() if hasattr(v, 'item') else v) for k, v in merged.items() if '::' in k and value(k) is not None}
+    passed = value('passed')
+    with timed('history'):
+        conn.execute('INSERT INTO history (iter_id, params, time_NOX, time_AlbanyTotal, passed, build, kind, timers) '
+                     'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                     (int(merged['iter_id']), json.dumps(params), value('time_NOX'), value('time_AlbanyTotal'),
+                      None if passed is None else int(passed in (True, 'True')),
+                      json.dumps(merged['build']) if isinstance(merged.get('build'), dict) else None, value('kind'),
+                      json.dumps(merged['timers']) if isinstance(merged.get('timers'), dict) else None))
+
+def insert_repeat(conn, iter_id, source_iter, kind):
+    '''
+    Append a row re-running the parameters of row source_iter ('incumbent' or 'repeat').
+    '''
+    with timed('history'):
+        conn.execute('INSERT INTO history (iter_id, params, kind) SELECT ?, params, ? FROM history WHERE iter_id = ?',
+                     (int(iter_id), kind, int(source_iter)))
+
+def update_history(conn, iter_id, time_NOX, time_AlbanyTotal, passed, build=None, timers=None):
+    '''
+    Record the measured times of a row, the build they were measured on and its timers.
+    '''
+    with timed('history'):
+        conn.execute('UPDATE history SET time_NOX = ?, time_AlbanyTotal = ?, passed = ?, build = ?, timers = ? WHERE iter_id = ?',
+                     (time_NOX, None if time_AlbanyTotal is None else float(time_AlbanyTotal), int(passed),
+                      None if build is None else json.dumps(build), None if not timers else json.dumps(timers), int(iter_id)))
+
+def rescore_history(conn, objective):
+    '''
+    Recompute time_NOX of every measured row with recorded timers under another
+    objective, without running anything.
+    Returns:
+        rescored(integer): rows rescored
+        kept(integer): measured rows without timers (imported or older rows), left as they were
+    '''
+    with timed('history'):
+        rows = conn.execute('SELECT iter_id, passed, timers FROM history WHERE passed IS NOT NULL').fetchall()
+        scored = [(iter_id, dict(json.loads(timers), passed=bool(passed))) for iter_id, passed, timers in rows if timers]
+        values = objective_values(objective, [record for _, record in scored])
+        conn.executemany('UPDATE history SET time_NOX = ? WHERE iter_id = ?',
+                         [(float(value), int(iter_id)) for (iter_id, _), value in zip(scored, values)])
+    return len(scored), len(rows) - len(scored)
+
+def last_history(conn):
+    '''
+    #iter id of the last row, -1 if the history is empty.
+    '''
+    with timed('history'):
+        row = conn.execute('SELECT MAX(iter_id) FROM history').fetchone()
+    return -1 if row[0] is None else row[0]
+
+def top_history(conn, k=1, column='time_NOX'):
+    '''
+    The k passed rows with the smallest time_NOX (or time_AlbanyTotal), from the index.
+    '''
+    if column not in ['time_NOX', 'time_AlbanyTotal']:
+        raise ValueError("top_history sorts by time_NOX or time_AlbanyTotal")
+    with timed('history'):
+        rows = conn.execute('SELECT {} FROM history '
+                            'WHERE passed = 1 ORDER BY {} LIMIT ?'.format(HISTORY_COLUMNS, column), (k,)).fetchall()
+    return rows_to_frame(rows)
+
+def rows_to_frame(rows):
+    '''
+    DataFrame of history rows, one column per parameter.
+    '''
+    records = list()
+    for iter_id, params, time_NOX, time_AlbanyTotal, passed, build, kind in rows:
+        record = {'iter_id': iter_id}
+        record.update(json.loads(params))
+        record.update({'time_NOX': time_NOX, 'time_AlbanyTotal': time_AlbanyTotal,
+                       'passed': None if passed is None else bool(passed),
+                       'kind': kind, 'build': None if build is None else json.loads(build)['key'][:12]})
+        records.append(record)
+    if not records:
+        return pd.DataFrame(columns=['iter_id', 'time_NOX', 'time_AlbanyTotal', 'passed'])
+    return sort_pd_col(pd.DataFrame.from_records(records))
+
+def history_frame(conn):
+    '''
+    The whole history as a DataFrame (only for exports and the multi-objective mode).
+    '''
+    with timed('history'):
+        rows = conn.execute('SELECT {} FROM history ORDER BY iter_id'.format(HISTORY_COLUMNS)).fetchall()
+    return rows_to_frame(rows)
+
+def export_history(conn, csv_hist, csv_hist_sorted):
+    '''
+    Write the csv views of the history: by #iter id, and by the confidence-adjusted
+    time_NOX of each configuration (upper bound, then time_NOX).
+    '''
+    hist_df = history_frame(conn)
+    hist_df.to_csv(csv_hist, index=False)
+    stats = config_stats(conn).set_index('params')
+    with timed('history'):
+        params = dict(conn.execute('SELECT iter_id, params FROM history').fetchall())
+    sorted_df = hist_df.copy()
+    for column in ['n', 'mean', 'std', 'upper']:
+        sorted_df[column] = [stats[column].get(params[i]) for i in sorted_df['iter_id']]
+    sorted_df = sorted_df.rename(columns={'mean': 'mean time_NOX', 'std': 'std time_NOX', 'upper': 'upper time_NOX'})
+    sorted_df.sort_values(by=['upper time_NOX', 'time_NOX'], ascending=True).to_csv(csv_hist_sorted, index=False)
+    print("Exported {0} rows to {1} and {2}".format(len(hist_df), csv_hist, csv_hist_sorted))
+
+def build_fingerprint(record):
+    '''
+    The build fields of a ctest json record and their key.
+    '''
+    build = {field: record.get(field) for field in BUILD_FIELDS}
+    build['key'] = get_build_key(record)
+    return build
+
+def incumbent_series(conn, iter_id):
+    '''
+    (iter_id, time_NOX, build) of the passed runs of the parameters of row iter_id, in order.
+    '''
+    with timed('history'):
+        rows = conn.execute('SELECT iter_id, time_NOX, build FROM history WHERE passed = 1 AND build IS NOT NULL '
+                            'AND params = (SELECT params FROM history WHERE iter_id = ?) ORDER BY iter_id',
+                            (int(iter_id),)).fetchall()
+    return [(i, t, json.loads(b)) for i, t, b in rows]
+
+def detect_change(series, alpha=0.05, min_segment=2):
+    '''
+    Most significant slowdown of a timing series, splitting it in two and comparing the
+    segments with Welch's t-test (Bonferroni-corrected over the splits). None if there is none.
+    '''
+    times = [t for _, t, _ in series]
+    splits = range(min_segment, len(times) - min_segment + 1)
+    best = None
+    for k in splits:
+        before, after = times[:k], times[k:]
+        if np.mean(after) <= np.mean(before):
+            continue
+        stat = ttest_ind(after, before, equal_var=False, alternative='greater')
+        p_value = min(1.0, stat.pvalue * len(splits)) if not np.isnan(stat.pvalue) else 1.0
+        if best is None or p_value < best['p-value']:
+            best = {'split': k, 'p-value': p_value, 'before': np.mean(before), 'after': np.mean(after)}
+    if best is None or best['p-value'] >= alpha:
+        return None
+    return best
+
+def report_regression(conn, best_iter, filename, alpha=0.05):
+    '''
+    Run change-point detection on the timing series of the incumbent and append the
+    commit range of a significant slowdown to the regressions csv.
+    '''
+    series = incumbent_series(conn, best_iter)
+    change = detect_change(series, alpha)
+    if change is None:
+        print("No significant slowdown of the incumbent ({0} runs)".format(len(series)))
+        return None
+    last, first = series[change['split'] - 1], series[change['split']]
+    row = {'incumbent': int(best_iter), 'last iter_id before': last[0], 'first iter_id after': first[0],
+           'time_NOX before': change['before'], 'time_NOX after': change['after'],
+           'slowdown %': 100 * (change['after'] / change['before'] - 1), 'p-value': change['p-value']}
+    for field in ['Albany git commit id', 'Trilinos git commit id']:
+        row[field + ' from'] = last[2].get(field)
+        row[field + ' to'] = first[2].get(field)
+    print("REGRESSION: the incumbent slowed down by {0:.1f}% (p = {1:.2g}) between #iter {2} and #iter {3}".format(
+        row['slowdown %'], row['p-value'], last[0], first[0]))
+    for field in ['Albany git commit id', 'Trilinos git commit id']:
+        same = ' (unchanged)' if row[field + ' from'] == row[field + ' to'] else ''
+        print("  {0}: {1}..{2}{3}".format(field, row[field + ' from'], row[field + ' to'], same))
+    # the same change point is detected every night until the series moves on
+    if os.path.isfile(filename):
+        known = pd.read_csv(filename)
+        if ((known['incumbent'] == row['incumbent']) & (known['first iter_id after'] == row['first iter_id after'])).any():
+            return row
+    pd.DataFrame.from_records([row]).to_csv(filename, mode='a', index=False, header=not os.path.isfile(filename))
+    return row
+
+def check_stale(top_df, build_key):
+    '''
+    Warn about the best rows measured on a build other than the current one.
+    '''
+    stale = top_df[top_df['build'] != build_key[:12]]
+    if len(stale):
+        print("STALE RANKINGS: {0} of the top {1} rows were measured on another build: #iter {2}".format(
+            len(stale), len(top_df), ', '.join(str(i) for i in stale['iter_id'])))
+    return len(stale)
+
+def config_stats(conn, noise=0.05):
+    '''
+    Passed runs of each configuration: #iter id of its first row, n, mean and standard
+    deviation of time_NOX, and an approximate 95% upper bound of the mean. Configurations
+    measured fewer than 3 times use the pooled deviation of the repeated ones (or noise*mean).
+    '''
+    with timed('history'):
+        rows = conn.execute('SELECT params, MIN(iter_id), COUNT(*), AVG(time_NOX), AVG(time_NOX * time_NOX) '
+                            'FROM history WHERE passed = 1 GROUP BY params').fetchall()
+    stats = pd.DataFrame.from_records(rows, columns=['params', 'iter_id', 'n', 'mean', 'mean_sq'])
+    stats['std'] = np.sqrt(np.maximum(stats['mean_sq'] - stats['mean'] ** 2, 0) * stats['n'] / np.maximum(stats['n'] - 1, 1))
+    stats.loc[stats['n'] < 2, 'std'] = np.nan
+    repeated = stats[stats['n'] >= 2]
+    pooled = np.sqrt(((repeated['n'] - 1) * repeated['std'] ** 2).sum() / (repeated['n'] - 1).sum()) if len(repeated) else np.nan
+    spread = stats['std'].where(stats['n'] >= 3, pooled if pooled > 0 else np.nan).fillna(noise * stats['mean'])
+    stats['upper'] = stats['mean'] + 1.96 * spread / np.sqrt(stats['n'])
+    stats['lower'] = stats['mean'] - 1.96 * spread / np.sqrt(stats['n'])
+    return stats.drop(columns='mean_sq').sort_values(by=['upper', 'mean']).reset_index(drop=True)
+
+def promote(conn, stats, night, alpha=0.05, min_repeats=3):
+    '''
+    #iter id of the incumbent: the last promoted configuration, replaced by the challenger
+    with the smallest mean time_NOX only once it has min_repeats runs and Welch's t-test
+    finds it faster with p < alpha.
+    '''
+    with timed('history'):
+        row = conn.execute('SELECT iter_id FROM promotions ORDER BY night DESC LIMIT 1').fetchone()
+    if not len(stats):
+        return None
+    by_iter = stats.set_index('iter_id')
+    if row is None or row[0] not in by_iter.index:
+        incumbent, p_value = stats.sort_values(by='mean').iloc[0]['iter_id'], None
+    else:
+        incumbent = row[0]
+        challengers = stats[(stats['iter_id'] != incumbent) & (stats['n'] >= min_repeats)]
+        if not len(challengers) or by_iter.loc[incumbent, 'n'] < 2:
+            return incumbent
+        challenger = challengers.sort_values(by='mean').iloc[0]
+        current = by_iter.loc[incumbent]
+        p_value = ttest_ind_from_stats(challenger['mean'], challenger['std'], challenger['n'],
+                                       current['mean'], current['std'], current['n'],
+                                       equal_var=False, alternative='less').pvalue
+        if np.isnan(p_value) or p_value >= alpha:
+            print("Challenger #iter {0} ({1:.3f} s over {2} runs) is not significantly faster than the incumbent "
+                  "#iter {3} ({4:.3f} s over {5} runs), p = {6:.2g}".format(challenger['iter_id'], challenger['mean'],
+                  challenger['n'], incumbent, current['mean'], current['n'], p_value))
+            return incumbent
+        incumbent = challenger['iter_id']
+    print("PROMOTED #iter {0}{1}".format(incumbent, '' if p_value is None else ' (p = {:.2g})'.format(p_value)))
+    with timed('history'):
+        conn.execute('INSERT OR REPLACE INTO promotions VALUES (?, ?, ?)', (int(night), int(incumbent), p_value))
+    return incumbent
+
+def pick_repeat(stats, incumbent, k=3, min_repeats=3):
+    '''
+    #iter id of the configuration to re-measure: among the incumbent and the k configurations
+    with the smallest lower bound, the one with the fewest runs below min_repeats. None if all have enough.
+    '''
+    candidates = stats.sort_values(by='lower').head(k)
+    candidates = pd.concat([candidates, stats[stats['iter_id'] == incumbent]]).drop_duplicates(subset='iter_id')
+    candidates = candidates[candidates['n'] < min_repeats]
+    if not len(candidates):
+        return None
+    return candidates.sort_values(by=['n', 'lower']).iloc[0]['iter_id']
+
+def feasibility_rows(conn, architecture):
+    '''
+    Parameters ({'N::parameter':value}) and failure of the measured history rows of an
+    architecture (rows without a build fingerprint included).
+    '''
+    with timed('history'):
+        rows = conn.execute('SELECT params, passed, build FROM history WHERE passed IS NOT NULL').fetchall()
+    rows = [(json.loads(params), not passed) for params, passed, build in rows
+            if get_architecture(None if build is None else json.loads(build)) in (architecture, 'unknown')]
+    return [params for params, _ in rows], np.array([failed for _, failed in rows], dtype=bool)
+
+def screen_config(config, model, properties_file, max_fail, n_draws=20):
+    '''
+    Keep a configuration (CATE_1, p1, CATE_4, p4; None for a random draw) unless the
+    classifier predicts it to fail with a probability above max_fail: random draws
+    replace it, up to n_draws, and the one least likely to fail is kept.
+    '''
+    if model is None:
+        return config
+    candidates = [config if config is not None else draw_config(properties_file)]
+    for draw in range(n_draws + 1):
+        p_fail = fail_probability(model, [config_row(freeze_config(candidates[-1], properties_file))])[0]
+        candidates[-1] = (p_fail, draw, candidates[-1])
+        if p_fail <= max_fail or draw == n_draws:
+            break
+        candidates.append(draw_config(properties_file))
+    p_fail, draw, config = min(candidates)
+    if draw > 0:
+        print("Predicted to fail (p = {0:.2f}), redrawn {1} times: p = {2:.2f}".format(candidates[0][0], len(candidates) - 1, p_fail))
+    return config
+
 def sort_pd_col(df):
     col_list = list(df.columns)
     ordering_rule = ['iter_id', 
@@ -188,7 +903,9 @@ def sort_pd_col(df):
                      '4::chebyshev: eigenvalue max iterations',
                      'time_NOX',
                      'time_AlbanyTotal',
-                     'passed'
+                     'passed',
+                     'kind',
+                     'build'
                     ]
     ordered_col_list = [name for name in ordering_rule if name in col_list]
     df = df[ordered_col_list]
@@ -199,11 +916,18 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("properties_file", type=str, help="parameter space definition (.json)")
     parser.add_argument("ctest_output_file", type=str, help="ctest output filename (.json)")
+    parser.add_argument("--export-csv", action='store_true',
+                        help="also write the history as [case]_hist.csv and [case]_hist_sorted.csv")
+    parser.add_argument("--top", type=int, default=5, help="number of best configurations to print (default: 5)")
+    parser.add_argument("--rescore", action='store_true',
+                        help="recompute time_NOX of the history under the \"objective\" of the properties file, "
+                             "from the recorded timers, and exit")
     args = parser.parse_args()
     
     yaml_filename = str()
     ctest_filename = args.ctest_output_file
     case_name = str()
+    cache_filename = None
 
     properties_json = args.properties_file
     try:
@@ -211,12 +935,35 @@ def main():
             dic_prop = json.load(prop)
             yaml_filename = dic_prop['input']
             case_name = dic_prop['case']
+            cache_filename = dic_prop.get('cache')
+            objectives = dic_prop.get('objectives', ['time_NOX'])
+            trade_off = dic_prop.get('trade_off', 'knee')
+            n_candidates = dic_prop.get('candidates', 20)
+            algorithm = dic_prop.get('algorithm', 'random_search')
+            incumbent_every = dic_prop.get('incumbent_every', 0)
+            revalidate_top = dic_prop.get('revalidate_top', 0)
+            revalidate_every = dic_prop.get('revalidate_every', 2)
+            min_repeats = dic_prop.get('min_repeats', 3)
+            promotion_alpha = dic_prop.get('promotion_alpha', 0.05)
+            warm_start = dic_prop.get('warm_start', list())
+            warm_weight = dic_prop.get('warm_similarity', 0.5)
+            regression_alpha = dic_prop.get('regression_alpha', 0.05)
+            max_fail = dic_prop.get('feasibility')
+            objective = compile_objective(dic_prop.get('objective', 'nox'))
+            for name in objectives:
+                if name not in HISTORY_OBJECTIVES:
+                    compile_objective(name) # raises on an unsupported expression
 
     except IOError:
         print("File not accessible")
 
     csv_hist = case_name + str("_hist.csv")
     csv_hist_sorted = case_name + str("_hist_sorted.csv")
+    db_hist = case_name + str("_hist.sqlite")
+    csv_ledger = case_name + str("_ledger.csv")
+    csv_pareto = case_name + str("_pareto.csv")
+    csv_regressions = case_name + str("_regressions.csv")
+    json_infeasible = case_name + str("_infeasible.json")
     yaml_best = yaml_filename.split('.')[0] + '_' + 'Best' + '.' + yaml_filename.split('.')[1]
 
     if not yaml_filename.endswith('.yaml'):
@@ -228,70 +975,144 @@ def main():
     if not properties_json.endswith('.json'):
         parser.print_help()
         sys.exit(2)
+    if algorithm not in ['random_search', 'tpe']:
+        raise ValueError('"algorithm" should be random_search or tpe')
 
-    ite_count = -1
+    conn = open_history(db_hist, csv_hist)
+    if args.rescore:
+        with conn:
+            rescored, kept = rescore_history(conn, objective)
+        print("RESCORED {0} rows under {1} ({2} rows have no recorded timers and keep their time)".format(
+              rescored, objective['expression'], kept))
+        print(top_history(conn, args.top))
+        if args.export_csv:
+            export_history(conn, csv_hist, csv_hist_sorted)
+        conn.close()
+        return
+    ite_count = last_history(conn)
+    priors = read_warm_start(warm_start, case_name, warm_weight)
 
-    # Check to see if a history file exists
-    # If not, open and write to a new file with input params by calling random search
-    if not os.path.isfile(csv_hist):
+    # Check to see if the history has a row
+    # If not, write the first row with input params by calling random search
+    if ite_count < 0:
         # run random search, update yaml file
         ite_count = 0
-        merged = random_search(yaml_filename, ite_count, properties_json)
+        config = warm_seed(priors, history_frame(conn), properties_json) if priors else None
+        merged = random_search(yaml_filename, ite_count, properties_json, config)
         #print(merged)
-        df = pd.DataFrame.from_records([merged])
-        df = sort_pd_col(df)
-        df.to_csv(csv_hist, index=False)
+        with conn:
+            insert_history(conn, merged)
         # let the new yaml file be the best
         yaml_ite = yaml_filename.split('.')[0] + '_' + str(ite_count) + '.' + yaml_filename.split('.')[1]
-        run_bash('cp ' + yaml_filename + ' ' + yaml_ite)
         run_bash('cp ' + yaml_ite + ' ' + yaml_best)
-        print(df)
+        print(sort_pd_col(pd.DataFrame.from_records([merged])))
+        if args.export_csv:
+            export_history(conn, csv_hist, csv_hist_sorted)
+        report_ledger(csv_ledger, ite_count)
     # If exists, open ctest json file and read timer
     else:
-        hist_df = pd.read_csv(csv_hist)
         case = check_json(ctest_filename, case_name)
         with open(ctest_filename) as f_ctest:
-            dict_ctest = json.load(f_ctest)
-            casename_check = case_name in dict_ctest
-            if casename_check == False: raise ValueError("The casename is not found in the ctest output file")
+            with timed('json'):
+                dict_ctest = json.load(f_ctest)
+        casename_check = case_name in dict_ctest
+        if casename_check == False: raise ValueError("The casename is not found in the ctest output file")
+        build = build_fingerprint(dict_ctest[case_name])
+        build_key = build['key']
+        # every change of this night is committed at once
+        with conn:
             if dict_ctest.get(case_name, {}).get('passed') is True: 
-                try:
-                    time_linearsolve = dict_ctest.get(case_name, {}).get('timers', {}).get('NOX Total Linear Solve:')
-                    time_precondition = dict_ctest.get(case_name, {}).get('timers', {}).get('NOX Total Preconditioner Construction:')
-                    time = float(time_linearsolve) + float(time_precondition)
-                    totaltime = dict_ctest.get(case_name, {}).get('timers', {}).get('Albany Total Time:')
-                    # append timer entry to csv
-                    hist_df.loc[hist_df.index[-1], 'time_NOX']= time
-                    hist_df.loc[hist_df.index[-1], 'time_AlbanyTotal']= totaltime
-                    hist_df.loc[hist_df.index[-1], 'passed'] = True
-                    #print(hist_df)
-                except TypeError:
-                    print("Make sure NOX and Albany timers are accessible for case {0} under {1}".format(case_name, ctest_filename))
+                time = float(objective_values(objective, [dict_ctest[case_name]])[0])
+                totaltime = dict_ctest.get(case_name, {}).get('timers', {}).get('Albany Total Time:')
+                if np.isfinite(time):
+                    # record timer entry of the last row
+                    update_history(conn, ite_count, time, totaltime, True, build, run_timers(dict_ctest[case_name]))
+                else:
+                    print("Make sure the timers of {0} are accessible for case {1} under {2}".format(
+                          objective['expression'], case_name, ctest_filename))
                     
             else: # NOT PASS
-                hist_df.loc[hist_df.index[-1], 'time_NOX']= float('inf')
-                hist_df.loc[hist_df.index[-1], 'time_AlbanyTotal']= float('inf')
-                hist_df.loc[hist_df.index[-1], 'passed'] = False
-            # extract #iteration count
-            ite_count = hist_df.iloc[-1]['iter_id']
-
-            # from the hist file, find the best param combo, from properties update best yaml
-            min_index = hist_df['time_NOX'].idxmin()
-            min_iteid = hist_df.iloc[min_index]['iter_id']
-            yaml_ite = yaml_filename.split('.')[0] + '_' + str(min_iteid) + '.' + yaml_filename.split('.')[1]
-            run_bash('cp ' + yaml_ite + ' ' + yaml_best)
-
-        # run random search, update yaml file for the next round
-        ite_count = ite_count + 1
-        merged = random_search(yaml_filename, ite_count, properties_json)
-        hist_df = hist_df.append(merged, ignore_index=True)
-        hist_df = sort_pd_col(hist_df)
-        print(hist_df)
-        hist_df.to_csv(csv_hist, index=False)
-        sorted_hist_df = hist_df.sort_values(by=['time_NOX'], ascending=True)
-        sorted_hist_df.to_csv(csv_hist_sorted, index=False)
-        yaml_ite = yaml_filename.split('.')[0] + '_' + str(ite_count) + '.' + yaml_filename.split('.')[1]
-        run_bash('cp ' + yaml_filename + ' ' + yaml_ite)  
+                update_history(conn, ite_count, float('inf'), float('inf'), False, build, run_timers(dict_ctest[case_name]))
+
+            # record the measured configuration in the trial cache
+            if cache_filename:
+                cache = load_cache(cache_filename)
+                yaml_ite = yaml_filename.split('.')[0] + '_' + str(ite_count) + '.' + yaml_filename.split('.')[1]
+                trial_key = get_trial_key(read_yaml(yaml_ite), case_name)
+                cache.setdefault(build_key, dict()).setdefault(trial_key, list()).append(dict_ctest[case_name])
+                save_cache(cache, cache_filename)
+
+            # from the history index, find the best param combo, from properties update best yaml
+            best_df = top_history(conn, 1)
+            min_iteid = best_df.iloc[0]['iter_id'] if len(best_df) else None
+            hist_df = history_frame(conn) if len(objectives) > 1 or algorithm == 'tpe' else None
+            if len(objectives) > 1:
+                hist_df = objective_columns(conn, hist_df, objectives)
+            if len(objectives) > 1: # the configuration of the Pareto front picked by the trade-off rule
+                promoted = write_pareto(hist_df, objectives, trade_off, csv_pareto)
+                min_iteid = promoted if promoted is not None else min_iteid
+            elif revalidate_top: # the configuration promoted by repeated measurements
+                stats = config_stats(conn)
+                min_iteid = promote(conn, stats, ite_count, promotion_alpha, min_repeats)
+            if min_iteid is not None:
+                yaml_ite = yaml_filename.split('.')[0] + '_' + str(min_iteid) + '.' + yaml_filename.split('.')[1]
+                run_bash('cp ' + yaml_ite + ' ' + yaml_best)
+                report_regression(conn, min_iteid, csv_regressions, regression_alpha)
+                check_stale(top_history(conn, args.top), build_key)
+
+            ite_count = ite_count + 1
+            repeat = None
+            if incumbent_every and min_iteid is not None and ite_count % incumbent_every == 0:
+                # on schedule, the next nightly run re-measures the incumbent on the new build
+                repeat = (min_iteid, 'incumbent')
+            elif revalidate_top and len(objectives) == 1 and ite_count % revalidate_every == 0:
+                # or one of the top-k configurations, until each has enough runs for promotion
+                source = pick_repeat(stats, min_iteid, revalidate_top, min_repeats)
+                repeat = None if source is None else (source, 'repeat')
+            if repeat is not None:
+                yaml_source = yaml_filename.split('.')[0] + '_' + str(repeat[0]) + '.' + yaml_filename.split('.')[1]
+                yaml_ite = yaml_filename.split('.')[0] + '_' + str(ite_count) + '.' + yaml_filename.split('.')[1]
+                run_bash('cp ' + yaml_source + ' ' + yaml_filename)
+                run_bash('cp ' + yaml_source + ' ' + yaml_ite)
+                INPUTS.pop(yaml_filename, None)
+                insert_repeat(conn, ite_count, repeat[0], repeat[1])
+                print("Next run re-measures #iter {0} ({1})".format(repeat[0], repeat[1]))
+            else:
+                # run random search, update yaml file for the next round
+                config = None
+                if len(objectives) > 1:
+                    config = propose_config(hist_df, properties_json, objectives, n_candidates)
+                elif algorithm == 'tpe':
+                    config = tpe_propose(hist_df, properties_json, n_candidates, priors=priors)
+                if config is None and priors:
+                    config = warm_seed(priors, history_frame(conn), properties_json)
+                # configurations the failure-region classifier predicts to fail are redrawn
+                feasibility = None
+                if max_fail is not None:
+                    feasibility = fit_feasibility(*feasibility_rows(conn, get_architecture(build)))
+                    if feasibility is not None:
+                        report_infeasible(feasibility, case_name, get_architecture(build), json_infeasible)
+                config = screen_config(config, feasibility, properties_json, max_fail)
+                merged = random_search(yaml_filename, ite_count, properties_json, config)
+                # a configuration already measured on this build is redrawn, so the next nightly
+                # run measures something new. Its cached run is not copied into the history: a
+                # copy would count as another repeat in config_stats, promote and the TPE history
+                for draw in range(10 if cache_filename else 0):
+                    if not cache.get(build_key, dict()).get(get_trial_key(read_input(yaml_filename), case_name)):
+                        break
+                    print("Configuration already measured on this build (trial cache), drawing another one")
+                    merged = random_search(yaml_filename, ite_count, properties_json,
+                                           screen_config(None, feasibility, properties_json, max_fail))
+                insert_history(conn, merged)
+        print("BEST SO FAR (top {}):".format(args.top))
+        print(top_history(conn, args.top))
+        if revalidate_top:
+            print("CONFIDENCE-ADJUSTED RANKING (top {}):".format(args.top))
+            print(config_stats(conn).drop(columns='params').head(args.top).to_string(index=False))
+        if args.export_csv:
+            export_history(conn, csv_hist, csv_hist_sorted)
+        report_ledger(csv_ledger, ite_count, dict_ctest[case_name])
+    conn.close()
         
 if __name__ == "__main__":
     main()
@@ -0,0 +1,214 @@
+# Trial executor shared by autotune_grid.py and autotune_random.py: input yaml read/write,
+# the in-place run of a trial and, with --jobs/--slots, the worker pool running each trial
+# in its own sandbox directory. Keep this file next to the two scripts.
+
+# From Albany/tools - yaml read/write
+
+# Need: pip install --user ruamel.yaml
+
+# Import libraries
+import os
+import queue
+import re
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from ruamel.yaml import YAML
+
+yaml = YAML(typ='rt')  # Round trip loading and dumping
+yaml.preserve_quotes = True
+yaml.width = 1000
+
+def read_yaml(filename):
+    '''
+    Parse the input yaml file and generate a dictionary object.
+    Parameters: 
+        filename(string): input yaml filename
+    Returns:
+        dictionary(dictionary): dictionary from yaml
+    '''
+    with open(filename) as file:
+        dictionary = yaml.load(file)
+    return dictionary
+
+def write_yaml(dictionary, filename):
+    '''
+    Accept a dictionary and produce a YAML document.
+    Parameters:
+        dictionary(dictionary): object to be dumped
+        filename(string): output yaml filename
+    '''
+    with open(filename, 'w') as file:
+        yaml.dump(dictionary, file)
+        file.write('...\n')
+
+###############################################################################
+def run_bash(command, cwd=None, env=None):
+    '''
+    Run a bash command.
+    Parameters:
+        command(string): the command line to run
+        cwd(string): directory to run the command in (default: current directory)
+        env(dictionary): environment for the command (default: inherited)
+    '''
+    return subprocess.run(command, shell=True, executable='/bin/bash', cwd=cwd, env=env)
+
+def populate_mesh():
+    '''
+    Run the mesh population stage if the populated mesh is missing.
+    '''
+    # Check if mesh-pop exists
+    if os.path.isdir('mesh-pop-wdg'):
+      print('Populated mesh already exists!')
+    else:
+      run_bash('ctest -L "pop"')
+
+def run_sim(iter, inFile):
+    '''
+    Run yaml input file.
+    Parameters:
+        iter(integer): represents iteration
+        inFile(file): the input yaml file
+    '''
+    populate_mesh()
+
+    # Run simulation
+    run_bash('ctest -L "tune-gpu" --timeout 90')
+
+    # Generate input file
+    newInFile = inFile.split('.')[0] + '_' + str(iter) + '.' + inFile.split('.')[1]
+    run_bash('cp ' + inFile + ' ' + newInFile)
+
+    # Generate output file
+    run_bash('cp Testing/Temporary/LastTest.log LastTest_'+str(iter)+'-0.log')
+
+###############################################################################
+def make_executor(jobs=1, slots=None):
+    '''
+    Build the trial executor shared by the search functions.
+    With a single unpinned worker every trial runs in place through run_sim;
+    otherwise each trial gets its own sandbox directory and runs on a worker pool.
+    Parameters:
+        jobs(integer): number of trials to run at once
+        slots(list): slot descriptors, one per worker, i.e. ['0-3', '4-7'] (core sets
+                     passed to taskset) or ['gpu:0', 'gpu:1'] (CUDA devices);
+                     overrides jobs when given
+    Returns:
+        executor(dictionary): {'pool':worker pool or None, 'slots':queue of free slots,
+                               'futures':list of submitted trials}
+    '''
+    slot_list = list(slots) if slots else [None] * max(jobs, 1)
+    executor = {'pool': None, 'slots': None, 'futures': list()}
+    if len(slot_list) > 1 or slots:
+        executor['pool'] = ThreadPoolExecutor(max_workers=len(slot_list))
+        executor['slots'] = queue.Queue()
+        for slot in slot_list:
+            executor['slots'].put(slot)
+    return executor
+
+def slot_command(command, slot):
+    '''
+    Pin a command to a worker slot.
+    Parameters:
+        command(string): the command line to run
+        slot(string): slot descriptor, a core set ('0-3') or a device ('gpu:0'), or None
+    Returns:
+        command(string): the command line, prefixed with taskset for core sets
+        env(dictionary): environment with CUDA_VISIBLE_DEVICES for devices, else None
+    '''
+    if slot is None:
+        return command, None
+    if slot.startswith('gpu:'):
+        return command, dict(os.environ, CUDA_VISIBLE_DEVICES=slot[len('gpu:'):])
+    return 'taskset -c ' + slot + ' ' + command, None
+
+def make_sandbox(iter, inFile):
+    '''
+    Create an isolated working directory for one trial: the entries of the build
+    directory are symlinked except the input yaml, the ctest output folder, the
+    outputs of the tuner (named after the input, ctest jsons), ctest.out and
+    CTestTestfile.cmake, which is copied with its paths pointing to the sandbox.
+    Parameters:
+        iter(integer): represents iteration
+        inFile(file): the input yaml file
+    Returns:
+        sandbox(string): the sandbox directory, trial_[#iter_id]
+    '''
+    cwd = os.getcwd()
+    sandbox = 'trial_' + str(iter)
+    if os.path.isdir(sandbox):
+        shutil.rmtree(sandbox)
+    os.mkdir(sandbox)
+    # ctest.out of a serial run would be shared by every sandbox through its link
+    skip = [inFile, 'Testing', 'CTestTestfile.cmake', 'ctest.out']
+    # the outputs of the tuner grow with the campaign, linking them would make each sandbox
+    # slower: copies and results of the input ([input]_*.yaml/csv/json/jsonl, [input].csv),
+    # ctest-*.json, the nightly history and the other trials. Other files are inputs of Albany.
+    outputs = re.compile(r'({0}(_.+)?\.(yaml|csv|json|jsonl)|ctest-.+\.json|.+_hist(_sorted)?\.(csv|sqlite)|'
+                         r'(trial|LastTest|json)_.+)$'.format(re.escape(inFile.split('.')[0])))
+    for entry in os.listdir(cwd):
+        if entry in skip or outputs.match(entry):
+            continue
+        os.symlink(os.path.join(cwd, entry), os.path.join(sandbox, entry))
+    with open('CTestTestfile.cmake') as f:
+        cmake = f.read()
+    with open(os.path.join(sandbox, 'CTestTestfile.cmake'), 'w') as f:
+        f.write(cmake.replace(cwd, os.path.join(cwd, sandbox)))
+    return sandbox
+
+def run_sim_sandbox(iter, inFile, sandbox, slots):
+    '''
+    Run yaml input file inside its sandbox on the first free worker slot, then copy
+    the input and the ctest log back under the same names run_sim produces and
+    remove the sandbox.
+    Parameters:
+        iter(integer): represents iteration
+        inFile(file): the input yaml file
+        sandbox(string): the trial's sandbox directory
+        slots(queue): free worker slots
+    '''
+    slot = slots.get()
+    try:
+        command, env = slot_command('ctest -L "tune-gpu" --timeout 90 > ctest.out 2>&1', slot)
+        run_bash(command, cwd=sandbox, env=env)
+    finally:
+        slots.put(slot)
+    print('[CASE {0}] finished in {1} (slot: {2})'.format(iter, sandbox, slot))
+
+    newInFile = inFile.split('.')[0] + '_' + str(iter) + '.' + inFile.split('.')[1]
+    shutil.copy(os.path.join(sandbox, inFile), newInFile)
+    lastTest = os.path.join(sandbox, 'Testing', 'Temporary', 'LastTest.log')
+    if os.path.isfile(lastTest):
+        shutil.copy(lastTest, 'LastTest_'+str(iter)+'-0.log')
+    shutil.rmtree(sandbox, ignore_errors=True)
+
+def submit_sim(executor, iter, inputDict, inFile):
+    '''
+    Write the trial's input file and run it, in place or on the worker pool.
+    Parameters:
+        executor(dictionary): trial executor from make_executor, or None to run in place
+        iter(integer): represents iteration
+        inputDict(dictionary): the patched input yaml dictionary
+        inFile(file): the input yaml file
+    '''
+    if executor is None or executor['pool'] is None:
+        write_yaml(inputDict, inFile)
+        run_sim(iter, inFile)
+        return
+    # populate once in the build directory; sandboxes link to it
+    populate_mesh()
+    sandbox = make_sandbox(iter, inFile)
+    write_yaml(inputDict, os.path.join(sandbox, inFile))
+    executor['futures'].append(executor['pool'].submit(run_sim_sandbox, iter, inFile, sandbox, executor['slots']))
+
+def wait_sims(executor):
+    '''
+    Block until every submitted trial has finished.
+    Parameters:
+        executor(dictionary): trial executor from make_executor, or None
+    '''
+    if executor is None:
+        return
+    for future in executor['futures']:
+        future.result()
+    executor['futures'] = list()
@@ -6,6 +6,7 @@
 
 # Need: pip install --user pandas
 # Need: pip install --user ruamel.yaml
+# Need: autotune_executor.py in the same directory
 # Need: pip install --user scikit-learn
 
 # Import libraries
@@ -17,6 +18,7 @@ import numpy as np
 import os
 import pandas as pd
 import random
+import shutil
 import statistics
 import subprocess
 import sys
@@ -24,72 +26,16 @@ from collections import Counter
 from math import exp, log
 from scipy.stats import expon, truncnorm, truncexpon
 from sklearn.model_selection import ParameterGrid, ParameterSampler
-from ruamel.yaml import YAML
-
-yaml = YAML(typ='rt')  # Round trip loading and dumping
-yaml.preserve_quotes = True
-yaml.width = 1000
-
-def read_yaml(filename):
-    '''
-    Parse the input yaml file and generate a dictionary object.
-    Parameters: 
-        filename(string): input yaml filename
-    Returns:
-        dictionary(dictionary): dictionary from yaml
-    '''
-    with open(filename) as file:
-        dictionary = yaml.load(file)
-    return dictionary
-
-def write_yaml(dictionary, filename):
-    '''
-    Accept a dictionary and produce a YAML document.
-    Parameters:
-        dictionary(dictionary): object to be dumped
-        filename(string): output yaml filename
-    '''
-    with open(filename, 'w') as file:
-        yaml.dump(dictionary, file)
-        file.write('...\n')
-
-###############################################################################
-def run_bash(command):
-    '''
-    Run a bash command.
-    '''
-    return subprocess.run(command, shell=True, executable='/bin/bash')
-
-def run_sim(iter, inFile):
-    '''
-    Run yaml input file.
-    Parameters:
-        iter(integer): represents iteration
-        inFile(file): the input yaml file
-    '''
-    # Check if mesh-pop exists
-    if os.path.isdir('mesh-pop-wdg'):
-      print('Populated mesh already exists!')
-    else:
-      run_bash('ctest -L "pop"')
-
-    # Run simulation
-    run_bash('ctest -L "tune-gpu" --timeout 90')
-
-    # Generate input file
-    newInFile = inFile.split('.')[0] + '_' + str(iter) + '.' + inFile.split('.')[1]
-    run_bash('cp ' + inFile + ' ' + newInFile)
-
-    # Generate output file
-    run_bash('cp Testing/Temporary/LastTest.log LastTest_'+str(iter)+'-0.log')
+from autotune_executor import make_executor, read_yaml, run_bash, submit_sim, wait_sims
 
 ###############################################################################
-def grid_search_multi(inFile, simu):
+def grid_search_multi(inFile, simu, executor=None):
     '''
     Run experiment with parameter grid -- Grid Search. 
     Parameters:
         inFile(file): the input yaml file
         simu(integer): a nonneg integer that represents the current round of simulation
+        executor(dictionary): trial executor from make_executor (default: run in place)
     Returns:
         iter_param_dict(dictionary): {#iter:{parameter_to_change:new_value}} where
                                      #iter is the unique iter id for each experiment
@@ -142,24 +88,25 @@ def grid_search_multi(inFile, simu):
             paramList_4.update(dic4)
             print("[mySmoother1] ", dic1)
             print("[mySmoother4] ", dic4) 
-            write_yaml(inputDict, inFile)
-            run_sim(ite, inFile)
+            submit_sim(executor, ite, inputDict, inFile)
             iter_param_dict_1.update({str(ite):p1})
             iter_param_dict_4.update({str(ite):p4})
             ite = ite + 1
     print('\n')
     print('######### TOTAL NUM OF CASES IN EACH SIMULATION: {} #########'.format(ite))
     print('#################### END OF SIMULATION {} ###################'.format(simu))
+    wait_sims(executor)
     # Convert logs to json
     run_bash('python ctest2json.py')
     return iter_param_dict_1, iter_param_dict_4
 
-def grid_search_single(inFile, simu):
+def grid_search_single(inFile, simu, executor=None):
     '''
     Run experiment with parameter grid -- Grid Search. 
     Parameters:
         inFile(file): the input yaml file
         simu(integer): a nonneg integer that represents the current round of simulation
+        executor(dictionary): trial executor from make_executor (default: run in place)
     Returns:
         iter_param_dict(dictionary): {#iter:{parameter_to_change:new_value}} where
                                      #iter is the unique iter id for each experiment
@@ -196,14 +143,13 @@ def grid_search_single(inFile, simu):
                 paramList[key] = value.item()
                 print('{0}: {1}'.format(key, value.item()))
         iter_param_dict.update({str(ite):params})
-        # Write input file
-        write_yaml(inputDict, inFile)
-        # Run yaml input file
-        run_sim(ite, inFile)
+        # Write input file and run it
+        submit_sim(executor, ite, inputDict, inFile)
         ite = ite + 1
     print('\n')
     print('######### TOTAL NUM OF CASES IN EACH SIMULATION: {} #########'.format(ite))
     print('#################### END OF SIMULATION {} ###################'.format(simu))
+    wait_sims(executor)
     # Convert logs to json
     run_bash('python ctest2json.py')
     return iter_param_dict
@@ -328,7 +274,7 @@ def dict_to_df_single(param_dict, time_dict):
 def remove_files(yaml_filename):
     '''
     Remove previously-generated files: [input_yaml]_[#iter_id].yaml, *.log, ctest-*.json 
-    from the current directory.
+    and trial_[#iter_id] sandboxes from the current directory.
     Parameters:
         yaml_filename(string): the input yaml file name
     '''
@@ -341,6 +287,8 @@ def remove_files(yaml_filename):
             os.remove(filePath)
         except OSError:
             print("Error while deleting file") 
+    for sandbox in glob.glob('trial_*', recursive=False):
+        shutil.rmtree(sandbox, ignore_errors=True)
 
 ###############################################################################
 if __name__ == "__main__":
@@ -354,6 +302,10 @@ if __name__ == "__main__":
                     help="YAML input filename (with .yaml extension)")
     parser.add_argument("grid_search_smoother", type=str,
                     help="Smoother(s): (single/multiple)")
+    parser.add_argument("--jobs", type=int, default=1,
+                    help="Number of trials to run at once, each in its own sandbox (default: 1)")
+    parser.add_argument("--slots", type=str, nargs='+',
+                    help="Worker slots, one per concurrent trial: core sets for taskset (0-3 4-7) or devices (gpu:0 gpu:1)")
     args = parser.parse_args()
     yaml_filename = args.yaml_input_file
     algo = args.grid_search_smoother
@@ -369,6 +321,7 @@ if __name__ == "__main__":
     print("YAML INPUT FILENAME: ", yaml_filename) 
     print("SEARCHING ALGORITHM: grid, ", algo)
     casename = get_casename(yaml_filename)
+    executor = make_executor(args.jobs, args.slots)
     pd_output = pd.DataFrame()
 
     if algo == "multiple":
@@ -379,7 +332,7 @@ if __name__ == "__main__":
             # perform grid search
             print('\n')
             print("####################### SIMULATION {} #######################".format(i))
-            param1, param2 = grid_search_multi(yaml_filename, i)
+            param1, param2 = grid_search_multi(yaml_filename, i, executor)
             # post process: get timers from generated json files
             out_filename = glob.glob('ctest-*.json')
             iter_time_dict = get_time_gridsearch(out_filename, casename, i, iter_time_dict)
@@ -398,7 +351,7 @@ if __name__ == "__main__":
             remove_files(yaml_filename)
             print('\n')
             print("####################### SIMULATION {} #######################".format(i))
-            param = grid_search_single(yaml_filename, i)
+            param = grid_search_single(yaml_filename, i, executor)
             out_filename = glob.glob('ctest-*.json')
             iter_time_dict = get_time_gridsearch(out_filename, casename, i, iter_time_dict)
         iter_time_dict = {k: statistics.median(time_list) for k, time_list in iter_time_dict.items()}
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# Stand-in for sbatch, squeue and scancel to try autotune.py --backend slurm without
+# a cluster: sbatch, squeue and scancel are links to this file, which acts on the
+# name it is called by. Jobs run as local processes, at most FAKE_SLURM_NODES at
+# once (default: 2); the others wait as PENDING until squeue or sbatch starts them.
+#
+# $ PATH=/path/to/Autotuning/fake_slurm:$PATH python autotune.py input.yaml grid-single --backend slurm --jobs 4
+#
+# Job states are kept in FAKE_SLURM_DIR (default: [tmp]/fake_slurm_[user]).
+
+# Import libraries
+import fcntl
+import getpass
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+
+STATE_DIR = os.environ.get('FAKE_SLURM_DIR', os.path.join(tempfile.gettempdir(), 'fake_slurm_' + getpass.getuser()))
+NODES = int(os.environ.get('FAKE_SLURM_NODES', '2'))
+
+@contextmanager
+def locked_jobs():
+    '''
+    The job table {job id:{'script', 'cwd', 'output', 'state', 'pid'}}, locked for
+    the enclosed block and written back after it.
+    '''
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with open(os.path.join(STATE_DIR, 'lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        filename = os.path.join(STATE_DIR, 'jobs.json')
+        jobs = dict()
+        if os.path.isfile(filename):
+            with open(filename) as f:
+                jobs = json.load(f)
+        yield jobs
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(jobs, f, indent=1)
+        os.replace(filename + '.tmp', filename)
+
+def schedule(jobs):
+    '''
+    Drop the jobs that ended and start pending jobs on the free nodes.
+    '''
+    for job_id, job in list(jobs.items()):
+        done = os.path.join(STATE_DIR, job_id + '.done')
+        if job['state'] == 'RUNNING' and os.path.isfile(done):
+            os.remove(done)
+            del jobs[job_id]
+    running = sum(1 for job in jobs.values() if job['state'] == 'RUNNING')
+    for job_id in sorted(jobs, key=int):
+        job = jobs[job_id]
+        if job['state'] != 'PENDING' or running >= NODES:
+            continue
+        with open(job['output'], 'a') as out:
+            # the exit code of the script marks the end of the job
+            process = subprocess.Popen(['bash', '-c', 'bash "$0"; echo $? > "$1"',
+                                        job['script'], os.path.join(STATE_DIR, job_id + '.done')],
+                                       cwd=job['cwd'], stdout=out, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                                       start_new_session=True, env=dict(os.environ, SLURM_JOB_ID=job_id))
+        job.update({'state': 'RUNNING', 'pid': process.pid})
+        running = running + 1
+
+def sbatch(argv):
+    '''
+    sbatch [--parsable] [--output=FILE] [other options, ignored] script
+    '''
+    script = os.path.abspath(argv[-1])
+    output = None
+    with open(script) as f:
+        for line in f:
+            if line.startswith('#SBATCH --output='):
+                output = line.strip()[len('#SBATCH --output='):]
+    for arg in argv[:-1]:
+        if arg.startswith('--output='):
+            output = arg[len('--output='):]
+    with locked_jobs() as jobs:
+        counter = os.path.join(STATE_DIR, 'last_id')
+        job_id = str(int(open(counter).read()) + 1 if os.path.isfile(counter) else 1)
+        with open(counter, 'w') as f:
+            f.write(job_id)
+        jobs[job_id] = {'script': script, 'cwd': os.getcwd(), 'state': 'PENDING', 'pid': None,
+                        'output': os.path.abspath(output or 'slurm-' + job_id + '.out')}
+        schedule(jobs)
+    print(job_id if '--parsable' in argv else 'Submitted batch job ' + job_id)
+
+def squeue(argv):
+    '''
+    squeue [-h] [-j ID[,ID]] [-o %T]: the state of each job still in the queue.
+    '''
+    wanted = argv[argv.index('-j') + 1].split(',') if '-j' in argv else None
+    with locked_jobs() as jobs:
+        schedule(jobs)
+        listed = [(job_id, job['state']) for job_id, job in sorted(jobs.items(), key=lambda item: int(item[0]))
+                  if wanted is None or job_id in wanted]
+    if '-h' not in argv:
+        print('JOBID STATE' if '-o' not in argv else 'STATE')
+    for job_id, state in listed:
+        print(state if '-o' in argv else '{0} {1}'.format(job_id, state))
+
+def scancel(argv):
+    '''
+    scancel ID [ID ...]
+    '''
+    with locked_jobs() as jobs:
+        for job_id in argv:
+            job = jobs.pop(job_id, None)
+            if job is not None and job['state'] == 'RUNNING':
+                try:
+                    os.killpg(job['pid'], signal.SIGTERM)
+                except OSError:
+                    pass # the job ended meanwhile
+        schedule(jobs)
+
+if __name__ == "__main__":
+    command = os.path.basename(sys.argv[0])
+    if command not in ['sbatch', 'squeue', 'scancel']:
+        raise ValueError("Call fake_slurm.py through its links sbatch, squeue or scancel")
+    {'sbatch': sbatch, 'squeue': squeue, 'scancel': scancel}[command](sys.argv[1:])
@@ -0,0 +1,59 @@
+# Smoke tests of the stand-ins: autotune_benchmark.py (its stand-in ctest) runs one
+# short search of autotune.py, locally and through the fake_slurm/ sbatch and squeue.
+#
+# $ python -m pytest -q tests
+
+# Need: pip install --user pytest
+
+# Import libraries
+import os
+import subprocess
+import sys
+import pandas as pd
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+BENCHMARK = os.path.join(REPO, 'autotune_benchmark.py')
+FAKE_SLURM = os.path.join(REPO, 'fake_slurm')
+
+def run_benchmark(directory, strategy, trials=5, env=None):
+    '''
+    Run the benchmark with one strategy and seed 0 in directory.
+    Returns:
+        summary(DataFrame): rows of [output]_summary.csv
+    '''
+    process = subprocess.run([sys.executable, BENCHMARK, '--strategies', strategy, '--trials', str(trials),
+                              '--output', 'smoke'], cwd=str(directory), env=env, stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT, universal_newlines=True, timeout=300)
+    assert process.returncode == 0, process.stdout
+    return pd.read_csv(os.path.join(str(directory), 'smoke_summary.csv'))
+
+def check_summary(summary, strategy, trials=5):
+    '''
+    One row for the strategy, every trial run, and a finite non-negative regret.
+    '''
+    assert list(summary['strategy']) == [strategy]
+    row = summary.iloc[0]
+    assert row['seeds'] == 1
+    assert row['trials'] == trials
+    assert row['final regret'] >= 0 and row['regret at half'] >= 0
+    assert row['wall (s)'] > 0
+
+def test_benchmark_random_multi(tmp_path):
+    summary = run_benchmark(tmp_path, 'random-multi')
+    check_summary(summary, 'random-multi')
+    curves = pd.read_csv(os.path.join(str(tmp_path), 'smoke_curves.csv'))
+    assert list(curves['trial']) == [1, 2, 3, 4, 5]
+    assert (curves['regret'] >= 0).all()
+
+def test_benchmark_slurm_backend(tmp_path):
+    strategy = 'random-multi --backend slurm --jobs 2 --slurm-poll 0.1'
+    state = os.path.join(str(tmp_path), 'fake_slurm')
+    env = dict(os.environ, PATH=FAKE_SLURM + os.pathsep + os.environ.get('PATH', ''), FAKE_SLURM_DIR=state)
+    summary = run_benchmark(tmp_path, strategy, env=env)
+    check_summary(summary, strategy)
+    # every trial went through sbatch, and no job is left in the queue
+    with open(os.path.join(state, 'last_id')) as f:
+        assert int(f.read()) == 5
+    queue = subprocess.run([os.path.join(FAKE_SLURM, 'squeue'), '-h'], env=env, stdout=subprocess.PIPE,
+                           universal_newlines=True)
+    assert queue.stdout.strip() == ''